@@ -30,9 +30,11 @@ def main():
                                 filename)
     psd_factory = ParamSetDistFactory()
 
+    warm_start = None
     for N in xrange(1, 8, 1):
         print N
-        r = run_optimization(N, filename)
+        # start each N from the best fit so far, like BootstrapScan
+        r = run_optimization(N, filename, warm_start=warm_start)
         this_N, this_score, this_param_set = r
         psd_factory.add_parameter_set(this_param_set)
         psd_factory.add_parameter('id_str', id_str)
@@ -41,6 +43,7 @@ def main():
         psd_factory.add_parameter('num trajs', BOOTSTRAP_SIZE)
         psd = psd_factory.make_psd()
         psd.sort_index('N', is_ascending=True)
+        warm_start = psd
 
         # save results
         param_pkl_stream = os.path.join(
@@ -5,6 +5,8 @@ from palm.parameter_set_distribution import ParamSetDistFactory,\
                                             ParameterSetDistribution
 from palm.blink_parameter_set import SingleDarkParameterSet
 
+SCAN_FILE = "params/bootstrap_scan.pkl"
+
 
 def load_previous_run(prev_run_filename):
     prev_psd = ParameterSetDistribution()
@@ -15,6 +17,16 @@ def get_best_series(prev_psd):
     best_scoring_series = prev_psd.get_best_params_as_series()
     return best_scoring_series
 
+def get_best_series_by_bootstrap_id(scan_psd):
+    # one best scoring series for each bootstrap id of a BootstrapScan
+    best_series_list = []
+    bootstrap_id_array = scan_psd.single_parameter_distribution_as_array(
+                            'bootstrap_id')
+    for bootstrap_id in sorted(set(bootstrap_id_array)):
+        sub_df = scan_psd.select_param_sets('bootstrap_id', bootstrap_id)
+        best_series_list.append(sub_df.ix[sub_df['score'].idxmin()])
+    return best_series_list
+
 def main():
     try:
         bootstrap_size = int(sys.argv[1])
@@ -24,10 +36,17 @@ def main():
               "\tthe value of BOOTSTRAP_SIZE in bootstrap_ml_fit.py\n"
         raise
     psd_factory = ParamSetDistFactory()
+    best_series_list = []
+    # results of run_job.py
+    if os.path.exists(SCAN_FILE):
+        scan_psd = load_previous_run(SCAN_FILE)
+        best_series_list += get_best_series_by_bootstrap_id(scan_psd)
+    # results of individual bootstrap_ml_fit.py runs
     prev_run_files = glob.glob("params/%03d_*_params.pkl" % bootstrap_size)
     for p in prev_run_files:
         prev_psd = load_previous_run(p)
-        best_scoring_series = get_best_series(prev_psd)
+        best_series_list.append(get_best_series(prev_psd))
+    for best_scoring_series in best_series_list:
         N = best_scoring_series['N']
         log_ka = best_scoring_series['log_ka']
         log_kd = best_scoring_series['log_kd']
@@ -1,3 +1,4 @@
+import os.path
 from palm.blink_factory import SingleDarkBlinkFactory
 from palm.likelihood_judge import CollectionLikelihoodJudge
 from palm.scipy_optimizer import ScipyOptimizer
@@ -9,7 +10,24 @@ from palm.linalg import ScipyMatrixExponential
 from palm.util import randomize_parameter
 
 
-def run_optimization(N, traj_filename):
+# states and routes of each N are saved here, so that every job after
+# the first one loads them instead of enumerating them again
+TOPOLOGY_CACHE_DIR = os.path.abspath('./topology_cache')
+
+
+def run_optimization(N, traj_data, warm_start=None):
+    """
+    Parameters
+    ----------
+    N : int
+        Number of fluorophores.
+    traj_data : BlinkCollectionTargetData or string
+        The trajectories to fit, or the path of a file to load them from.
+    warm_start : ParameterSetDistribution or ParameterSet, optional
+        Earlier fits, for example with a nearby N. When given, the
+        optimization starts from their best log rates instead of
+        the values below.
+    """
     # ============================
     # = Initialize parameter set =
     # ============================
@@ -37,13 +55,17 @@ def run_optimization(N, traj_filename):
     # ========================
     # = Load trajectory data =
     # ========================
-    traj_data = BlinkCollectionTargetData()
-    traj_data.load_data(traj_filename)
+    if isinstance(traj_data, basestring):
+        traj_filename = traj_data
+        traj_data = BlinkCollectionTargetData()
+        traj_data.load_data(traj_filename)
 
     # =======================================================================
     # = Initialize model factory, likelihood predictor and likelihood judge =
     # =======================================================================
-    model_factory = SingleDarkBlinkFactory(fermi_activation=False, MAX_A=10)
+    model_factory = SingleDarkBlinkFactory(
+                        fermi_activation=False, MAX_A=10,
+                        topology_cache_dir=TOPOLOGY_CACHE_DIR)
     likelihood_predictor = ForwardPredictor(ScipyMatrixExponential(),
                                              always_rebuild_rate_matrix=False,
                                              diagonal_dark=True)
@@ -61,6 +83,8 @@ def run_optimization(N, traj_filename):
     optimizer = ScipyOptimizer()
     optimized_params, score = optimizer.optimize_parameters(
                                 score_fcn.compute_score, parameters,
-                                noisy=False)
+                                noisy=False,
+                                score_gradient_fcn=score_fcn.compute_score_and_gradient,
+                                warm_start=warm_start)
 
     return N, score, optimized_params
@@ -1,6 +1,31 @@
-import os
+import os.path
+from palm.bootstrap_scan import BootstrapScan
+from opt_fcn import run_optimization
 
-for i in xrange(1, 2):
-    cmd = "python bootstrap_ml_fit.py %d" % i
-    print cmd
-    os.system(cmd)
+
+DIRECTORY_FILE = os.path.abspath('./traj_paths.txt')
+CHECKPOINT_FILE = os.path.abspath('./params/bootstrap_scan.pkl')
+BOOTSTRAP_SIZE = 20  # number of trajectories per maximum likelihood fit
+NUM_BOOTSTRAPS = 1
+N_LIST = range(1, 8)
+
+def main():
+    '''Fits every (bootstrap id, N) pair on a pool of local worker
+       processes. Results are checkpointed to CHECKPOINT_FILE, so an
+       interrupted job picks up where it left off when it is run again.
+       Each fit starts from the best fit of the nearest N that has
+       already finished for the same bootstrap id.
+    '''
+    scan = BootstrapScan(run_optimization, DIRECTORY_FILE, BOOTSTRAP_SIZE,
+                         N_LIST, CHECKPOINT_FILE, warm_start=True,
+                         noisy=True)
+    num_fits = scan.run(range(1, NUM_BOOTSTRAPS + 1))
+    print "Ran %d fits" % num_fits
+    psd = scan.make_psd()
+    psd.sort_index('bootstrap_id', is_ascending=True)
+    param_html_stream = os.path.join('./params', "bootstrap_scan.html")
+    psd.to_html(param_html_stream)
+    print "Wrote %s" % (param_html_stream)
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
+import copy
+import numpy
+import scipy.sparse
 from .base.model import Model
 from .state_collection import StateIDCollection
-from .rate_fcn import rate_from_rate_id
-from .rate_matrix import make_rate_matrix_from_state_ids
+from .rate_fcn import rate_from_rate_id, rate_gradient_from_rate_id
+from .rate_matrix import make_rate_matrix_from_npy_array,\
+                         make_sparse_rate_matrix_from_state_ids
 
 
 class AggregatedKineticModel(Model):
@@ -32,7 +36,25 @@ class AggregatedKineticModel(Model):
         Lists of state ids, indexed by class name.
     state_class_by_id_dict : dict
         Aggregated class of each state, indexed by state id.
+    state_index_dict : dict
+        Position of each state within the rate matrix,
+        indexed by state id.
+    state_inds_by_class_dict : dict
+        Integer positions of the states of each class within the
+        rate matrix, indexed by class name. The positions follow the
+        order of the ids in `state_ids_by_class_dict`.
+    class_permutation : ndarray
+        Rate matrix positions of the states, grouped by class. Within
+        each class, the states follow `state_inds_by_class_dict`.
+    class_position_array : ndarray
+        Position of each state within `class_permutation`.
+    class_slice_dict : dict
+        The slice of `class_permutation` that holds the states of
+        each class, indexed by class name.
     route_collection : RouteCollection
+    compiled_routes : CompiledRouteCollection
+        The routes as integer arrays of rate matrix positions
+        and rate id codes, used to assemble rate matrices.
     """
     def __init__(self, state_enumerator, route_mapper, parameter_set,
                  fermi_activation=False):
@@ -55,36 +77,165 @@ class AggregatedKineticModel(Model):
             for this_id in id_list:
                 self.state_class_by_id_dict[this_id] = obs_class
 
+        # resolve state ids to rate matrix positions once per model,
+        # so that likelihood calculations can work on plain arrays
+        self.state_index_dict = {}
+        for i, this_id in enumerate(self.state_id_collection):
+            self.state_index_dict[this_id] = i
+        self.state_inds_by_class_dict = {}
+        for obs_class, id_collection in self.state_ids_by_class_dict.iteritems():
+            class_inds = [self.state_index_dict[this_id]\
+                          for this_id in id_collection]
+            self.state_inds_by_class_dict[obs_class] = numpy.array(
+                                                        class_inds, dtype=int)
+        # a permutation that groups the states by class, so that the
+        # rates between two classes are a contiguous block of the
+        # permuted rate matrix
+        self.class_slice_dict = {}
+        class_inds_list = []
+        num_grouped_states = 0
+        for obs_class in sorted(self.state_inds_by_class_dict.keys()):
+            class_inds = self.state_inds_by_class_dict[obs_class]
+            self.class_slice_dict[obs_class] = slice(
+                num_grouped_states, num_grouped_states + len(class_inds))
+            class_inds_list.append(class_inds)
+            num_grouped_states += len(class_inds)
+        self.class_permutation = numpy.concatenate(class_inds_list)
+        self.class_position_array = numpy.argsort(self.class_permutation)
+
         self.route_collection = self.route_mapper(self.state_collection)
+        self.compiled_routes = self.route_collection.compile_routes(
+                                    self.state_index_dict)
 
     def get_parameter(self, parameter_name):
         return self.parameter_set.get_parameter(parameter_name)
 
+    def bind_parameter_set(self, parameter_set):
+        """
+        Creates a model with the same states and routes as this one,
+        but different parameter values. The state and route structures
+        are shared with this model rather than rebuilt, so neither
+        model should modify them.
+
+        Parameters
+        ----------
+        parameter_set : ParameterSet
+
+        Returns
+        -------
+        new_model : AggregatedKineticModel
+        """
+        new_model = copy.copy(self)
+        new_model.parameter_set = parameter_set
+        return new_model
+
     def get_num_states(self, class_name=None):
         if class_name:
             return len(self.state_ids_by_class_dict[class_name])
         else:
             return len(self.state_id_collection)
 
+    def get_state_indices(self, class_name):
+        """
+        Returns
+        -------
+        class_inds : ndarray
+            Positions of the states of `class_name` within the rate matrix.
+        """
+        return self.state_inds_by_class_dict[class_name]
+
+    def get_class_slice(self, class_name):
+        """
+        Returns
+        -------
+        class_slice : slice
+            Positions of the states of `class_name` within a rate
+            matrix that is grouped by class.
+        """
+        return self.class_slice_dict[class_name]
+
+    def group_rate_array(self, rate_array):
+        """
+        Reorders the rows and columns of a rate matrix so that the
+        states of each class are contiguous. Blocks of the result,
+        selected with `get_class_slice`, are the rates between two
+        classes.
+
+        Parameters
+        ----------
+        rate_array : ndarray or sparse matrix
+            A rate matrix in the state order of the model.
+
+        Returns
+        -------
+        grouped_rate_array : ndarray or csr_matrix
+        """
+        permutation = self.class_permutation
+        if scipy.sparse.issparse(rate_array):
+            return rate_array.tocsr()[permutation,:][:,permutation]
+        return rate_array[numpy.ix_(permutation, permutation)]
+
+    def get_topology_key(self):
+        """
+        Summarizes the state space of the model, but not its parameter
+        values. Models with equal keys differ at most in their rates.
+
+        Returns
+        -------
+        topology_key : tuple
+        """
+        class_sizes = [(obs_class, len(class_inds)) for obs_class, class_inds\
+                       in self.state_inds_by_class_dict.iteritems()]
+        class_sizes.sort()
+        return (self.__class__.__name__,
+                self.parameter_set.__class__.__name__, self.fermi_activation,
+                tuple(class_sizes))
+
+    def get_fingerprint(self):
+        """
+        Summarizes the parameter values and the state space of the model.
+        Models with equal fingerprints build identical rate matrices.
+
+        Returns
+        -------
+        fingerprint : tuple
+        """
+        return (self.get_topology_key(), tuple(self.parameter_set.as_array()))
+
     def get_num_routes(self):
         return len(self.route_collection)
 
-    def build_rate_matrix(self, time=0.):
+    def build_rate_matrix(self, time=0., sparse=False):
         """
+        Parameters
+        ----------
+        time : float, optional
+            Cumulative time since start of trajectory,
+            needed to compute time-dependent rates.
+        sparse : bool, optional
+            Whether to build a SparseRateMatrix instead of a dense
+            RateMatrix. The sparse matrix never allocates storage for
+            the zero entries, so it scales to much larger models.
+
         Returns
         -------
-        rate_matrix : RateMatrix
+        rate_matrix : RateMatrix or SparseRateMatrix
         """
-        rate_matrix = self._build_rate_matrix_from_routes(
-                            self.state_id_collection, self.route_collection,
-                            time)
+        if sparse:
+            rate_matrix = self._build_sparse_rate_matrix_from_routes(
+                                self.state_id_collection,
+                                self.compiled_routes, time)
+        else:
+            rate_matrix = self._build_rate_matrix_from_routes(
+                                self.state_id_collection,
+                                self.compiled_routes, time)
         return rate_matrix
 
     def get_submatrix(self, rate_matrix, start_class, end_class):
         """
         Returns
         -------
-        submatrix : RateMatrix
+        submatrix : RateMatrix or SparseRateMatrix
         """
         start_id_collection = self.state_ids_by_class_dict[start_class]
         end_id_collection = self.state_ids_by_class_dict[end_class]
@@ -92,12 +243,67 @@ class AggregatedKineticModel(Model):
                         start_id_collection, end_id_collection)
         return submatrix
 
+    def compute_rate_values(self, rate_id_list, time):
+        """
+        Evaluates each rate id once.
+
+        Parameters
+        ----------
+        rate_id_list : list
+        time : float
+            Cumulative time since start of trajectory,
+            needed to compute time-dependent rates.
+
+        Returns
+        -------
+        rate_values : ndarray
+            Rate constants, ordered like `rate_id_list`.
+        """
+        rate_values = [rate_from_rate_id(rate_id, time, self.parameter_set,
+                                         self.fermi_activation)\
+                       for rate_id in rate_id_list]
+        return numpy.array(rate_values, dtype=numpy.float64)
+
+    def compute_rate_gradient_array(self, rate_id_list, time):
+        """
+        Derivatives of the rate constants with respect to the
+        parameters of the model.
+
+        Parameters
+        ----------
+        rate_id_list : list
+        time : float
+            Cumulative time since start of trajectory,
+            needed to compute time-dependent rates.
+
+        Returns
+        -------
+        rate_gradient_array : ndarray
+            Element ``[i,j]`` is the derivative of the rate of
+            ``rate_id_list[i]`` with respect to the `j` th parameter
+            of ``parameter_set.as_array()``.
+        """
+        parameter_names = self.parameter_set.get_parameter_names()
+        parameter_index_dict = {}
+        for j, parameter_name in enumerate(parameter_names):
+            parameter_index_dict[parameter_name] = j
+        rate_gradient_array = numpy.zeros(
+                                (len(rate_id_list), len(parameter_names)))
+        for i, rate_id in enumerate(rate_id_list):
+            rate_gradient_dict = rate_gradient_from_rate_id(
+                                    rate_id, time, self.parameter_set,
+                                    self.fermi_activation)
+            for parameter_name, derivative in rate_gradient_dict.iteritems():
+                j = parameter_index_dict[parameter_name]
+                rate_gradient_array[i,j] = derivative
+        return rate_gradient_array
+
     def _build_rate_matrix_from_routes(self, state_id_collection, routes, time):
         """
         Parameters
         ----------
         state_id_collection : StateIDCollection
-        routes : RouteCollection
+        routes : CompiledRouteCollection
         time : float
             Cumulative time since start of trajectory,
             needed to compute time-dependent rates.
@@ -106,17 +312,41 @@ class AggregatedKineticModel(Model):
         -------
         rate_matrix : RateMatrix
         """
-        rate_matrix = make_rate_matrix_from_state_ids(
-                        index_id_collection=state_id_collection,
+        num_states = len(state_id_collection)
+        rate_values = self.compute_rate_values(routes.rate_id_list, time)
+        route_rates = routes.compute_route_rates(rate_values)
+        # scatter-add the route rates into the flattened matrix
+        flat_inds = routes.start_inds * num_states + routes.end_inds
+        rate_array = numpy.bincount(flat_inds, weights=route_rates,
+                                    minlength=num_states * num_states)
+        rate_array = rate_array.reshape((num_states, num_states))
+        rate_matrix = make_rate_matrix_from_npy_array(
+                        rate_array, index_id_collection=state_id_collection,
                         column_id_collection=state_id_collection)
-        for r_id, r in routes.iter_routes():
-            start_id = r['start_state']
-            end_id = r['end_state']
-            rate_id = r['rate_id']
-            multiplicity = r['multiplicity']
-            this_rate = multiplicity * rate_from_rate_id(
-                                            rate_id, time, self.parameter_set,
-                                            self.fermi_activation)
-            rate_matrix.set_rate(start_id, end_id, this_rate)
+        rate_matrix.balance_transition_rates()
+        return rate_matrix
+
+    def _build_sparse_rate_matrix_from_routes(self, state_id_collection,
+                                              routes, time):
+        """
+        Parameters
+        ----------
+        state_id_collection : StateIDCollection
+        routes : CompiledRouteCollection
+        time : float
+            Cumulative time since start of trajectory,
+            needed to compute time-dependent rates.
+
+        Returns
+        -------
+        rate_matrix : SparseRateMatrix
+        """
+        rate_values = self.compute_rate_values(routes.rate_id_list, time)
+        route_rates = routes.compute_route_rates(rate_values)
+        rate_matrix = make_sparse_rate_matrix_from_state_ids(
+                        index_id_collection=state_id_collection,
+                        column_id_collection=state_id_collection,
+                        row_inds=routes.start_inds, col_inds=routes.end_inds,
+                        rates=route_rates)
         rate_matrix.balance_transition_rates()
         return rate_matrix
@@ -0,0 +1,257 @@
+import numpy
+from .base.data_predictor import DataPredictor
+from .likelihood_prediction import LikelihoodPrediction,\
+                                   CollectionLikelihoodPrediction
+from .forward_calculator import ForwardCalculator
+from .forward_likelihood import ForwardPredictor, RateMatrixOrganizer
+from .linalg import DiagonalExpm
+from .util import ALMOST_ZERO, DATA_TYPE
+
+
+class BatchedForwardPredictor(DataPredictor):
+    """
+    Computes the log likelihoods of many trajectories at once with the
+    Forward algorithm. The forward vectors of all trajectories are
+    stacked into the rows of one array. At each step, the trajectories
+    whose segments have the same start class, end class and dwell time
+    are advanced together, so one matrix-matrix product replaces a
+    vector-matrix product per trajectory, and each matrix exponential
+    is computed only once per step.
+
+    Models whose rates vary with time need a different rate matrix for
+    every segment, so they are evaluated one trajectory at a time.
+
+    Parameters
+    ----------
+    expm_calculator : MatrixExponential
+        An object with a `compute_array_exp` method.
+    diagonal_dark : bool, optional
+        Whether the matrix of dark-to-dark transitions is diagonal.
+    expm_cache : MatrixExponentialCache, optional
+        Cache for matrix exponentials, shared across calls.
+
+    Attributes
+    ----------
+    serial_predictor : ForwardPredictor
+        Evaluates models whose rates vary with time and computes
+        gradients.
+    """
+    def __init__(self, expm_calculator, diagonal_dark=False, expm_cache=None):
+        super(BatchedForwardPredictor, self).__init__()
+        self.diagonal_dark = diagonal_dark
+        self.expm_cache = expm_cache
+        self.forward_calculator = ForwardCalculator(expm_calculator,
+                                                    expm_cache)
+        self.diag_forward_calculator = ForwardCalculator(DiagonalExpm(),
+                                                         expm_cache)
+        self.serial_predictor = ForwardPredictor(
+                                    expm_calculator,
+                                    always_rebuild_rate_matrix=False,
+                                    diagonal_dark=diagonal_dark,
+                                    expm_cache=expm_cache)
+        self.rebuilding_predictor = ForwardPredictor(
+                                        expm_calculator,
+                                        always_rebuild_rate_matrix=True,
+                                        diagonal_dark=diagonal_dark)
+        self.prediction_factory = LikelihoodPrediction
+        self.collection_prediction_factory = CollectionLikelihoodPrediction
+
+    def predict_data(self, model, trajectory):
+        log_likelihood_array = self.compute_log_likelihoods(model,
+                                                            [trajectory])
+        return self.prediction_factory(log_likelihood_array[0])
+
+    def predict_data_and_gradient(self, model, trajectory):
+        return self.serial_predictor.predict_data_and_gradient(
+                    model, trajectory)
+
+    def predict_collection(self, model, trajectory_collection):
+        """
+        Parameters
+        ----------
+        model : BlinkModel
+        trajectory_collection : iterable of Trajectory
+
+        Returns
+        -------
+        prediction : CollectionLikelihoodPrediction
+        """
+        trajectory_list = [trajectory for trajectory in trajectory_collection]
+        log_likelihood_array = self.compute_log_likelihoods(model,
+                                                            trajectory_list)
+        return self.collection_prediction_factory(log_likelihood_array)
+
+    def compute_log_likelihoods(self, model, trajectory_list):
+        """
+        Parameters
+        ----------
+        model : BlinkModel
+        trajectory_list : list of Trajectory
+
+        Returns
+        -------
+        log_likelihood_array : ndarray
+            The log10 likelihood of each trajectory.
+        """
+        if model.fermi_activation:
+            log_likelihood_list = []
+            for trajectory in trajectory_list:
+                prediction = self.rebuilding_predictor.predict_data(
+                                model, trajectory)
+                log_likelihood_list.append(prediction.as_array()[0])
+            return numpy.array(log_likelihood_list)
+
+        class_name_list = model.state_ids_by_class_dict.keys()
+        start_codes, end_codes, durations = self._stack_trajectories(
+                                                trajectory_list,
+                                                class_name_list)
+        rate_matrix_organizer = RateMatrixOrganizer(model)
+        rate_matrix_organizer.build_rate_matrix(time=0.0)
+        if self.expm_cache is not None:
+            model_fingerprint = model.get_fingerprint()
+        else:
+            model_fingerprint = None
+        num_trajectories, max_num_segments = start_codes.shape
+        # the columns of `alpha` are the states grouped by class,
+        # so each class is a contiguous slice
+        class_slice_list = [model.get_class_slice(class_name)
+                            for class_name in class_name_list]
+        alpha = numpy.zeros((num_trajectories, model.get_num_states()),
+                            dtype=DATA_TYPE)
+        log_factor_sums = numpy.zeros(num_trajectories)
+
+        # each row starts in the class of its first segment
+        init_prob_vec = model.get_initial_probability_vector()
+        for class_code, class_name in enumerate(class_name_list):
+            rows = numpy.flatnonzero(start_codes[:,0] == class_code)
+            if len(rows) == 0:
+                continue
+            class_slice = class_slice_list[class_code]
+            init_prob = init_prob_vec.as_aligned_npy_array(
+                            model.state_ids_by_class_dict[class_name])
+            alpha[rows, class_slice] = init_prob
+        self._scale_rows(alpha, log_factor_sums,
+                         numpy.arange(num_trajectories))
+
+        num_classes = len(class_name_list)
+        for segment_number in xrange(max_num_segments):
+            step_start_codes = start_codes[:,segment_number]
+            active_rows = numpy.flatnonzero(step_start_codes >= 0)
+            # the class pair of a segment, with -1 for the last segment
+            pair_codes = step_start_codes[active_rows] * (num_classes + 1) +\
+                         end_codes[active_rows, segment_number] + 1
+            next_alpha = alpha.copy()
+            next_alpha[active_rows] = 0.0
+            step_expQt_dict = {}
+            for pair_code in numpy.unique(pair_codes):
+                rows = active_rows[pair_codes == pair_code]
+                start_code = pair_code // (num_classes + 1)
+                end_code = pair_code % (num_classes + 1) - 1
+                start_class = class_name_list[start_code]
+                start_slice = class_slice_list[start_code]
+                rate_array_aa = rate_matrix_organizer.get_subarray(
+                                    start_class, start_class)
+                group_alpha = alpha[rows, start_slice]
+                group_durations = durations[rows, segment_number]
+                unique_durations, duration_codes = numpy.unique(
+                                                    group_durations,
+                                                    return_inverse=True)
+                for duration_code, dwell_time in enumerate(unique_durations):
+                    expm_key = (start_code, dwell_time)
+                    expQt = step_expQt_dict.get(expm_key)
+                    if expQt is None:
+                        expQt = self._compute_array_exp(
+                                    rate_array_aa, start_class, dwell_time,
+                                    model_fingerprint)
+                        step_expQt_dict[expm_key] = expQt
+                    duration_rows = (duration_codes == duration_code)
+                    group_alpha[duration_rows] = numpy.dot(
+                                                    group_alpha[duration_rows],
+                                                    expQt)
+                if end_code < 0:
+                    next_alpha[rows, start_slice] = group_alpha
+                else:
+                    end_class = class_name_list[end_code]
+                    rate_array_ab = rate_matrix_organizer.get_subarray(
+                                        start_class, end_class)
+                    next_alpha[rows, class_slice_list[end_code]] =\
+                        numpy.dot(group_alpha, rate_array_ab)
+            self._scale_rows(next_alpha, log_factor_sums, active_rows)
+            alpha = next_alpha
+
+        # each row ends in the class of its last segment
+        final_prob_vec = model.get_final_probability_vector()
+        num_segments = numpy.sum(start_codes >= 0, axis=1)
+        last_codes = start_codes[numpy.arange(num_trajectories),
+                                 num_segments - 1]
+        total_alpha = numpy.zeros((num_trajectories, 1))
+        for class_code, class_name in enumerate(class_name_list):
+            rows = numpy.flatnonzero(last_codes == class_code)
+            if len(rows) == 0:
+                continue
+            final_prob = final_prob_vec.as_aligned_npy_array(
+                            model.state_ids_by_class_dict[class_name])
+            total_alpha[rows,0] = numpy.dot(
+                alpha[rows, class_slice_list[class_code]],
+                final_prob)
+        self._scale_rows(total_alpha, log_factor_sums,
+                         numpy.arange(num_trajectories))
+        return -log_factor_sums
+
+    def _stack_trajectories(self, trajectory_list, class_name_list):
+        """
+        Returns
+        -------
+        start_codes, end_codes : ndarray
+            Position in `class_name_list` of the class of each segment
+            and of the segment that follows it, one row per trajectory.
+            End codes of last segments are -1 and both codes are -1
+            past the end of shorter trajectories.
+        durations : ndarray
+        """
+        class_code_dict = dict([(class_name, i) for i, class_name
+                                in enumerate(class_name_list)])
+        max_num_segments = max([len(t) for t in trajectory_list])
+        array_shape = (len(trajectory_list), max_num_segments)
+        start_codes = -numpy.ones(array_shape, dtype=int)
+        durations = numpy.zeros(array_shape)
+        for i, trajectory in enumerate(trajectory_list):
+            # translate the codes of the trajectory to positions
+            # in `class_name_list`
+            code_map = numpy.array([class_code_dict[class_name] for class_name
+                                    in trajectory.get_class_name_list()],
+                                   dtype=int)
+            num_segments = len(trajectory)
+            start_codes[i,:num_segments] = \
+                code_map[trajectory.get_class_code_array()]
+            durations[i,:num_segments] = trajectory.get_dwell_time_array()
+        end_codes = -numpy.ones(array_shape, dtype=int)
+        end_codes[:,:-1] = start_codes[:,1:]
+        return start_codes, end_codes, durations
+
+    def _compute_array_exp(self, rate_array_aa, class_name, dwell_time,
+                           model_fingerprint):
+        if model_fingerprint is None:
+            cache_key = None
+        else:
+            cache_key = (model_fingerprint, class_name)
+        if self.diagonal_dark and class_name == 'dark':
+            forward_calculator = self.diag_forward_calculator
+        else:
+            forward_calculator = self.forward_calculator
+        return forward_calculator.compute_array_exp(rate_array_aa, dwell_time,
+                                                    cache_key)
+
+    def _scale_rows(self, alpha, log_factor_sums, rows):
+        """
+        Scales the given rows of `alpha` in place so that each sums to
+        one, and adds the log10 scaling factors to `log_factor_sums`.
+        Rows that sum to less than `ALMOST_ZERO` are scaled by
+        ``1/ALMOST_ZERO``, like `ScalingFactorSet.scale_array`.
+        """
+        row_sums = numpy.nansum(alpha[rows], axis=1)
+        underflow = row_sums < ALMOST_ZERO
+        row_sums[underflow] = ALMOST_ZERO
+        alpha[rows] /= row_sums[:,numpy.newaxis]
+        log_factor_sums[rows] -= numpy.log10(row_sums)
+        alpha[numpy.isnan(alpha)] = 0.
@@ -0,0 +1,404 @@
+import json
+import platform
+import resource
+import time
+import numpy
+import scipy
+import pandas
+from .batched_forward_likelihood import BatchedForwardPredictor
+from .blink_factory import SingleDarkBlinkFactory, DoubleDarkBlinkFactory,\
+                           ConnectedDarkBlinkFactory
+from .blink_parameter_set import SingleDarkParameterSet,\
+                                 DoubleDarkParameterSet,\
+                                 ConnectedDarkParameterSet
+from .blink_route_mapper import SingleDarkRouteMapperFactory,\
+                                DoubleDarkRouteMapperFactory,\
+                                ConnectedDarkRouteMapperFactory
+from .blink_state_enumerator import SingleDarkState, DoubleDarkState,\
+                                    SingleDarkStateEnumeratorFactory,\
+                                    DoubleDarkStateEnumeratorFactory
+from .blink_target_data import BlinkTargetData, BlinkCollectionTargetData
+from .discrete_state_trajectory import make_trajectory_from_class_names
+from .forward_likelihood import ForwardPredictor
+from .likelihood_judge import CollectionLikelihoodJudge
+from .linalg import ScipyMatrixExponential, ScipyMatrixExponential2,\
+                    EigenMatrixExponential, ExpmMultiplyExponential
+from .scipy_optimizer import ScipyOptimizer
+from .score_function import ScoreFunction
+
+RESULTS_VERSION = 1
+
+# model name: (model factory, parameter set, state enumerator factory,
+#              state factory, route mapper factory)
+BLINK_MODELS = {
+    'single_dark':(SingleDarkBlinkFactory, SingleDarkParameterSet,
+                   SingleDarkStateEnumeratorFactory, SingleDarkState,
+                   SingleDarkRouteMapperFactory),
+    'double_dark':(DoubleDarkBlinkFactory, DoubleDarkParameterSet,
+                   DoubleDarkStateEnumeratorFactory, DoubleDarkState,
+                   DoubleDarkRouteMapperFactory),
+    'connected_dark':(ConnectedDarkBlinkFactory, ConnectedDarkParameterSet,
+                      DoubleDarkStateEnumeratorFactory, DoubleDarkState,
+                      ConnectedDarkRouteMapperFactory)}
+
+EXPM_ENGINES = {'scipy_pade':ScipyMatrixExponential,
+                'scipy_eig':ScipyMatrixExponential2,
+                'eigen':EigenMatrixExponential,
+                'expm_multiply':ExpmMultiplyExponential}
+
+BENCHMARK_NAMES = ['state_enumeration', 'route_mapping', 'rate_matrix',
+                   'expm', 'forward_likelihood', 'collection_judge', 'fit']
+
+# the columns that identify a benchmark case
+KEY_COLUMNS = ['benchmark', 'model', 'N', 'MAX_A', 'variant']
+
+
+def make_synthetic_trajectory(num_blinks, random_state, mean_dark_time=1.0,
+                              mean_bright_time=0.2):
+    """
+    Returns
+    -------
+    trajectory : DiscreteStateTrajectory
+        Alternating dark and bright segments with exponentially
+        distributed durations, starting and ending dark.
+    """
+    class_names = ['dark', 'bright'] * num_blinks + ['dark']
+    mean_times = numpy.array([mean_dark_time, mean_bright_time] * num_blinks +\
+                             [mean_dark_time])
+    dwell_times = random_state.exponential(1.0, len(class_names)) * mean_times
+    return make_trajectory_from_class_names(class_names, dwell_times)
+
+def make_synthetic_collection(num_trajectories, mean_num_blinks=3,
+                              random_seed=0):
+    """
+    Returns
+    -------
+    target_data : BlinkCollectionTargetData
+        Synthetic trajectories with a Poisson distributed number of
+        blinks, at least one each.
+    """
+    random_state = numpy.random.RandomState(random_seed)
+    target_data = BlinkCollectionTargetData()
+    target_data.target_data_collection = []
+    target_data.paths = []
+    for i in xrange(num_trajectories):
+        num_blinks = 1 + random_state.poisson(mean_num_blinks - 1)
+        trajectory_data = BlinkTargetData()
+        trajectory_data.trajectory = make_synthetic_trajectory(num_blinks,
+                                                               random_state)
+        target_data.target_data_collection.append(trajectory_data)
+        target_data.paths.append(None)
+    return target_data
+
+def make_parameter_set(model_name, N):
+    """
+    Returns
+    -------
+    parameter_set : ParameterSet
+        Default rates of `model_name`, with `N` fluorophores. Every
+        log rate is free within one decade of its default value.
+    """
+    parameter_set = BLINK_MODELS[model_name][1]()
+    parameter_set.set_parameter('N', N)
+    for parameter_name in parameter_set.get_parameter_names():
+        if parameter_name.startswith('log_'):
+            value = parameter_set.get_parameter(parameter_name)
+            parameter_set.set_parameter_bounds(parameter_name, value - 1.,
+                                               value + 1.)
+    return parameter_set
+
+def measure_peak_memory(fcn):
+    """
+    Call `fcn` and measure the peak resident memory of this process
+    while it runs. On linux the peak is reset before the call. On
+    other platforms it cannot be reset, so the result is only the
+    growth of the lifetime peak of the process, which is zero if the
+    call never uses more memory than the process already did.
+
+    Returns
+    -------
+    result : object
+        The return value of `fcn`.
+    peak_memory_kb : int
+        Peak resident memory during the call, above the memory in use
+        before the call, in kB.
+    """
+    try:
+        open('/proc/self/clear_refs', 'w').write('5')
+        start_kb = _read_proc_status('VmRSS')
+        result = fcn()
+        peak_kb = _read_proc_status('VmHWM')
+    except IOError:
+        start_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = fcn()
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result, max(0, peak_kb - start_kb)
+
+def _read_proc_status(field_name):
+    for line in open('/proc/self/status'):
+        if line.startswith(field_name + ':'):
+            return int(line.split()[1])
+    raise IOError("%s not found in /proc/self/status" % field_name)
+
+
+class BenchmarkSuite(object):
+    """
+    Measures the speed and peak memory of the likelihood and fitting
+    hot paths on synthetic data, for each blink model over a sweep of
+    N and MAX_A. The benchmarks are:
+
+    - state_enumeration: enumerate the states of the model
+    - route_mapping: map the routes between the states
+    - rate_matrix: assemble the rate matrix
+    - expm: exponentiate the rate matrix, once per engine of
+      `EXPM_ENGINES`, for a range of dwell times
+    - forward_likelihood: likelihood of one long trajectory with
+      `ForwardPredictor`, timed per segment
+    - collection_judge: `CollectionLikelihoodJudge` on the synthetic
+      collection, with the forward and the batched predictor
+    - fit: a `ScipyOptimizer` fit of the free log rates, limited to
+      `fit_maxiter` iterations so that its cost is comparable
+      between releases
+
+    Parameters
+    ----------
+    model_names : list of string, optional
+        Keys of `BLINK_MODELS`. Defaults to all of them.
+    benchmark_names : list of string, optional
+        The benchmarks to run. Defaults to all of them.
+    N_list, MAX_A_list : list of int, optional
+    repeat : int, optional
+        Each benchmark is run this many times. The best and the
+        median time are reported.
+    num_trajectories : int, optional
+        Size of the synthetic collection.
+    num_segments : int, optional
+        Approximate length of the trajectory of forward_likelihood.
+    fit_maxiter : int, optional
+    random_seed : int, optional
+    noisy : bool, optional
+    """
+    def __init__(self, model_names=None, benchmark_names=None,
+                 N_list=[1, 3, 5], MAX_A_list=[2, 5], repeat=3,
+                 num_trajectories=10, num_segments=200, fit_maxiter=3,
+                 random_seed=0, noisy=False):
+        super(BenchmarkSuite, self).__init__()
+        if model_names is None:
+            model_names = sorted(BLINK_MODELS.keys())
+        if benchmark_names is None:
+            benchmark_names = BENCHMARK_NAMES
+        self.model_names = model_names
+        self.benchmark_names = benchmark_names
+        self.N_list = N_list
+        self.MAX_A_list = MAX_A_list
+        self.repeat = repeat
+        self.num_trajectories = num_trajectories
+        self.num_segments = num_segments
+        self.fit_maxiter = fit_maxiter
+        self.random_seed = random_seed
+        self.noisy = noisy
+
+    def run(self):
+        """
+        Returns
+        -------
+        result_list : list of dict
+            One result per benchmark case, see `time_benchmark`.
+        """
+        target_data = make_synthetic_collection(self.num_trajectories,
+                                                random_seed=self.random_seed)
+        random_state = numpy.random.RandomState(self.random_seed)
+        long_trajectory = make_synthetic_trajectory(self.num_segments // 2,
+                                                    random_state)
+        result_list = []
+        for model_name in self.model_names:
+            for MAX_A in self.MAX_A_list:
+                for N in self.N_list:
+                    result_list += self.run_model_benchmarks(
+                                    model_name, N, MAX_A, target_data,
+                                    long_trajectory)
+        return result_list
+
+    def run_model_benchmarks(self, model_name, N, MAX_A, target_data,
+                             trajectory):
+        model_factory_class, parameter_set_class, enumerator_factory_class,\
+            state_class, route_mapper_factory_class = BLINK_MODELS[model_name]
+        parameter_set = make_parameter_set(model_name, N)
+        model = model_factory_class(MAX_A=MAX_A).create_model(parameter_set)
+        num_states = model.get_num_states()
+        case = {'model':model_name, 'N':N, 'MAX_A':MAX_A,
+                'num_states':num_states}
+        result_list = []
+
+        def enumerate_states():
+            enumerator_factory = enumerator_factory_class(N, state_class,
+                                                          MAX_A)
+            return enumerator_factory.create_state_enumerator()()
+        result_list.append(self.time_benchmark(
+            enumerate_states, 1, benchmark='state_enumeration', **case))
+
+        state_collection = enumerate_states()[0]
+        def map_routes():
+            route_mapper_factory = route_mapper_factory_class(
+                                    parameter_set=parameter_set,
+                                    max_A=MAX_A)
+            route_mapper = route_mapper_factory.create_route_mapper()
+            return route_mapper(state_collection)
+        result_list.append(self.time_benchmark(
+            map_routes, 1, benchmark='route_mapping', **case))
+
+        num_builds = 10
+        def build_rate_matrices():
+            for i in xrange(num_builds):
+                model.build_rate_matrix(time=0.)
+        result_list.append(self.time_benchmark(
+            build_rate_matrices, num_builds, benchmark='rate_matrix', **case))
+
+        Q = model.build_rate_matrix(time=0.).as_npy_array()
+        dwell_times = numpy.logspace(-2, 1, 10)
+        for engine_name in sorted(EXPM_ENGINES.keys()):
+            def compute_exponentials():
+                # a new calculator for every repeat, so caches of
+                # decompositions do not carry over between repeats
+                expm_calculator = EXPM_ENGINES[engine_name]()
+                for dwell_time in dwell_times:
+                    expm_calculator.compute_array_exp(Q, dwell_time)
+            result_list.append(self.time_benchmark(
+                compute_exponentials, len(dwell_times), benchmark='expm',
+                variant=engine_name, **case))
+
+        data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                          always_rebuild_rate_matrix=False)
+        def predict_trajectory():
+            return data_predictor.predict_data(model, trajectory)
+        result_list.append(self.time_benchmark(
+            predict_trajectory, len(trajectory),
+            benchmark='forward_likelihood', **case))
+
+        judge = CollectionLikelihoodJudge()
+        predictor_dict = {'forward':data_predictor,
+                          'batched':BatchedForwardPredictor(
+                                        ScipyMatrixExponential())}
+        for predictor_name in sorted(predictor_dict.keys()):
+            predictor = predictor_dict[predictor_name]
+            def judge_collection():
+                return judge.judge_prediction(model, predictor, target_data)
+            result_list.append(self.time_benchmark(
+                judge_collection, len(target_data),
+                benchmark='collection_judge', variant=predictor_name, **case))
+
+        optimizer = ScipyOptimizer(maxiter=self.fit_maxiter)
+        def fit_parameters():
+            # a new factory and start for every run, so runs are alike
+            fit_parameter_set = make_parameter_set(model_name, N)
+            score_fcn = ScoreFunction(model_factory_class(MAX_A=MAX_A),
+                                      fit_parameter_set, judge,
+                                      data_predictor, target_data)
+            return optimizer.optimize_parameters(score_fcn.compute_score,
+                                                 fit_parameter_set)
+        result_list.append(self.time_benchmark(
+            fit_parameters, 1, benchmark='fit', **case))
+        return [result for result in result_list if result is not None]
+
+    def time_benchmark(self, fcn, num_items, benchmark, model, N, MAX_A,
+                       num_states, variant=''):
+        """
+        Parameters
+        ----------
+        fcn : callable f()
+            The code to benchmark.
+        num_items : int
+            Number of units of work of one call of `fcn`, such as
+            segments or trajectories, to compute the time per item.
+
+        Returns
+        -------
+        result : dict or None
+            None if `benchmark` is not one of `benchmark_names`.
+            Otherwise the case, given by `benchmark`, `model`, `N`,
+            `MAX_A` and `variant`, and its `num_states`, `num_items`,
+            `best_time`, `median_time` and `time_per_item` in seconds,
+            and `peak_memory_kb`.
+        """
+        if benchmark not in self.benchmark_names:
+            return None
+        time_list = []
+        peak_memory_list = []
+        for i in xrange(self.repeat):
+            start_time = time.time()
+            result, peak_memory_kb = measure_peak_memory(fcn)
+            time_list.append(time.time() - start_time)
+            peak_memory_list.append(peak_memory_kb)
+        best_time = min(time_list)
+        result = {'benchmark':benchmark, 'model':model, 'N':N,
+                  'MAX_A':MAX_A, 'variant':variant, 'num_states':num_states,
+                  'num_items':num_items, 'best_time':best_time,
+                  'median_time':float(numpy.median(time_list)),
+                  'time_per_item':best_time / num_items,
+                  'peak_memory_kb':max(peak_memory_list)}
+        if self.noisy:
+            print "%s %s %s N=%d MAX_A=%d: %.3e s, %d kB" % (
+                    benchmark, variant, model, N, MAX_A, best_time,
+                    result['peak_memory_kb'])
+        return result
+
+
+def write_results(result_list, filename):
+    """
+    Save benchmark results as json, together with the versions of
+    python, numpy, scipy and pandas and a description of the machine,
+    so that results of different releases can be compared.
+    """
+    results = {'version':RESULTS_VERSION,
+               'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python':platform.python_version(),
+               'numpy':numpy.__version__,
+               'scipy':scipy.__version__,
+               'pandas':pandas.__version__,
+               'platform':platform.platform(),
+               'results':result_list}
+    f = open(filename, 'w')
+    try:
+        json.dump(results, f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+
+def load_results(filename):
+    """
+    Returns
+    -------
+    results : dict
+        The contents of a file written by `write_results`.
+    """
+    f = open(filename, 'r')
+    try:
+        results = json.load(f)
+    finally:
+        f.close()
+    assert results['version'] == RESULTS_VERSION,\
+           "Unknown benchmark results version %s" % results['version']
+    return results
+
+def compare_results(old_results, new_results):
+    """
+    Parameters
+    ----------
+    old_results, new_results : dict
+        Benchmark results, as returned by `load_results`.
+
+    Returns
+    -------
+    comparison : pandas.DataFrame
+        The best time and peak memory of the cases found in both
+        results, and `time_ratio`, the new best time divided by the
+        old one. Ratios above one are slowdowns.
+    """
+    value_columns = ['best_time', 'peak_memory_kb']
+    old_frame = pandas.DataFrame(old_results['results'])
+    new_frame = pandas.DataFrame(new_results['results'])
+    comparison = pandas.merge(old_frame[KEY_COLUMNS + value_columns],
+                              new_frame[KEY_COLUMNS + value_columns],
+                              on=KEY_COLUMNS, suffixes=('_old', '_new'))
+    comparison['time_ratio'] = comparison['best_time_new'] /\
+                               comparison['best_time_old']
+    return comparison
@@ -1,3 +1,4 @@
+import abc
 from .base.model_factory import ModelFactory
 from .blink_model import BlinkModel
 from .blink_state_enumerator import SingleDarkState, DoubleDarkState,\
@@ -6,9 +7,103 @@ from .blink_state_enumerator import SingleDarkState, DoubleDarkState,\
 from .blink_route_mapper import Route, SingleDarkRouteMapperFactory,\
                                     DoubleDarkRouteMapperFactory,\
                                     ConnectedDarkRouteMapperFactory
+from .topology_cache import TopologyCache
 
 
-class SingleDarkBlinkFactory(ModelFactory):
+class BlinkFactory(ModelFactory):
+    '''
+    Base class for the blink model factories. The states and routes of
+    a blink model only depend on N and on the settings of the factory,
+    so each distinct topology is built once and cached. Later models
+    with the same topology share it and only bind a new parameter set.
+    With a `topology_cache_dir`, topologies are also saved to disk, and
+    factories in other processes load them instead of enumerating
+    states and routes again.
+
+    Attributes
+    ----------
+    topology_cache : dict
+        Template models, indexed by topology key.
+    disk_cache : TopologyCache or None
+    '''
+    def create_model(self, parameter_set):
+        """
+        Creates a new BlinkModel, reusing the states and routes of an
+        earlier model with the same topology.
+
+        Parameters
+        ----------
+        parameter_set : ParameterSet
+
+        Returns
+        -------
+        new_model : BlinkModel
+        """
+        topology_key = self.get_topology_key(parameter_set)
+        template_model = self.topology_cache.get(topology_key, None)
+        if template_model is None and self.disk_cache is not None:
+            template_model = self.load_model(parameter_set)
+        if template_model is None:
+            template_model = self.build_model(parameter_set)
+            if self.disk_cache is not None:
+                self.disk_cache.save_topology(
+                    self.get_disk_topology_key(parameter_set),
+                    template_model)
+        self.topology_cache[topology_key] = template_model
+        new_model = template_model.bind_parameter_set(parameter_set)
+        return new_model
+
+    def get_topology_key(self, parameter_set):
+        N = parameter_set.get_parameter('N')
+        return (N, self.MAX_A, self.observable_bright_classes,
+                self.fermi_activation, self.__class__.__name__)
+
+    def get_disk_topology_key(self, parameter_set):
+        N = parameter_set.get_parameter('N')
+        return (self.__class__.__name__, N, self.MAX_A,
+                self.observable_bright_classes)
+
+    def clear_topology_cache(self):
+        self.topology_cache = {}
+
+    def set_topology_cache_dir(self, topology_cache_dir):
+        if topology_cache_dir is None:
+            self.disk_cache = None
+        else:
+            self.disk_cache = TopologyCache(topology_cache_dir)
+
+    def load_model(self, parameter_set):
+        """
+        Returns
+        -------
+        new_model : BlinkModel or None
+            A model with the states and routes saved in the disk
+            cache, or None if the cache does not have them.
+        """
+        topology = self.disk_cache.load_topology(
+                    self.get_disk_topology_key(parameter_set))
+        if topology is None:
+            return None
+        state_collection, initial_state_id, final_state_id,\
+            route_collection = topology
+        state_enumerator = lambda: (state_collection, initial_state_id,
+                                    final_state_id)
+        route_mapper = lambda sc: route_collection
+        return self.make_model(state_enumerator, route_mapper, parameter_set)
+
+    def make_model(self, state_enumerator, route_mapper, parameter_set):
+        return BlinkModel(state_enumerator, route_mapper, parameter_set,
+                          self.fermi_activation)
+
+    @abc.abstractmethod
+    def build_model(self, parameter_set):
+        """
+        Builds a new BlinkModel, enumerating its states and routes.
+        """
+        return
+
+
+class SingleDarkBlinkFactory(BlinkFactory):
     '''
     This factory class creates an aggregated kinetic model with
     one dark state: (insert image)
@@ -21,6 +116,8 @@ class SingleDarkBlinkFactory(ModelFactory):
         Number of fluorophores that can be simultaneously active.
     observable_bright_classes: int
         Number of discrete intensity levels that can be distinguished.
+    topology_cache_dir : string, optional
+        Directory of a `TopologyCache` shared with other processes.
 
     Attributes
     ----------
@@ -30,16 +127,18 @@ class SingleDarkBlinkFactory(ModelFactory):
         Factory class for Route objects.
     '''
     def __init__(self, fermi_activation=False, MAX_A=10,
-                 observable_bright_classes=1):
+                 observable_bright_classes=1, topology_cache_dir=None):
         self.state_factory = SingleDarkState
         self.route_factory = Route
         self.fermi_activation = fermi_activation
         self.MAX_A = MAX_A
         self.observable_bright_classes = observable_bright_classes
+        self.topology_cache = {}
+        self.set_topology_cache_dir(topology_cache_dir)
 
-    def create_model(self, parameter_set):
+    def build_model(self, parameter_set):
         """
-        Creates a new BlinkModel with one dark state.
+        Builds a new BlinkModel with one dark state.
 
         Parameters
         ----------
@@ -60,12 +159,10 @@ class SingleDarkBlinkFactory(ModelFactory):
                                 route_factory=self.route_factory,
                                 max_A=self.MAX_A)
         route_mapper = route_mapper_factory.create_route_mapper()
-        new_model = BlinkModel(state_enumerator, route_mapper,
-                               parameter_set, self.fermi_activation)
-        return new_model
+        return self.make_model(state_enumerator, route_mapper, parameter_set)
 
 
-class DoubleDarkBlinkFactory(ModelFactory):
+class DoubleDarkBlinkFactory(BlinkFactory):
     '''
     This factory class creates an aggregated kinetic model with
     two, unconnected dark states: (insert image)
@@ -78,6 +175,8 @@ class DoubleDarkBlinkFactory(ModelFactory):
         Number of fluorophores that can be simultaneously active.
     observable_bright_classes: int
         Number of discrete intensity levels that can be distinguished.
+    topology_cache_dir : string, optional
+        Directory of a `TopologyCache` shared with other processes.
 
     Attributes
     ----------
@@ -87,16 +186,18 @@ class DoubleDarkBlinkFactory(ModelFactory):
         Factory class for Route objects.
     '''
     def __init__(self, fermi_activation=False, MAX_A=10,
-                 observable_bright_classes=1):
+                 observable_bright_classes=1, topology_cache_dir=None):
         self.state_factory = DoubleDarkState
         self.route_factory = Route
         self.fermi_activation = fermi_activation
         self.MAX_A = MAX_A
         self.observable_bright_classes = observable_bright_classes
+        self.topology_cache = {}
+        self.set_topology_cache_dir(topology_cache_dir)
 
-    def create_model(self, parameter_set):
+    def build_model(self, parameter_set):
         """
-        Creates a new BlinkModel with two dark states.
+        Builds a new BlinkModel with two dark states.
 
         Parameters
         ----------
@@ -117,12 +218,10 @@ class DoubleDarkBlinkFactory(ModelFactory):
                                 route_factory=self.route_factory,
                                 max_A=self.MAX_A)
         route_mapper = route_mapper_factory.create_route_mapper()
-        new_model = BlinkModel(state_enumerator, route_mapper,
-                               parameter_set)
-        return new_model
+        return self.make_model(state_enumerator, route_mapper, parameter_set)
 
 
-class ConnectedDarkBlinkFactory(ModelFactory):
+class ConnectedDarkBlinkFactory(BlinkFactory):
     '''
     This factory class creates an aggregated kinetic model with
     two, connected dark states: (insert image)
@@ -135,6 +234,8 @@ class ConnectedDarkBlinkFactory(ModelFactory):
         Number of fluorophores that can be simultaneously active.
     observable_bright_classes: int
         Number of discrete intensity levels that can be distinguished.
+    topology_cache_dir : string, optional
+        Directory of a `TopologyCache` shared with other processes.
 
     Attributes
     ----------
@@ -144,16 +245,18 @@ class ConnectedDarkBlinkFactory(ModelFactory):
         Factory class for Route objects.
     '''
     def __init__(self, fermi_activation=False, MAX_A=10,
-                 observable_bright_classes=1):
+                 observable_bright_classes=1, topology_cache_dir=None):
         self.state_factory = DoubleDarkState
         self.route_factory = Route
         self.fermi_activation = fermi_activation
         self.MAX_A = MAX_A
         self.observable_bright_classes = observable_bright_classes
+        self.topology_cache = {}
+        self.set_topology_cache_dir(topology_cache_dir)
 
-    def create_model(self, parameter_set):
+    def build_model(self, parameter_set):
         """
-        Creates a new BlinkModel with two dark states.
+        Builds a new BlinkModel with two dark states.
 
         Parameters
         ----------
@@ -174,6 +277,4 @@ class ConnectedDarkBlinkFactory(ModelFactory):
                                 route_factory=self.route_factory,
                                 max_A=self.MAX_A)
         route_mapper = route_mapper_factory.create_route_mapper()
-        new_model = BlinkModel(state_enumerator, route_mapper,
-                               parameter_set)
-        return new_model
+        return self.make_model(state_enumerator, route_mapper, parameter_set)
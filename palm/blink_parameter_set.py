@@ -71,6 +71,16 @@ class SingleDarkParameterSet(ParameterSet):
                                    fermi_T, fermi_tf])
         return param_array
 
+    def get_parameter_names(self):
+        """
+        Returns
+        -------
+        parameter_names : list
+            Parameter names, in the order used by `as_array`.
+        """
+        return ['log_ka', 'log_kd', 'log_kr', 'log_kb', 'N',
+                'fermi_T', 'fermi_tf']
+
     def update_from_array(self, parameter_array):
         """
         Set parameter values from a numpy array. Useful because numpy arrays
@@ -181,6 +191,16 @@ class DoubleDarkParameterSet(ParameterSet):
         return numpy.array([log_ka, log_kd1, log_kr1, log_kd2, log_kr_diff,
                             log_kb, N, fermi_T, fermi_tf])
 
+    def get_parameter_names(self):
+        """
+        Returns
+        -------
+        parameter_names : list
+            Parameter names, in the order used by `as_array`.
+        """
+        return ['log_ka', 'log_kd1', 'log_kr1', 'log_kd2', 'log_kr_diff',
+                'log_kb', 'N', 'fermi_T', 'fermi_tf']
+
     def update_from_array(self, parameter_array):
         """
         Set parameter values from a numpy array. Useful because numpy arrays
@@ -224,6 +244,7 @@ class DoubleDarkParameterSet(ParameterSet):
                   log_kr1_bounds, log_kd2_bounds,
                   log_kr_diff_bounds, log_kb_bounds,
                   N_bounds, fermi_T_bounds, fermi_tf_bounds]
+        return bounds
 
 
 class ConnectedDarkParameterSet(ParameterSet):
@@ -296,6 +317,16 @@ class ConnectedDarkParameterSet(ParameterSet):
         return numpy.array([log_ka, log_kd1, log_kr1, log_kd2, log_kr2,
                             log_kb, N, fermi_T, fermi_tf])
 
+    def get_parameter_names(self):
+        """
+        Returns
+        -------
+        parameter_names : list
+            Parameter names, in the order used by `as_array`.
+        """
+        return ['log_ka', 'log_kd1', 'log_kr1', 'log_kd2', 'log_kr2',
+                'log_kb', 'N', 'fermi_T', 'fermi_tf']
+
     def update_from_array(self, parameter_array):
         """
         Set parameter values from a numpy array. Useful because numpy arrays
@@ -339,3 +370,4 @@ class ConnectedDarkParameterSet(ParameterSet):
                   log_kr1_bounds, log_kd2_bounds,
                   log_kr2_bounds, log_kb_bounds,
                   N_bounds, fermi_T_bounds, fermi_tf_bounds]
+        return bounds
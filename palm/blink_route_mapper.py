@@ -1,6 +1,80 @@
 import numpy
+import scipy.misc
 from .util import n_choose_k
-from .route_collection import RouteCollectionFactory
+from .route_collection import make_route_collection_from_inds
+
+
+def map_routes_from_populations(state_collection, transition_list,
+                                species_names, max_A):
+    """
+    Finds every route of a blink model with array operations. The
+    population change of each transition is applied to the populations
+    of all states at once. Targets with a negative population or more
+    than `max_A` active fluorophores, and starts without the reactants
+    of the transition, are masked out. The targets are located with the
+    ranking function of the state space, so no id strings are formatted.
+
+    Parameters
+    ----------
+    state_collection : StateCollection
+        States made by a blink state enumerator. Collections without
+        a population array are read from their table instead.
+    transition_list : list
+        The transitions of the model, such as `SingleDarkTransition`.
+    species_names : list of string
+        The microstates, in the order of the population array.
+    max_A : int
+        Number of fluorophores that can be simultaneously active.
+
+    Returns
+    -------
+    route_collection : RouteCollection
+        The routes, ordered by start state, then by transition.
+    """
+    population_array = state_collection.population_array
+    if population_array is None:
+        population_array = numpy.array(
+            state_collection.data_frame[species_names].values, dtype=int)
+    dPop_array = numpy.array([[transition.get_dPop(species_name)
+                               for species_name in species_names]
+                              for transition in transition_list])
+    end_population_array = population_array[:,numpy.newaxis,:] +\
+                           dPop_array[numpy.newaxis,:,:]
+    A_index = species_names.index('A')
+    is_valid = numpy.all(end_population_array >= 0, axis=2) &\
+               (end_population_array[:,:,A_index] <= max_A)
+    multiplicity_array = numpy.zeros(is_valid.shape)
+    for j, transition in enumerate(transition_list):
+        reacting_species_dict = transition.reacting_species_dict
+        for species_name, num_reactants in reacting_species_dict.iteritems():
+            species_index = species_names.index(species_name)
+            is_valid[:,j] &= (population_array[:,species_index] >=\
+                              num_reactants)
+        # the multiplicity counts the ways to choose the reactants
+        species_name = reacting_species_dict.keys()[0]
+        reactant_pop = population_array[:,species_names.index(species_name)]
+        multiplicity_array[:,j] = scipy.misc.comb(
+                                    reactant_pop,
+                                    abs(reacting_species_dict[species_name]))
+    start_inds, transition_inds = numpy.nonzero(is_valid)
+    end_population_array = end_population_array[start_inds, transition_inds]
+    state_id_list = state_collection.data_frame.index.tolist()
+    state_space = state_collection.state_space
+    if state_space is not None:
+        end_inds = state_space.rank(end_population_array)
+    else:
+        state_index_dict = {}
+        for i, populations in enumerate(population_array.tolist()):
+            state_index_dict[tuple(populations)] = i
+        end_inds = numpy.array([state_index_dict[tuple(populations)]
+                                for populations
+                                in end_population_array.tolist()], dtype=int)
+    rate_id_array = numpy.array([transition.rate_id
+                                 for transition in transition_list])
+    return make_route_collection_from_inds(
+            state_id_list, start_inds, end_inds,
+            rate_id_array[transition_inds],
+            multiplicity_array[start_inds, transition_inds])
 
 
 class Route(object):
@@ -65,7 +139,8 @@ class SingleDarkRouteMapperFactory(object):
     ----------
     parameter_set : ParameterSet
     route_factory : class, optional
-        A class for making Route objects.
+        Not used, since routes are mapped as arrays rather than
+        as Route objects. Kept for compatibility.
     max_A : int, optional
         Number of fluorophores that can be simultaneously active.
     """
@@ -109,51 +184,11 @@ class SingleDarkRouteMapperFactory(object):
             -------
             route_collection : RouteCollection
             """
-            rc_factory = RouteCollectionFactory()
-            for start_id, start_state in state_collection.iter_states():
-                route_iterator = self._enumerate_allowed_transitions(
-                                    start_state, allowed_transitions_list)
-                for end_id, transition in route_iterator:
-                    rate_id = transition.rate_id
-                    multiplicity = transition.compute_multiplicity(start_state)
-                    route_id = "%s__%s" % (start_id, end_id)
-                    new_route = self.route_factory(route_id, start_id, end_id,
-                                                   rate_id, multiplicity)
-                    rc_factory.add_route(new_route)
-            route_collection = rc_factory.make_route_collection()
-            return route_collection
+            return map_routes_from_populations(
+                    state_collection, allowed_transitions_list,
+                    ['I', 'A', 'D', 'B'], self.max_A)
         return map_routes
 
-    def _enumerate_allowed_transitions(self, start_state,
-                                      allowed_transitions_list):
-        """
-        Iterate through possible transitions and filter out those
-        that lead to invalid states.
-
-        Parameters
-        ----------
-        start_state : State
-            Enumerate transitions that lead from this state to other states.
-        allowed_transitions_list : list
-            Possible transitions from `start_state` to other states.
-
-        Returns
-        -------
-        end_id : string
-            Transition will lead from `start_state` to the state with this id.
-        transition : SingleDarkTransition
-        """
-        for transition in allowed_transitions_list:
-            I2 = start_state['I'] + transition.get_dPop('I')
-            A2 = start_state['A'] + transition.get_dPop('A')
-            D2 = start_state['D'] + transition.get_dPop('D')
-            B2 = start_state['B'] + transition.get_dPop('B')
-            end_state_array = numpy.array([I2, A2, D2, B2])
-            no_negative_pop = len(numpy.where(end_state_array < 0)[0]) == 0
-            if A2 <= self.max_A and no_negative_pop and\
-              transition.is_allowed(start_state):
-                end_id = "%d_%d_%d_%d" % (I2, A2, D2, B2)
-                yield end_id, transition
 
 
 class SingleDarkTransition(object):
@@ -267,7 +302,8 @@ class DoubleDarkRouteMapperFactory(object):
     ----------
     parameter_set : ParameterSet
     route_factory : class, optional
-        A class for making Route objects.
+        Not used, since routes are mapped as arrays rather than
+        as Route objects. Kept for compatibility.
     max_A : int, optional
         Number of fluorophores that can be simultaneously active.
     """
@@ -316,52 +352,11 @@ class DoubleDarkRouteMapperFactory(object):
             -------
             route_collection : RouteCollection
             """
-            rc_factory = RouteCollectionFactory()
-            for start_id, start_state in state_collection.iter_states():
-                route_iterator = self._enumerate_allowed_transitions(
-                                    start_state, allowed_transitions_list)
-                for end_id, transition in route_iterator:
-                    rate_id = transition.rate_id
-                    multiplicity = transition.compute_multiplicity(start_state)
-                    route_id = "%s__%s" % (start_id, end_id)
-                    new_route = self.route_factory(route_id, start_id, end_id,
-                                                   rate_id, multiplicity)
-                    rc_factory.add_route(new_route)
-            route_collection = rc_factory.make_route_collection()
-            return route_collection
+            return map_routes_from_populations(
+                    state_collection, allowed_transitions_list,
+                    ['I', 'A', 'D1', 'D2', 'B'], self.max_A)
         return map_routes
 
-    def _enumerate_allowed_transitions(self, start_state,
-                                      allowed_transitions_list):
-        """
-        Iterate through possible transitions and filter out those
-        that lead to invalid states.
-
-        Parameters
-        ----------
-        start_state : State
-            Enumerate transitions that lead from this state to other states.
-        allowed_transitions_list : list
-            Possible transitions from `start_state` to other states.
-
-        Returns
-        -------
-        end_id : string
-            Transition will lead from `start_state` to the state with this id.
-        transition : SingleDarkTransition
-        """
-        for transition in allowed_transitions_list:
-            end_I =  start_state['I'] + transition.get_dPop('I')
-            end_A =  start_state['A'] + transition.get_dPop('A')
-            end_D1 = start_state['D1'] + transition.get_dPop('D1')
-            end_D2 = start_state['D2'] + transition.get_dPop('D2')
-            end_B =  start_state['B'] + transition.get_dPop('B')
-            end_state_array = numpy.array([end_I, end_A, end_D1, end_D2, end_B])
-            no_negative_pop = len(numpy.where(end_state_array < 0)[0]) == 0
-            if end_A <= self.max_A and no_negative_pop and\
-              transition.is_allowed(start_state):
-                end_id = "%d_%d_%d_%d_%d" % (end_I, end_A, end_D1, end_D2, end_B)
-                yield end_id, transition
 
 
 class DoubleDarkTransition(object):
@@ -477,7 +472,8 @@ class ConnectedDarkRouteMapperFactory(object):
     ----------
     parameter_set : ParameterSet
     route_factory : class, optional
-        A class for making Route objects.
+        Not used, since routes are mapped as arrays rather than
+        as Route objects. Kept for compatibility.
     max_A : int, optional
         Number of fluorophores that can be simultaneously active.
     """
@@ -526,49 +522,8 @@ class ConnectedDarkRouteMapperFactory(object):
             -------
             route_collection : RouteCollection
             """
-            rc_factory = RouteCollectionFactory()
-            for start_id, start_state in state_collection.iter_states():
-                route_iterator = self._enumerate_allowed_transitions(
-                                    start_state, allowed_transitions_list)
-                for end_id, transition in route_iterator:
-                    rate_id = transition.rate_id
-                    multiplicity = transition.compute_multiplicity(start_state)
-                    route_id = "%s__%s" % (start_id, end_id)
-                    new_route = self.route_factory(route_id, start_id, end_id,
-                                                   rate_id, multiplicity)
-                    rc_factory.add_route(new_route)
-            route_collection = rc_factory.make_route_collection()
-            return route_collection
+            return map_routes_from_populations(
+                    state_collection, allowed_transitions_list,
+                    ['I', 'A', 'D1', 'D2', 'B'], self.max_A)
         return map_routes
 
-    def _enumerate_allowed_transitions(self, start_state,
-                                      allowed_transitions_list):
-        """
-        Iterate through possible transitions and filter out those
-        that lead to invalid states.
-
-        Parameters
-        ----------
-        start_state : State
-            Enumerate transitions that lead from this state to other states.
-        allowed_transitions_list : list
-            Possible transitions from `start_state` to other states.
-
-        Returns
-        -------
-        end_id : string
-            Transition will lead from `start_state` to the state with this id.
-        transition : SingleDarkTransition
-        """
-        for transition in allowed_transitions_list:
-            end_I =  start_state['I'] + transition.get_dPop('I')
-            end_A =  start_state['A'] + transition.get_dPop('A')
-            end_D1 = start_state['D1'] + transition.get_dPop('D1')
-            end_D2 = start_state['D2'] + transition.get_dPop('D2')
-            end_B =  start_state['B'] + transition.get_dPop('B')
-            end_state_array = numpy.array([end_I, end_A, end_D1, end_D2, end_B])
-            no_negative_pop = len(numpy.where(end_state_array < 0)[0]) == 0
-            if end_A <= self.max_A and no_negative_pop and\
-              transition.is_allowed(start_state):
-                end_id = "%d_%d_%d_%d_%d" % (end_I, end_A, end_D1, end_D2, end_B)
-                yield end_id, transition
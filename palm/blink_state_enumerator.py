@@ -1,6 +1,62 @@
+import numpy
 from types import IntType
-from .util import multichoose
 from .state_collection import StateCollectionFactory
+from .state_space import PopulationSpace
+
+
+def make_state_collection(state_space, state_factory,
+                          observable_bright_classes=1):
+    """
+    Builds the StateCollection of a blink model from its population
+    space. Only valid macrostates are generated, in the order of their
+    rank, so the position of a state in the collection is its rank in
+    `state_space`. The id strings, e.g. "3_1_0_1", are labels made
+    from the populations.
+
+    Parameters
+    ----------
+    state_space : PopulationSpace
+        The microstates must be `I`, `A`, ..., `B`, in the order of
+        the arguments of `state_factory`.
+    state_factory : class
+        Factory class for State objects.
+    observable_bright_classes: int
+        Number of discrete intensity levels that can be distinguished.
+
+    Returns
+    -------
+    state_collection : StateCollection
+        With the `state_space` and the `population_array` of its states.
+    initial_state_id, final_state_id : string
+        The identifier strings for the states where a time trace
+        is expected to start and finish, respectively.
+    """
+    population_array = state_space.get_population_array()
+    id_list = state_space.make_labels(population_array)
+    A_array = population_array[:,state_space.get_species_index('A')]
+    class_number_array = numpy.minimum(A_array, observable_bright_classes)
+    sc_factory = StateCollectionFactory()
+    for id_str, populations, A, class_number in zip(
+            id_list, population_array.tolist(), A_array.tolist(),
+            class_number_array.tolist()):
+        if A == 0:
+            obs_class = 'dark'
+        elif class_number == 1:
+            obs_class = 'bright'
+        else:
+            obs_class = 'bright_%d' % class_number
+        this_state = state_factory(id_str, *(populations + [obs_class]))
+        sc_factory.add_state(this_state)
+    state_collection = sc_factory.make_state_collection()
+    state_collection.state_space = state_space
+    state_collection.population_array = population_array
+    N = state_space.N
+    num_species = len(state_space.species_names)
+    initial_populations = [N] + [0] * (num_species - 1)
+    final_populations = [0] * (num_species - 1) + [N]
+    initial_state_id = id_list[state_space.rank(initial_populations)]
+    final_state_id = id_list[state_space.rank(final_populations)]
+    return state_collection, initial_state_id, final_state_id
 
 
 class SingleDarkState(object):
@@ -128,6 +184,16 @@ class SingleDarkStateEnumeratorFactory(object):
         self.observable_bright_classes = max(1, observable_bright_classes)
         self.num_microstates = len(['I', 'A', 'D', 'B'])
 
+    def create_state_space(self):
+        """
+        Returns
+        -------
+        state_space : PopulationSpace
+            The macrostates of the model, with at most `max_A`
+            active fluorophores.
+        """
+        return PopulationSpace(['I', 'A', 'D', 'B'], self.N, {'A':self.max_A})
+
     def create_state_enumerator(self):
         """
         Creates a method that builds a StateCollection, made up of
@@ -152,35 +218,9 @@ class SingleDarkStateEnumeratorFactory(object):
                 The identifier strings for the states where a time trace
                 is expected to start and finish, respectively.
             """
-            sc_factory = StateCollectionFactory()
-            for this_count_list in multichoose(self.num_microstates, self.N):
-                I = this_count_list[0]
-                A = this_count_list[1]
-                D = this_count_list[2]
-                B = this_count_list[3]
-                if A > self.max_A:
-                    continue
-                else:
-                    if A >= 1:
-                        class_number = min(A, self.observable_bright_classes)
-                        if class_number == 1:
-                            obs_class = 'bright'
-                        else:
-                            obs_class = 'bright_%d' % class_number
-                    else:
-                        obs_class = 'dark'
-                    id_str = "%d_%d_%d_%d" % (I, A, D, B)
-                    this_state = self.state_factory(id_str, I, A, D, B,
-                                                    obs_class)
-                    if I == self.N:
-                        initial_state_id = this_state.get_id()
-                    elif B == self.N:
-                        final_state_id = this_state.get_id()
-                    else:
-                        pass
-                    sc_factory.add_state(this_state)
-            state_collection = sc_factory.make_state_collection()
-            return state_collection, initial_state_id, final_state_id
+            state_space = self.create_state_space()
+            return make_state_collection(state_space, self.state_factory,
+                                         self.observable_bright_classes)
         return enumerate_states
 
 
@@ -212,6 +252,17 @@ class DoubleDarkStateEnumeratorFactory(object):
         self.observable_bright_classes = max(1, observable_bright_classes)
         self.num_microstates = len(['I', 'A', 'D1', 'D2', 'B'])
 
+    def create_state_space(self):
+        """
+        Returns
+        -------
+        state_space : PopulationSpace
+            The macrostates of the model, with at most `max_A`
+            active fluorophores.
+        """
+        return PopulationSpace(['I', 'A', 'D1', 'D2', 'B'], self.N,
+                               {'A':self.max_A})
+
     def create_state_enumerator(self):
         """
         Creates a method that builds a StateCollection, made up of
@@ -236,35 +287,8 @@ class DoubleDarkStateEnumeratorFactory(object):
                 The identifier strings for the states where a time trace
                 is expected to start and finish, respectively.
             """
-            sc_factory = StateCollectionFactory()
-            for this_count_list in multichoose(self.num_microstates, self.N):
-                I = this_count_list[0]
-                A = this_count_list[1]
-                D1 = this_count_list[2]
-                D2 = this_count_list[3]
-                B = this_count_list[4]
-                if A > self.max_A:
-                    continue
-                else:
-                    if A >= 1:
-                        class_number = min(A, self.observable_bright_classes)
-                        if class_number == 1:
-                            obs_class = 'bright'
-                        else:
-                            obs_class = 'bright_%d' % class_number
-                    else:
-                        obs_class = 'dark'
-                    id_str = "%d_%d_%d_%d_%d" % (I, A, D1, D2, B)
-                    this_state = self.state_factory(id_str, I, A, D1, D2, B,
-                                                    obs_class)
-                    if I == self.N:
-                        initial_state_id = this_state.get_id()
-                    elif B == self.N:
-                        final_state_id = this_state.get_id()
-                    else:
-                        pass
-                    sc_factory.add_state(this_state)
-            state_collection = sc_factory.make_state_collection()
-            return state_collection, initial_state_id, final_state_id
+            state_space = self.create_state_space()
+            return make_state_collection(state_space, self.state_factory,
+                                         self.observable_bright_classes)
         return enumerate_states
 
@@ -1,8 +1,15 @@
+import numpy
 import pandas
-from copy import deepcopy
+from copy import copy
 from .base.target_data import TargetData
 from .discrete_state_trajectory import DiscreteStateTrajectory,\
-                                           DiscreteDwellSegment
+                                       DiscreteDwellSegment,\
+                                       make_trajectory_from_class_names,\
+                                       quantize_dwell_times
+from .trajectory_store import make_trajectory_store
+from .trajectory_dataset import is_trajectory_dataset,\
+                                open_trajectory_dataset,\
+                                write_trajectory_dataset
 
 
 class BlinkTargetData(TargetData):
@@ -20,6 +27,12 @@ class BlinkTargetData(TargetData):
         .
         .
 
+    Parameters
+    ----------
+    frame_period : float, optional
+        If given, dwell times are snapped to whole numbers of
+        frames of this duration when they are loaded.
+
     Attributes
     ----------
     trajectory_factory : class
@@ -31,12 +44,13 @@ class BlinkTargetData(TargetData):
     filename : string
         The trajectory data is loaded from this path.
     """
-    def __init__(self):
+    def __init__(self, frame_period=None):
         super(BlinkTargetData, self).__init__()
         self.trajectory_factory = DiscreteStateTrajectory
         self.segment_factory = DiscreteDwellSegment
         self.trajectory = None
         self.filename = None
+        self.frame_period = frame_period
 
     def __len__(self):
         return len(self.trajectory)
@@ -52,13 +66,11 @@ class BlinkTargetData(TargetData):
         """
         self.filename = data_file
         data_table = pandas.read_csv(data_file, header=0)
-        self.trajectory = self.trajectory_factory()
-        for segment_data in data_table.itertuples():
-            segment_class = str(segment_data[1])
-            segment_dwell_time = float(segment_data[2])
-            new_segment = self.segment_factory(segment_class,
-                                               segment_dwell_time)
-            self.trajectory.add_segment(new_segment)
+        dwell_times = data_table.iloc[:,1].values
+        if self.frame_period is not None:
+            dwell_times = quantize_dwell_times(dwell_times, self.frame_period)
+        self.trajectory = make_trajectory_from_class_names(
+                            data_table.iloc[:,0].values, dwell_times)
 
     def get_feature(self):
         return self.trajectory
@@ -77,6 +89,13 @@ class BlinkCollectionTargetData(TargetData):
     """
     An ensemble of trajectories.
 
+    Parameters
+    ----------
+    frame_period : float, optional
+        If given, dwell times are snapped to whole numbers of frames
+        of this duration when they are loaded, and the distinct
+        (class, dwell time) pairs of the collection are recorded.
+
     Attributes
     ----------
     trajectory_data_factory : class
@@ -86,12 +105,23 @@ class BlinkCollectionTargetData(TargetData):
     paths : list
         Each trajectory is loaded from a file. `paths` is a list
         of the paths for these files.
+    trajectory_store : TrajectoryStore
+        The segments of all trajectories. The trajectories of
+        `target_data_collection` are views of this store. Code that
+        changes `target_data_collection` directly should set this
+        to None, so that the store is rebuilt when it is next needed.
+    distinct_dwells : tuple or None
+        The result of `find_distinct_dwells` of the store, once it
+        has been computed.
     """
-    def __init__(self):
+    def __init__(self, frame_period=None):
         super(BlinkCollectionTargetData, self).__init__()
         self.trajectory_data_factory = BlinkTargetData
         self.target_data_collection = None
         self.paths = None
+        self.trajectory_store = None
+        self.frame_period = frame_period
+        self.distinct_dwells = None
 
     def __len__(self):
         return len(self.target_data_collection)
@@ -119,31 +149,131 @@ class BlinkCollectionTargetData(TargetData):
         This method returns the total number of segments across
         all trajectories in the collection.
         """
-        num_segments = 0
-        for traj in self:
-            num_segments += len(traj)
-        return num_segments
+        return self.get_trajectory_store().get_num_segments()
 
     def get_feature_by_index(self, index):
         return self.target_data_collection[index]
 
+    def get_trajectory_store(self):
+        """
+        Returns
+        -------
+        trajectory_store : TrajectoryStore
+            The store of the trajectories of this collection. It is
+            rebuilt if the number of trajectories has changed or if
+            a segment was added to one of them.
+        """
+        if self.trajectory_store is None or\
+           self.trajectory_store.is_modified or\
+           len(self.trajectory_store) != len(self.target_data_collection):
+            trajectory_store = make_trajectory_store([traj for traj in self])
+            if self.frame_period is not None:
+                trajectory_store = trajectory_store.quantize(
+                                    self.frame_period)
+            self._set_trajectory_store(trajectory_store)
+        return self.trajectory_store
+
+    def _set_trajectory_store(self, trajectory_store):
+        # point every trajectory of the collection at the new store
+        self.trajectory_store = trajectory_store
+        self.distinct_dwells = None
+        for i, blink_target in enumerate(self.target_data_collection):
+            blink_target.trajectory = trajectory_store.get_trajectory(i)
+
     def load_data(self, data_file):
         """
-        Load a trajectory and add it to the collection.
+        Load a collection of trajectories.
 
         Parameters
         ----------
         data_file : string
-            Path of file to load.
+            Either a text file that lists the path of one trajectory
+            file per line, or a trajectory dataset written by
+            `write_dataset`. Datasets are recognized by their first
+            bytes and are memory-mapped instead of parsed.
+        """
+        if is_trajectory_dataset(data_file):
+            trajectory_store, paths = open_trajectory_dataset(data_file)
+            if paths is None:
+                paths = [None] * len(trajectory_store)
+            if self.frame_period is not None:
+                trajectory_store = trajectory_store.quantize(
+                                    self.frame_period)
+            self.target_data_collection = []
+            self.paths = paths
+            for traj_path in paths:
+                trajectory_data = self.trajectory_data_factory(
+                                    self.frame_period)
+                trajectory_data.filename = traj_path
+                self.target_data_collection.append(trajectory_data)
+            self._set_trajectory_store(trajectory_store)
+        else:
+            self.target_data_collection = []
+            self.paths = []
+            for traj_path in open(data_file, 'r'):
+                traj_path = traj_path.strip()
+                trajectory_data = self.trajectory_data_factory(
+                                    self.frame_period)
+                trajectory_data.load_data(traj_path)
+                self.target_data_collection.append(trajectory_data)
+                self.paths.append(traj_path)
+            self._set_trajectory_store(make_trajectory_store(
+                                        [traj for traj in self]))
+        if self.frame_period is not None:
+            self.get_distinct_dwells()
+
+    def get_distinct_dwells(self):
+        """
+        Returns
+        -------
+        distinct_class_names : list
+        distinct_dwell_times : ndarray
+            The distinct (class, dwell time) pairs of the collection.
+        distinct_inds : ndarray
+            For each segment of the collection, the index of its pair.
+            See `TrajectoryStore.find_distinct_dwells`.
+        """
+        if self.distinct_dwells is None:
+            trajectory_store = self.get_trajectory_store()
+            class_codes, dwell_times, distinct_inds = \
+                trajectory_store.find_distinct_dwells()
+            class_names = [trajectory_store.class_name_list[class_code]
+                           for class_code in class_codes.tolist()]
+            self.distinct_dwells = (class_names, dwell_times, distinct_inds)
+        return self.distinct_dwells
+
+    def get_loader_statistics(self):
         """
-        self.target_data_collection = []
-        self.paths = []
-        for traj_path in open(data_file, 'r'):
-            traj_path = traj_path.strip()
-            trajectory_data = self.trajectory_data_factory()
-            trajectory_data.load_data(traj_path)
-            self.target_data_collection.append(trajectory_data)
-            self.paths.append(traj_path)
+        Returns
+        -------
+        statistics : dict
+            The number of trajectories, segments and distinct
+            (class, dwell time) pairs of the collection, and the
+            deduplication ratio, the number of segments per distinct
+            pair.
+        """
+        num_segments = self.get_total_number_of_trajectory_segments()
+        num_distinct_dwells = len(self.get_distinct_dwells()[1])
+        if num_distinct_dwells > 0:
+            deduplication_ratio = float(num_segments) / num_distinct_dwells
+        else:
+            deduplication_ratio = 1.0
+        return {'trajectories':len(self),
+                'segments':num_segments,
+                'distinct dwells':num_distinct_dwells,
+                'deduplication ratio':deduplication_ratio}
+
+    def write_dataset(self, dataset_file):
+        """
+        Save the collection as a trajectory dataset, which
+        `load_data` can later open without parsing.
+
+        Parameters
+        ----------
+        dataset_file : string
+        """
+        write_trajectory_dataset(dataset_file, self.get_trajectory_store(),
+                                 self.paths)
 
     def get_feature(self):
         return self.target_data_collection
@@ -171,17 +301,15 @@ class BlinkCollectionTargetData(TargetData):
         -------
         my_clone : BlinkCollectionTargetData
             New collection which contains only the selected trajectories.
+            Its trajectory store is an index view of the store of this
+            collection, so no segment data is copied.
         """
-        my_clone = deepcopy(self)
-        new_data_collection = []
-        new_paths = []
-        for i in inds:
-            this_traj = my_clone.target_data_collection[i]
-            this_path = my_clone.paths[i]
-            new_data_collection.append(this_traj)
-            new_paths.append(this_path)
-        my_clone.target_data_collection = new_data_collection
-        my_clone.paths = new_paths
+        my_clone = self.__class__(self.frame_period)
+        my_clone.target_data_collection = [
+            copy(self.target_data_collection[i]) for i in inds]
+        my_clone.paths = [self.paths[i] for i in inds]
+        my_clone._set_trajectory_store(
+            self.get_trajectory_store().select(inds))
         return my_clone
 
     def has_element(self, trajectory_to_search_for):
@@ -196,49 +324,40 @@ class BlinkCollectionTargetData(TargetData):
         return is_found
 
     def get_bright_time_distribution(self):
-        t_dist = []
-        for traj in self:
-            this_dist = traj.get_bright_time_distribution()
-            t_dist += this_dist
-        return pandas.Series(t_dist)
+        trajectory_store = self.get_trajectory_store()
+        return pandas.Series(trajectory_store.get_class_dwell_times('bright'))
 
     def get_dark_time_distribution(self, exclude_first_dwell=True,
                                    exclude_last_dwell=True):
-        t_dist = []
-        for traj in self:
-            excluded_dwells = []
-            if exclude_first_dwell:
-                excluded_dwells.append(0)
-            if exclude_last_dwell:
-                excluded_dwells.append(traj.get_last_segment_number())
-            this_dist = traj.get_dark_time_distribution(excluded_dwells)
-            t_dist += this_dist
+        trajectory_store = self.get_trajectory_store()
+        t_dist = trajectory_store.get_class_dwell_times(
+                    'dark', exclude_first_dwell, exclude_last_dwell)
         return pandas.Series(t_dist)
 
     def get_num_blink_distribution(self, exclude_first_dwell=True,
                                    exclude_last_dwell=True):
-        num_blink_dist = []
-        for traj in self:
-            excluded_dwells = []
-            if exclude_first_dwell:
-                excluded_dwells.append(0)
-            if exclude_last_dwell:
-                excluded_dwells.append(traj.get_last_segment_number())
-            this_num_blink = traj.get_num_blink(excluded_dwells)
-            num_blink_dist.append(this_num_blink)
+        trajectory_store = self.get_trajectory_store()
+        num_blink_dist = trajectory_store.count_class_segments(
+                            'dark', exclude_first_dwell, exclude_last_dwell)
         return pandas.Series(num_blink_dist)
 
     def get_bleach_time_distribution(self):
-        t_dist = []
-        for traj in self:
-            this_bleach_time = traj.get_bleach_time()
-            t_dist.append(this_bleach_time)
-        return pandas.Series(t_dist)            
+        trajectory_store = self.get_trajectory_store()
+        first_inds, last_inds = \
+            trajectory_store.get_first_and_last_segment_inds()
+        dark_code = trajectory_store.get_class_code('dark')
+        assert numpy.all(trajectory_store.class_codes[first_inds] == dark_code)
+        assert numpy.all(trajectory_store.class_codes[last_inds] == dark_code)
+        activation_times = trajectory_store.dwell_times[first_inds]
+        post_bleach_times = trajectory_store.dwell_times[last_inds]
+        t_dist = trajectory_store.compute_end_times() - activation_times -\
+                 post_bleach_times
+        return pandas.Series(t_dist)
 
     def get_activation_time_distribution(self):
-        t_dist = []
-        for traj in self:
-            this_activation_time = traj.get_activation_time()
-            t_dist.append(this_activation_time)
-        return pandas.Series(t_dist)            
-
+        trajectory_store = self.get_trajectory_store()
+        first_inds, last_inds = \
+            trajectory_store.get_first_and_last_segment_inds()
+        dark_code = trajectory_store.get_class_code('dark')
+        assert numpy.all(trajectory_store.class_codes[first_inds] == dark_code)
+        return pandas.Series(trajectory_store.dwell_times[first_inds])
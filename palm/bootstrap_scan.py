@@ -0,0 +1,216 @@
+import os
+import os.path
+import time
+import numpy
+from .blink_target_data import BlinkCollectionTargetData
+from .bootstrap_selector import BootstrapSelector
+from .local_task_manager import LocalTaskManager
+from .parameter_set_distribution import ParamSetDistFactory,\
+                                        ParameterSetDistribution
+
+
+# State of each worker process of a BootstrapScan. The trajectory
+# data is loaded once, when the worker starts, and reused for every fit.
+_worker_state = {}
+
+def _init_scan_worker(data_file):
+    target_data = BlinkCollectionTargetData()
+    target_data.load_data(data_file)
+    _worker_state['target_data'] = target_data
+
+def _run_bootstrap_fit(fit_fcn, bootstrap_id, N, bootstrap_size,
+                       random_seed, warm_start=None):
+    target_data = _worker_state['target_data']
+    # every fit of a bootstrap id uses the same resampled data
+    random_state = numpy.random.RandomState([random_seed, bootstrap_id])
+    resampled_data = BootstrapSelector().select_data(
+                        target_data, size=bootstrap_size,
+                        random_state=random_state)
+    if warm_start is None:
+        fit_N, score, parameter_set = fit_fcn(N, resampled_data)
+    else:
+        fit_N, score, parameter_set = fit_fcn(N, resampled_data,
+                                              warm_start=warm_start)
+    num_segments = resampled_data.get_total_number_of_trajectory_segments()
+    return bootstrap_id, N, score, parameter_set, num_segments
+
+
+class BootstrapScan(object):
+    """
+    Fits a model to bootstrap resamplings of a trajectory collection
+    for a range of N, the number of fluorophores. Each (bootstrap id, N)
+    fit is a task for a task manager. Finished fits are saved to a
+    checkpoint file as soon as they are collected, and fits that are
+    already in the checkpoint file are not run again, so an interrupted
+    scan can be resumed by running it again.
+
+    Parameters
+    ----------
+    fit_fcn : callable f(N, target_data)
+        Fits a model with `N` fluorophores to `target_data` and returns
+        `N`, the score and the optimized parameter set. It must be a
+        module-level function, so that it can be sent to the workers.
+    data_file : string
+        The trajectory collection, as a path list or a dataset file.
+        Each worker loads it once.
+    bootstrap_size : int
+        Number of trajectories per bootstrap resampling.
+    N_list : list
+        The values of N to fit for each bootstrap id.
+    checkpoint_file : string
+        Path of the pickled `ParameterSetDistribution` of finished fits.
+    num_processes : int, optional
+        Number of worker processes of the default task manager.
+    task_manager : TaskManager, optional
+        Defaults to a `LocalTaskManager` whose workers load `data_file`.
+    random_seed : int, optional
+        Together with the bootstrap id, determines which trajectories
+        are resampled, so that resumed scans use the same resamplings.
+    warm_start : bool, optional
+        Whether to start each fit from the results of the finished fit
+        of the same bootstrap id with the nearest N. The N values of a
+        bootstrap id are then fit one after another, in the order of
+        `N_list`, while different bootstrap ids still run in parallel.
+        `fit_fcn` must then accept a `warm_start` keyword argument, a
+        `ParameterSetDistribution` of the finished fits, which it can
+        pass on to `ScipyOptimizer.optimize_parameters`.
+    noisy : bool, optional
+
+    Attributes
+    ----------
+    psd_factory : ParamSetDistFactory
+        Holds the results of all finished fits.
+    finished_fits : set
+        The (bootstrap id, N) pairs of the finished fits.
+    """
+    def __init__(self, fit_fcn, data_file, bootstrap_size, N_list,
+                 checkpoint_file, num_processes=None, task_manager=None,
+                 random_seed=0, warm_start=False, noisy=False):
+        super(BootstrapScan, self).__init__()
+        self.fit_fcn = fit_fcn
+        self.data_file = data_file
+        self.bootstrap_size = bootstrap_size
+        self.N_list = list(N_list)
+        self.checkpoint_file = checkpoint_file
+        if task_manager is None:
+            task_manager = LocalTaskManager(
+                            num_processes,
+                            worker_initializer=_init_scan_worker,
+                            initializer_args=(data_file,))
+        self.task_manager = task_manager
+        self.random_seed = random_seed
+        self.warm_start = warm_start
+        self.noisy = noisy
+        self.psd_factory = ParamSetDistFactory()
+        self.finished_fits = set()
+        self.load_checkpoint()
+
+    def load_checkpoint(self):
+        """
+        Read the results of the fits that finished in earlier runs.
+        """
+        if not os.path.exists(self.checkpoint_file):
+            return
+        psd = ParameterSetDistribution()
+        psd.load_from_file(self.checkpoint_file)
+        for i, row in psd:
+            self.psd_factory.add_parameters_from_data_series(row)
+            self.finished_fits.add((int(row['bootstrap_id']),
+                                    int(row['N'])))
+
+    def save_checkpoint(self):
+        """
+        Write the results of all finished fits. The file is replaced
+        in one step, so an interruption cannot leave a partial file.
+        """
+        psd = self.psd_factory.make_psd()
+        psd.sort_index('bootstrap_id', is_ascending=True)
+        temp_file = self.checkpoint_file + '.tmp'
+        psd.save_to_file(temp_file)
+        os.rename(temp_file, self.checkpoint_file)
+
+    def make_psd(self):
+        return self.psd_factory.make_psd()
+
+    def run(self, bootstrap_id_list, poll_interval=1.0):
+        """
+        Run every fit that is not already finished.
+
+        Parameters
+        ----------
+        bootstrap_id_list : list of int
+        poll_interval : float, optional
+            Maximum time in seconds between checks for finished fits.
+
+        Returns
+        -------
+        num_fits : int
+            Number of fits that were run.
+        """
+        # the fits of each bootstrap id that still need to be run
+        unfinished_N_dict = {}
+        for bootstrap_id in bootstrap_id_list:
+            unfinished_N_dict[bootstrap_id] = \
+                [N for N in self.N_list
+                 if (bootstrap_id, N) not in self.finished_fits]
+        num_fits = sum([len(N_list) for N_list
+                        in unfinished_N_dict.itervalues()])
+        if num_fits == 0:
+            return 0
+        self.task_manager.start()
+        try:
+            for bootstrap_id in bootstrap_id_list:
+                if self.warm_start:
+                    # the next fit of this id is added when this one ends
+                    self._add_fit_task(bootstrap_id,
+                                       unfinished_N_dict[bootstrap_id])
+                else:
+                    while len(unfinished_N_dict[bootstrap_id]) > 0:
+                        self._add_fit_task(bootstrap_id,
+                                           unfinished_N_dict[bootstrap_id])
+            num_collected = 0
+            while num_collected < num_fits:
+                if hasattr(self.task_manager, 'wait_for_tasks'):
+                    self.task_manager.wait_for_tasks(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+                result_list = \
+                    self.task_manager.collect_results_from_completed_tasks()
+                for result in result_list:
+                    self._add_result(*result)
+                    num_collected += 1
+                    if self.warm_start:
+                        bootstrap_id = result[0]
+                        self._add_fit_task(bootstrap_id,
+                                           unfinished_N_dict[bootstrap_id])
+                if len(result_list) > 0:
+                    self.save_checkpoint()
+        finally:
+            self.task_manager.stop()
+        return num_fits
+
+    def _add_fit_task(self, bootstrap_id, unfinished_N_list):
+        # pops the next N of `unfinished_N_list`, if there is one
+        if len(unfinished_N_list) == 0:
+            return
+        N = unfinished_N_list.pop(0)
+        warm_start = None
+        if self.warm_start and\
+           any([fit[0] == bootstrap_id for fit in self.finished_fits]):
+            warm_start = self.make_psd().select_distribution(
+                            'bootstrap_id', bootstrap_id)
+        self.task_manager.add_task(
+            _run_bootstrap_fit,
+            (self.fit_fcn, bootstrap_id, N, self.bootstrap_size,
+             self.random_seed, warm_start))
+
+    def _add_result(self, bootstrap_id, N, score, parameter_set,
+                    num_segments):
+        self.psd_factory.add_parameter_set(parameter_set)
+        self.psd_factory.add_parameter('bootstrap_id', bootstrap_id)
+        self.psd_factory.add_parameter('score', score)
+        self.psd_factory.add_parameter('num segments', num_segments)
+        self.psd_factory.add_parameter('num trajs', self.bootstrap_size)
+        self.finished_fits.add((bootstrap_id, N))
+        if self.noisy:
+            print "bootstrap %d, N %d, score %.6f" % (bootstrap_id, N, score)
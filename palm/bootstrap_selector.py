@@ -7,10 +7,20 @@ class BootstrapSelector(DataSelector):
     def __init__(self):
         super(BootstrapSelector, self).__init__()
 
-    def select_data(self, target_data, size):
+    def select_data(self, target_data, size, random_state=None):
+        """
+        Parameters
+        ----------
+        target_data : TargetData
+        size : int
+            Number of elements to select.
+        random_state : int or RandomState, optional
+            Seed for the random selection, so that the same
+            sample can be drawn again.
+        """
         n = len(target_data)
         assert size <= n-1
-        bs = Bootstrap(n, 1, train_size=n-1)
+        bs = Bootstrap(n, 1, train_size=n-1, random_state=random_state)
         train_index, test_index = bs.__iter__().next()
         train_index = list(train_index)
         inds = train_index[:size]
@@ -1,6 +1,9 @@
 import numpy
 from .base.trajectory import TrajectorySegment, Trajectory
 
+CLASS_CODE_TYPE = numpy.int8
+DWELL_TIME_TYPE = numpy.float64
+
 
 def convert_class_to_signal(obs_class_name):
     """
@@ -46,39 +49,124 @@ class DiscreteDwellSegment(TrajectorySegment):
         return self.segment_duration
 
 
+def make_trajectory_from_class_names(class_names, dwell_times):
+    """
+    Parameters
+    ----------
+    class_names : sequence of string
+        The class of each segment.
+    dwell_times : sequence of float
+        The duration of each segment.
+
+    Returns
+    -------
+    trajectory : DiscreteStateTrajectory
+    """
+    class_name_list = []
+    class_code_dict = {}
+    class_codes = numpy.zeros(len(class_names), dtype=CLASS_CODE_TYPE)
+    for i, class_name in enumerate(class_names):
+        class_name = str(class_name)
+        if class_name not in class_code_dict:
+            class_code_dict[class_name] = len(class_name_list)
+            class_name_list.append(class_name)
+        class_codes[i] = class_code_dict[class_name]
+    dwell_times = numpy.array(dwell_times, dtype=DWELL_TIME_TYPE)
+    return DiscreteStateTrajectory(class_codes, dwell_times, class_name_list)
+
+
+def quantize_dwell_times(dwell_times, frame_period):
+    """
+    Snap dwell times to whole numbers of frames. Every dwell lasts at
+    least one frame.
+
+    Parameters
+    ----------
+    dwell_times : ndarray
+    frame_period : float
+        The exposure time of one frame.
+
+    Returns
+    -------
+    quantized_dwell_times : ndarray
+        A new array. Dwells with the same number of frames have
+        exactly equal durations.
+    """
+    assert frame_period > 0.0, "frame_period must be positive"
+    num_frames = numpy.maximum(
+                    numpy.round(numpy.asarray(dwell_times) / frame_period), 1.0)
+    return (num_frames * frame_period).astype(DWELL_TIME_TYPE)
+
+
 class DiscreteStateTrajectory(Trajectory):
     """
     A sequence of trajectory segments. During each segment an observation
     is made, which corresponds to one of a finite number of discrete
     aggregated classes. Each segment lasts for a finite length of time.
+    The segments are stored as an array of class codes and an array of
+    dwell times, which may be slices of the arrays of a `TrajectoryStore`.
+    Segment objects are only created when they are requested.
+
+    Parameters
+    ----------
+    class_codes : ndarray, optional
+        Index into `class_name_list` of the class of each segment.
+    dwell_times : ndarray, optional
+        The duration of each segment.
+    class_name_list : list, optional
+        The class names that the codes refer to.
 
     Attributes
     ----------
-    segment_list : list
-        The segments that make up the trajectory.
-    cumulative_time_list : list
+    class_name_list : list
+    cumulative_times : ndarray or None
         The time elapsed since the start of the trajectory.
         Element `i` is the time elapsed up to the end of segment `i`.
+        Computed when first needed.
+    trajectory_store : TrajectoryStore or None
+        The store that this trajectory is a view of. Adding a segment
+        marks the store as modified and detaches the trajectory.
     """
-    def __init__(self):
+    def __init__(self, class_codes=None, dwell_times=None,
+                 class_name_list=None):
         super(DiscreteStateTrajectory, self).__init__()
-        self.segment_list = []
-        self.cumulative_time_list = []
+        if class_codes is None:
+            class_codes = numpy.zeros(0, dtype=CLASS_CODE_TYPE)
+            dwell_times = numpy.zeros(0, dtype=DWELL_TIME_TYPE)
+            class_name_list = []
+        assert len(class_codes) == len(dwell_times)
+        # the arrays may have room for more segments than have been
+        # added; only the first `num_segments` elements are used
+        self._class_code_buffer = class_codes
+        self._dwell_time_buffer = dwell_times
+        self.num_segments = len(dwell_times)
+        self.class_name_list = class_name_list
+        self.cumulative_times = None
+        self.trajectory_store = None
+
+    def __getstate__(self):
+        # copies of a view are not views, so they leave the store out
+        state = self.__dict__.copy()
+        state['trajectory_store'] = None
+        return state
 
     def __len__(self):
-        return len(self.segment_list)
+        return self.num_segments
 
     def __str__(self):
         full_str = ""
-        for segment in self.segment_list:
+        for segment in self:
             segment_class = segment.get_class()
             segment_duration = segment.get_duration()
             full_str += "%s,%.4e\n" % (segment_class, segment_duration)
         return full_str
 
     def __iter__(self):
-        for segment in self.segment_list:
-            yield segment
+        class_codes = self.get_class_code_array().tolist()
+        dwell_times = self.get_dwell_time_array().tolist()
+        for class_code, dwell_time in zip(class_codes, dwell_times):
+            yield DiscreteDwellSegment(self.class_name_list[class_code],
+                                       dwell_time)
 
     def __eq__(self, other_trajectory):
         is_equal = True
@@ -99,37 +187,105 @@ class DiscreteStateTrajectory(Trajectory):
         ----------
         segment : TrajectorySegment
         """
-        self.segment_list.append(segment)
-        segment_duration = segment.get_duration()
-        if len(self.cumulative_time_list) == 0:
-            cumulative_time = 0.0 + segment_duration
-        else:
-            cumulative_time = self.cumulative_time_list[-1] + segment_duration
-        self.cumulative_time_list.append(cumulative_time)
+        if self.num_segments == len(self._dwell_time_buffer):
+            self._grow_buffers()
+        segment_class = segment.get_class()
+        if segment_class not in self.class_name_list:
+            assert len(self.class_name_list) < numpy.iinfo(CLASS_CODE_TYPE).max
+            self.class_name_list.append(segment_class)
+        self._class_code_buffer[self.num_segments] = \
+            self.class_name_list.index(segment_class)
+        self._dwell_time_buffer[self.num_segments] = segment.get_duration()
+        self.num_segments += 1
+        self.cumulative_times = None
+        if self.trajectory_store is not None:
+            self.trajectory_store.mark_modified()
+            self.trajectory_store = None
+
+    def _grow_buffers(self):
+        # copy rather than resize in place, so that the arrays of a
+        # store that this trajectory is a view of are never modified
+        new_size = max(16, 2 * len(self._dwell_time_buffer))
+        class_code_buffer = numpy.zeros(new_size, dtype=CLASS_CODE_TYPE)
+        dwell_time_buffer = numpy.zeros(new_size, dtype=DWELL_TIME_TYPE)
+        class_code_buffer[:self.num_segments] = self.get_class_code_array()
+        dwell_time_buffer[:self.num_segments] = self.get_dwell_time_array()
+        self._class_code_buffer = class_code_buffer
+        self._dwell_time_buffer = dwell_time_buffer
+        self.class_name_list = list(self.class_name_list)
+
+    def get_class_code_array(self):
+        return self._class_code_buffer[:self.num_segments]
+
+    def get_dwell_time_array(self):
+        return self._dwell_time_buffer[:self.num_segments]
+
+    def get_class_name_list(self):
+        return self.class_name_list
+
+    def get_class_list(self):
+        """
+        Returns
+        -------
+        class_list : list
+            The class name of each segment.
+        """
+        return [self.class_name_list[class_code] for class_code
+                in self.get_class_code_array().tolist()]
+
+    def get_cumulative_time_array(self):
+        if self.cumulative_times is None:
+            self.cumulative_times = numpy.cumsum(self.get_dwell_time_array())
+        return self.cumulative_times
 
     def get_segment(self, segment_number):
-        if segment_number < len(self.segment_list) and segment_number >= 0:
-            return self.segment_list[segment_number]
+        if segment_number < self.num_segments and segment_number >= 0:
+            class_code = self._class_code_buffer[segment_number]
+            return DiscreteDwellSegment(
+                        self.class_name_list[class_code],
+                        float(self._dwell_time_buffer[segment_number]))
         else:
             return None
 
     def get_cumulative_time(self, segment_number):
-        if segment_number < len(self.segment_list):
-            return self.cumulative_time_list[segment_number]
+        if segment_number < self.num_segments:
+            return float(self.get_cumulative_time_array()[segment_number])
         else:
             return None
 
     def get_end_time(self):
-        return self.cumulative_time_list[-1]
+        return float(self.get_cumulative_time_array()[-1])
 
     def get_last_segment_number(self):
         return len(self) - 1
 
     def reverse_iter(self):
-        reverse_range = range(len(self.segment_list))
+        reverse_range = range(self.num_segments)
         reverse_range.reverse()
         for i in reverse_range:
-            yield (i, self.segment_list[i])
+            yield (i, self.get_segment(i))
+
+    def get_class_dwell_times(self, class_name, excluded_dwells=[]):
+        """
+        Parameters
+        ----------
+        class_name : string
+        excluded_dwells : list, optional
+            Segment numbers to leave out.
+
+        Returns
+        -------
+        dwell_times : ndarray
+            Durations of the segments of `class_name`, in order.
+        """
+        if class_name not in self.class_name_list:
+            return numpy.zeros(0, dtype=DWELL_TIME_TYPE)
+        class_code = self.class_name_list.index(class_name)
+        class_mask = (self.get_class_code_array() == class_code)
+        excluded_dwells = [i for i in excluded_dwells
+                           if i >= 0 and i < self.num_segments]
+        class_mask[excluded_dwells] = False
+        return self.get_dwell_time_array()[class_mask]
 
     def to_csv_str(self):
         csv_str = "class,dwell time\n"
@@ -180,24 +336,10 @@ class DiscreteStateTrajectory(Trajectory):
         return traj_array
 
     def get_bright_time_distribution(self):
-        t_dist = []
-        for segment in self:
-            if segment.get_class() == 'bright':
-                t_dist.append(segment.get_duration())
-        return t_dist
+        return self.get_class_dwell_times('bright').tolist()
 
     def get_dark_time_distribution(self, excluded_dwells=[0,]):
-        t_dist = []
-        for i, segment in enumerate(self):
-            if i in excluded_dwells:
-                continue
-            else:
-                pass
-            if segment.get_class() == 'dark':
-                t_dist.append(segment.get_duration())
-            else:
-                pass
-        return t_dist
+        return self.get_class_dwell_times('dark', excluded_dwells).tolist()
 
     def get_num_blink(self, excluded_dwells=[0,]):
         num_blink = len(self.get_dark_time_distribution(excluded_dwells))
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+
+
+class MatrixExponentialCache(object):
+    """
+    A size-bounded, least-recently-used cache of matrix exponentials.
+    Entries are keyed by a model fingerprint, an aggregated class and
+    a dwell time. Dwell times are quantized to `time_resolution`, so
+    dwells that differ only by floating point noise share one entry.
+    The cached value is the exponential computed for the first dwell
+    time that was seen for a key.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        Maximum number of matrices kept in the cache.
+    time_resolution : float, optional
+        Dwell times are rounded to a multiple of this value
+        when building cache keys.
+
+    Attributes
+    ----------
+    entries : OrderedDict
+        Cached ``exp(Qt)`` arrays, ordered from least to most
+        recently used.
+    hits, misses : int
+        Number of lookups that did and did not find a cached matrix.
+    """
+    def __init__(self, max_size=1000, time_resolution=1e-9):
+        super(MatrixExponentialCache, self).__init__()
+        assert max_size > 0, "max_size must be positive"
+        self.max_size = max_size
+        self.time_resolution = time_resolution
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return "%d entries, %d hits, %d misses" % (len(self), self.hits,
+                                                   self.misses)
+
+    def make_key(self, fingerprint, class_name, dwell_time):
+        """
+        Parameters
+        ----------
+        fingerprint : tuple
+            Identifies the model (and its parameter values) that
+            produced the rate matrix.
+        class_name : string
+            The aggregated class of the submatrix.
+        dwell_time : float
+
+        Returns
+        -------
+        key : tuple
+        """
+        quantized_time = int(round(dwell_time / self.time_resolution))
+        return (fingerprint, class_name, quantized_time)
+
+    def get_matrix(self, key):
+        """
+        Returns
+        -------
+        expQt : ndarray or None
+            The cached matrix, or None if `key` is not in the cache.
+        """
+        expQt = self.entries.pop(key, None)
+        if expQt is None:
+            self.misses += 1
+        else:
+            # re-insert to mark this entry as most recently used
+            self.entries[key] = expQt
+            self.hits += 1
+        return expQt
+
+    def add_matrix(self, key, expQt):
+        """
+        Add a matrix to the cache, evicting the least recently used
+        entry if the cache is full. The matrix is made read-only,
+        because it will be shared by later lookups.
+        """
+        expQt.flags.writeable = False
+        self.entries[key] = expQt
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def compute_hit_rate(self):
+        num_lookups = self.hits + self.misses
+        if num_lookups == 0:
+            return 0.0
+        else:
+            return self.hits / (1. * num_lookups)
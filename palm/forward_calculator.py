@@ -1,3 +1,5 @@
+import numpy
+import scipy.sparse
 from .linalg import asym_vector_matrix_product, vector_matrix_product
 
 
@@ -9,10 +11,15 @@ class ForwardCalculator(object):
     ----------
     expm_calculator : object
         A matrix exponential calculator object.
+    expm_cache : MatrixExponentialCache, optional
+        If given, matrix exponentials computed by `compute_forward_array`
+        are stored in and reused from this cache. Calculators that
+        provide `compute_array_vexp` bypass the cache.
     """
-    def __init__(self, expm_calculator):
+    def __init__(self, expm_calculator, expm_cache=None):
         super(ForwardCalculator, self).__init__()
         self.expm_calculator = expm_calculator
+        self.expm_cache = expm_cache
 
     def compute_forward_vector(self, init_prob, rate_matrix_aa,
                                rate_matrix_ab, dwell_time):
@@ -51,6 +58,74 @@ class ForwardCalculator(object):
                         fwd_vec, rate_matrix_ab, do_alignment=True)
         return fwd_vec
 
+    def compute_forward_array(self, init_prob, rate_array_aa, rate_array_ab,
+                              dwell_time, cache_key=None):
+        """
+        Computes the same product as `compute_forward_vector`, but on
+        plain numpy arrays whose elements have already been put in a
+        consistent order, so no alignment of state ids is needed.
+
+        ``init_prob * exp(rate_array_aa * dwell_time) * rate_array_ab``
+
+        Parameters
+        ----------
+        init_prob : ndarray
+            The probability of starting in each state of aggregate `a`.
+        rate_array_aa : ndarray or sparse matrix
+            Take the exponential of this matrix.
+        rate_array_ab : ndarray, sparse matrix or None
+            Represents transitions from aggregate `a` to aggregate `b`.
+        dwell_time : float
+            The time spent in aggregate `a`.
+        cache_key : tuple, optional
+            A (model fingerprint, class name) pair that identifies
+            `rate_array_aa`. The matrix exponential is only cached
+            when a key is given.
+
+        Returns
+        -------
+        fwd_array : ndarray
+            The product of the terms, as described above.
+        """
+        if hasattr(self.expm_calculator, 'compute_array_vexp'):
+            # prefer calculators that compute the vector product directly,
+            # because they never need the dense matrix exponential
+            fwd_array = self.expm_calculator.compute_array_vexp(
+                            init_prob, rate_array_aa, dwell_time)
+        else:
+            expQt = self.compute_array_exp(rate_array_aa, dwell_time,
+                                           cache_key)
+            fwd_array = numpy.dot(init_prob, expQt)
+        if rate_array_ab is None or rate_array_ab.shape[1] == 0:
+            pass
+        elif scipy.sparse.issparse(rate_array_ab):
+            fwd_array = rate_array_ab.T.dot(fwd_array)
+        else:
+            fwd_array = numpy.dot(fwd_array, rate_array_ab)
+        return fwd_array
+
+    def compute_array_exp(self, rate_array_aa, dwell_time, cache_key=None):
+        """
+        Computes ``exp(rate_array_aa * dwell_time)``, looking it up in
+        the cache first if a cache and a `cache_key` are given.
+
+        Returns
+        -------
+        expQt : ndarray
+        """
+        if self.expm_cache is None or cache_key is None:
+            return self.expm_calculator.compute_array_exp(
+                        rate_array_aa, dwell_time)
+        fingerprint, class_name = cache_key
+        full_key = self.expm_cache.make_key(fingerprint, class_name,
+                                            dwell_time)
+        expQt = self.expm_cache.get_matrix(full_key)
+        if expQt is None:
+            expQt = self.expm_calculator.compute_array_exp(
+                        rate_array_aa, dwell_time)
+            self.expm_cache.add_matrix(full_key, expQt)
+        return expQt
+
     def compute_forward_state_series(self, init_prob, rate_matrix_aa,
                                      rate_matrix_ab, dwell_time, num_states=1):
         fwd_vec = self.compute_forward_vector(
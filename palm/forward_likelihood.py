@@ -1,12 +1,20 @@
 import numpy
+import scipy.linalg
 import pandas
 from .base.data_predictor import DataPredictor
-from .likelihood_prediction import LikelihoodPrediction
+from .likelihood_prediction import LikelihoodPrediction,\
+                                   CollectionLikelihoodPrediction
 from .forward_calculator import ForwardCalculator
-from .linalg import DiagonalExpm, vector_product
-from .probability_vector import VectorTrajectory, ProbabilityVector
-from .rate_matrix import RateMatrixTrajectory
-from .util import ALMOST_ZERO
+from .linalg import DiagonalExpm
+from .probability_vector import VectorTrajectory, ProbabilityVector,\
+                                make_prob_vec_from_panda_series
+from .rate_matrix import RateMatrixTrajectory, SparseRateMatrix,\
+                         make_rate_matrix_from_npy_array
+from .trajectory_store import make_trajectory_store
+from .transfer_matrix_table import TransferMatrixTable,\
+                                   group_distinct_dwells,\
+                                   estimate_table_bytes
+from .util import ALMOST_ZERO, DATA_TYPE
 
 
 class ForwardPredictor(DataPredictor):
@@ -35,6 +43,9 @@ class ForwardPredictor(DataPredictor):
         Probability vector is scaled at each step of the calculation
         to prevent numerical underflow and the resulting scaling factors are
         saved in this data structure.
+    transfer_table : TransferMatrixTable or None
+        The transfer matrices of the model of the last collection,
+        released when a model with other parameters is evaluated.
 
     Parameters
     ----------
@@ -45,18 +56,45 @@ class ForwardPredictor(DataPredictor):
     archive_matrices : bool, optional
         Whether to save the intermediate results of the calculation for
         later plotting, debugging, etc.
+    expm_cache : MatrixExponentialCache, optional
+        Cache for matrix exponentials, shared by every trajectory that
+        this predictor evaluates. Only used when the rate matrix
+        is not rebuilt for every segment.
+    sparse_rate_matrix : bool, optional
+        Whether to build sparse rate matrices. Pair this with a
+        calculator that accepts sparse matrices, such as
+        `ExpmMultiplyExponential`, for models with many states.
+    use_transfer_table : bool, optional
+        Whether `predict_collection` precomputes a `TransferMatrixTable`
+        for the distinct dwell times of the collection. Only used when
+        the rate matrix is not rebuilt for every segment. Works best
+        with dwell times that are quantized to frames, and with a
+        calculator that computes batches of exponentials, such as
+        `EigenMatrixExponential`.
+    max_transfer_table_bytes : int, optional
+        Collections whose table would need more memory than this
+        are evaluated without a table.
     """
     def __init__(self, expm_calculator, always_rebuild_rate_matrix,
                  archive_matrices=False, diagonal_dark=False,
-                 noisy=False):
+                 noisy=False, expm_cache=None, sparse_rate_matrix=False,
+                 use_transfer_table=False, max_transfer_table_bytes=2**28):
         super(ForwardPredictor, self).__init__()
         self.always_rebuild_rate_matrix = always_rebuild_rate_matrix
         self.archive_matrices = archive_matrices
         self.diagonal_dark = diagonal_dark
+        self.expm_cache = expm_cache
+        self.sparse_rate_matrix = sparse_rate_matrix
+        self.use_transfer_table = use_transfer_table
+        self.max_transfer_table_bytes = max_transfer_table_bytes
         diag_expm = DiagonalExpm()
-        self.forward_calculator = ForwardCalculator(expm_calculator)
-        self.diag_forward_calculator = ForwardCalculator(diag_expm)
+        self.forward_calculator = ForwardCalculator(expm_calculator,
+                                                    expm_cache)
+        self.diag_forward_calculator = ForwardCalculator(diag_expm,
+                                                         expm_cache)
         self.prediction_factory = LikelihoodPrediction
+        self.collection_prediction_factory = CollectionLikelihoodPrediction
+        self.transfer_table = None
         self.vector_trajectory = None
         self.rate_matrix_trajectory = None
         self.scaling_factor_set = None
@@ -65,16 +103,253 @@ class ForwardPredictor(DataPredictor):
     def predict_data(self, model, trajectory):
         self.scaling_factor_set = self.compute_forward_vectors(
                                     model, trajectory)
-        likelihood = 1./(self.scaling_factor_set.compute_product())
-        if likelihood < ALMOST_ZERO:
-            likelihood = ALMOST_ZERO
-        log_likelihood = numpy.log10(likelihood)
+        log_likelihood = self.scaling_factor_set.compute_log_likelihood()
         return self.prediction_factory(log_likelihood)
 
+    def predict_collection(self, model, trajectory_collection):
+        """
+        Computes the log likelihood of each trajectory of a collection.
+        With `use_transfer_table`, the transfer matrices of every
+        segment are computed first, in one batch per class.
+
+        Parameters
+        ----------
+        model : BlinkModel
+        trajectory_collection : BlinkCollectionTargetData or list
+            A collection, whose cached distinct dwells are used for
+            the table, or a list of trajectories.
+
+        Returns
+        -------
+        prediction : CollectionLikelihoodPrediction
+        """
+        if self.use_transfer_table and not self.always_rebuild_rate_matrix\
+           and not self.sparse_rate_matrix:
+            self.prepare_transfer_table(model, trajectory_collection)
+        # the collection may have rebuilt its store for the table,
+        # so its trajectories are listed afterwards
+        trajectory_list = [trajectory for trajectory in trajectory_collection]
+        log_likelihood_list = []
+        for trajectory in trajectory_list:
+            prediction = self.predict_data(model, trajectory)
+            log_likelihood_list.append(prediction.as_array()[0])
+        return self.collection_prediction_factory(
+                    numpy.array(log_likelihood_list))
+
+    def prepare_transfer_table(self, model, trajectory_collection):
+        """
+        Builds the transfer matrix table of `model` for the distinct
+        dwell times of `trajectory_collection`, unless the current
+        table already covers them. The previous table is released
+        first.
+
+        Parameters
+        ----------
+        model : BlinkModel
+        trajectory_collection : BlinkCollectionTargetData or list
+
+        Returns
+        -------
+        transfer_table : TransferMatrixTable or None
+            None if the table would be too large.
+        """
+        fingerprint = model.get_fingerprint()
+        if hasattr(trajectory_collection, 'get_distinct_dwells'):
+            class_names, dwell_times, distinct_inds = \
+                trajectory_collection.get_distinct_dwells()
+            trajectory_store = trajectory_collection.get_trajectory_store()
+        else:
+            # a plain list, like the chunk of a parallel worker
+            trajectory_store = make_trajectory_store(
+                                [traj for traj in trajectory_collection])
+            class_codes, dwell_times, distinct_inds = \
+                trajectory_store.find_distinct_dwells()
+            class_names = [trajectory_store.class_name_list[class_code]
+                           for class_code in class_codes.tolist()]
+            trajectory_store = None
+        if self.transfer_table is not None and\
+           self.transfer_table.fingerprint == fingerprint:
+            # the collection has not changed since the table was built
+            if trajectory_store is not None and\
+               self.transfer_table.trajectory_store is trajectory_store:
+                return self.transfer_table
+        else:
+            self.transfer_table = None
+        dwell_time_dict = group_distinct_dwells(class_names, dwell_times)
+        if self.transfer_table is not None:
+            if self.transfer_table.covers(dwell_time_dict):
+                return self.transfer_table
+            self.transfer_table = None
+        if estimate_table_bytes(model, dwell_time_dict) >\
+           self.max_transfer_table_bytes:
+            return None
+        rate_matrix_organizer = RateMatrixOrganizer(model)
+        rate_matrix_organizer.build_rate_matrix(time=0.0)
+        transfer_table = TransferMatrixTable(fingerprint, trajectory_store)
+        end_class_list = sorted(model.state_ids_by_class_dict.keys())
+        for start_class, class_dwell_times in dwell_time_dict.iteritems():
+            if self.diagonal_dark and start_class == 'dark':
+                forward_calculator = self.diag_forward_calculator
+            else:
+                forward_calculator = self.forward_calculator
+            transfer_table.add_class(start_class, class_dwell_times,
+                                     end_class_list,
+                                     forward_calculator.expm_calculator,
+                                     rate_matrix_organizer)
+        self.transfer_table = transfer_table
+        return transfer_table
+
+    def _get_transfer_table(self, model):
+        # a table is only valid for the parameters it was built with
+        if self.transfer_table is None or self.always_rebuild_rate_matrix\
+           or self.sparse_rate_matrix:
+            return None
+        if self.transfer_table.fingerprint != model.get_fingerprint():
+            self.transfer_table = None
+        return self.transfer_table
+
+    def predict_data_and_gradient(self, model, trajectory):
+        """
+        Computes the log likelihood of a trajectory, like `predict_data`,
+        and its gradient with respect to the model parameters.
+        A forward sweep stores the scaled vector that enters each
+        segment. A backward sweep then computes, for every segment,
+        the Frechet derivative of the matrix exponential in the
+        direction given by the forward and backward vectors. The
+        derivatives are accumulated per rate matrix element and then
+        contracted with the derivatives of the route rates.
+
+        Parameters
+        ----------
+        model : BlinkModel
+        trajectory : Trajectory
+
+        Returns
+        -------
+        prediction : LikelihoodPrediction
+        gradient : ndarray
+            Derivative of the log10 likelihood with respect to each
+            element of ``model.parameter_set.as_array()``. Parameters
+            that no rate depends on get a zero derivative.
+        """
+        segment_list = self._list_segments(trajectory)
+        rate_matrix_organizer = RateMatrixOrganizer(model)
+        rate_matrix_organizer.build_rate_matrix(time=0.0)
+        if self.expm_cache is not None and\
+           not self.always_rebuild_rate_matrix:
+            model_fingerprint = model.get_fingerprint()
+        else:
+            model_fingerprint = None
+
+        # forward sweep
+        scaling_factor_set = ScalingFactorSet(self.noisy)
+        init_prob_vec = model.get_initial_probability_vector()
+        first_class = segment_list[0][2]
+        alpha = init_prob_vec.as_aligned_npy_array(
+                    model.state_ids_by_class_dict[first_class])
+        scaling_factor_set.scale_array(alpha)
+        alpha_list = []
+        for segment_number, segment_info in enumerate(segment_list):
+            cumulative_time, segment_duration, start_class, end_class =\
+                segment_info
+            if self.always_rebuild_rate_matrix:
+                rate_matrix_organizer.build_rate_matrix(time=cumulative_time)
+            rate_array_aa = rate_matrix_organizer.get_subarray(
+                                start_class, start_class)
+            rate_array_ab = rate_matrix_organizer.get_subarray(
+                                start_class, end_class)
+            alpha_list.append(alpha)
+            alpha = self._compute_alpha(rate_array_aa, rate_array_ab,
+                                        segment_number, segment_duration,
+                                        start_class, end_class, alpha,
+                                        model_fingerprint)
+            alpha = scaling_factor_set.scale_array(alpha)
+            alpha[numpy.isnan(alpha)] = 0.
+        last_class = segment_list[-1][2]
+        final_prob_vec = model.get_final_probability_vector()
+        final_prob = final_prob_vec.as_aligned_npy_array(
+                        model.state_ids_by_class_dict[last_class])
+        total_alpha = numpy.array([numpy.dot(alpha, final_prob),])
+        scaling_factor_set.scale_array(total_alpha)
+        log_likelihood = scaling_factor_set.compute_log_likelihood()
+        prediction = self.prediction_factory(log_likelihood)
+        gradient = numpy.zeros(len(model.parameter_set.as_array()))
+        if scaling_factor_set.underflow_count > 0:
+            # some segment has (numerically) zero probability, so
+            # the likelihood is only a bound and has no useful gradient
+            return prediction, gradient
+
+        # backward sweep, accumulating the derivative of the log
+        # likelihood with respect to each element of the rate matrix,
+        # grouped by class
+        num_states = model.get_num_states()
+        sensitivity_array = numpy.zeros((num_states, num_states))
+        beta = final_prob
+        for segment_number in reversed(xrange(len(segment_list))):
+            cumulative_time, segment_duration, start_class, end_class =\
+                segment_list[segment_number]
+            if self.always_rebuild_rate_matrix:
+                rate_matrix_organizer.build_rate_matrix(time=cumulative_time)
+            rate_array_aa = rate_matrix_organizer.get_subarray(
+                                start_class, start_class)
+            rate_array_ab = rate_matrix_organizer.get_subarray(
+                                start_class, end_class)
+            if rate_array_ab is None:
+                next_beta = beta
+            else:
+                next_beta = numpy.dot(rate_array_ab, beta)
+            prev_alpha = alpha_list[segment_number]
+            # <dQ t, L(Q^T t, outer(alpha, beta))> equals
+            # alpha * L(Q t, dQ t) * beta
+            expQt_T, frechet_array = scipy.linalg.expm_frechet(
+                                        rate_array_aa.T * segment_duration,
+                                        numpy.outer(prev_alpha, next_beta))
+            expQt_beta = numpy.dot(expQt_T.T, next_beta)
+            segment_likelihood = numpy.dot(prev_alpha, expQt_beta)
+            if segment_likelihood > 0.0:
+                start_slice = model.get_class_slice(start_class)
+                sensitivity_array[start_slice, start_slice] +=\
+                    segment_duration * frechet_array / segment_likelihood
+                if rate_array_ab is not None:
+                    end_slice = model.get_class_slice(end_class)
+                    alpha_expQt = numpy.dot(expQt_T, prev_alpha)
+                    sensitivity_array[start_slice, end_slice] +=\
+                        numpy.outer(alpha_expQt, beta) / segment_likelihood
+            beta_sum = numpy.sum(expQt_beta)
+            if beta_sum > 0.0:
+                beta = expQt_beta / beta_sum
+            else:
+                beta = expQt_beta
+
+        # each route adds its rate to an off-diagonal element and
+        # subtracts it from the diagonal element of its start state
+        routes = model.compiled_routes
+        start_positions = model.class_position_array[routes.start_inds]
+        end_positions = model.class_position_array[routes.end_inds]
+        route_sensitivity = \
+            sensitivity_array[start_positions, end_positions] -\
+            sensitivity_array[start_positions, start_positions]
+        rate_gradient_array = model.compute_rate_gradient_array(
+                                routes.rate_id_list, 0.0)
+        route_gradient_array = routes.multiplicities[:,numpy.newaxis] *\
+                               rate_gradient_array[routes.rate_codes]
+        gradient = numpy.dot(route_sensitivity, route_gradient_array)
+        gradient /= numpy.log(10.)
+        return prediction, gradient
+
+    def _list_segments(self, trajectory):
+        class_list = trajectory.get_class_list()
+        end_class_list = class_list[1:] + [None]
+        return zip(trajectory.get_cumulative_time_array().tolist(),
+                   trajectory.get_dwell_time_array().tolist(),
+                   class_list, end_class_list)
+
     def compute_forward_vectors(self, model, trajectory):
         """
         Computes forward vector for each trajectory segment, starting from
         the first segment and working forward toward the last segment.
+        State ids are resolved to rate matrix positions once per model,
+        so the recursion itself runs on plain numpy arrays.
 
         Parameters
         ----------
@@ -92,30 +367,37 @@ class ForwardPredictor(DataPredictor):
             pass
         # initialize probability vector
         scaling_factor_set = ScalingFactorSet(self.noisy)
-        rate_matrix_organizer = RateMatrixOrganizer(model)
+        rate_matrix_organizer = RateMatrixOrganizer(model,
+                                                    self.sparse_rate_matrix)
         rate_matrix_organizer.build_rate_matrix(time=0.0)
-        init_prob = model.get_initial_probability_vector()
-        scaling_factor_set.scale_vector(init_prob)
+        segment_list = self._list_segments(trajectory)
+        init_prob_vec = model.get_initial_probability_vector()
+        first_class = segment_list[0][2]
+        init_prob = init_prob_vec.as_aligned_npy_array(
+                        model.state_ids_by_class_dict[first_class])
+        scaling_factor_set.scale_array(init_prob)
         if self.archive_matrices:
-            self.vector_trajectory.add_vector(0.0, init_prob)
+            self.vector_trajectory.add_vector(0.0, init_prob_vec)
         prev_alpha = init_prob
+        alpha_class = first_class
+        # exponentials may only be reused when the rate matrix
+        # does not change from one segment to the next
+        if self.expm_cache is not None and\
+           not self.always_rebuild_rate_matrix:
+            model_fingerprint = model.get_fingerprint()
+        else:
+            model_fingerprint = None
+        transfer_table = self._get_transfer_table(model)
 
         # loop through trajectory segments, compute likelihood for each segment
-        for segment_number, segment in enumerate(trajectory):
+        for segment_number, segment_info in enumerate(segment_list):
             if self.noisy:
                 print 'segment %d' % segment_number
 
-            # get current segment class and duration
-            cumulative_time = trajectory.get_cumulative_time(segment_number)
-            segment_duration = segment.get_duration()
-            start_class = segment.get_class()
-
-            # get next segment class (if there is a next one)
-            next_segment = trajectory.get_segment(segment_number + 1)
-            if next_segment:
-                end_class = next_segment.get_class()
-            else:
-                end_class = None
+            # get current segment class and duration, and the
+            # next segment class (None for the last segment)
+            cumulative_time, segment_duration, start_class, end_class =\
+                segment_info
 
             # update the rate matrix to reflect changes to
             # kinetic rates that vary with time.
@@ -124,29 +406,42 @@ class ForwardPredictor(DataPredictor):
             # skip updating the rate matrix. we should only do this when none of the rates vary with time.
             else:
                 pass
-            rate_matrix_aa = rate_matrix_organizer.get_submatrix(
+            rate_array_aa = rate_matrix_organizer.get_subarray(
                                 start_class, start_class)
-            rate_matrix_ab = rate_matrix_organizer.get_submatrix(
+            rate_array_ab = rate_matrix_organizer.get_subarray(
                                 start_class, end_class)
             if self.archive_matrices:
                 self.rate_matrix_trajectory.add_matrix(
                         rate_matrix_organizer.rate_matrix)
             else:
                 pass
-            alpha = self._compute_alpha( rate_matrix_aa, rate_matrix_ab,
-                                         segment_number, segment_duration,
-                                         start_class, end_class,
-                                         prev_alpha)
+            if transfer_table is None:
+                transfer_array = None
+            else:
+                transfer_array = transfer_table.get_transfer_array(
+                                    start_class, end_class, segment_duration)
+            if transfer_array is None:
+                alpha = self._compute_alpha( rate_array_aa, rate_array_ab,
+                                             segment_number, segment_duration,
+                                             start_class, end_class,
+                                             prev_alpha, model_fingerprint)
+            else:
+                alpha = numpy.dot(prev_alpha, transfer_array)
+            if end_class:
+                alpha_class = end_class
+            else:
+                alpha_class = start_class
 
             # scale probability vector to avoid numerical underflow
-            scaled_alpha = scaling_factor_set.scale_vector(alpha)
-            scaled_alpha.fill_na(0.)
+            scaled_alpha = scaling_factor_set.scale_array(alpha)
+            scaled_alpha[numpy.isnan(scaled_alpha)] = 0.
 
-            if scaled_alpha.is_finite() and scaled_alpha.is_positive():
+            if numpy.all(numpy.isfinite(scaled_alpha)) and\
+               numpy.all(scaled_alpha >= 0.0):
                 pass
             else:
                 print "Likelihood calculation failure"
-                print scaled_alpha
+                print self._make_prob_vec(model, scaled_alpha, alpha_class)
                 if self.archive_matrices:
                     df = self.vector_trajectory.convert_to_df()
                     output_csv = 'archived_vecs_from_crash.csv'
@@ -157,51 +452,110 @@ class ForwardPredictor(DataPredictor):
             # store handle to current alpha vector for next iteration
             prev_alpha = scaled_alpha
             if self.archive_matrices:
-                self.vector_trajectory.add_vector(cumulative_time, scaled_alpha)
+                self.vector_trajectory.add_vector(
+                    cumulative_time,
+                    self._make_prob_vec(model, scaled_alpha, alpha_class))
         # end for loop
         final_prob_vec = model.get_final_probability_vector()
-        total_alpha_scalar = vector_product(prev_alpha, final_prob_vec,
-                                            do_alignment=True)
-        total_alpha_vec = ProbabilityVector()
-        total_alpha_vec.series = pandas.Series([total_alpha_scalar,])
-        scaled_total_alpha = scaling_factor_set.scale_vector(total_alpha_vec)
+        final_prob = final_prob_vec.as_aligned_npy_array(
+                        model.state_ids_by_class_dict[alpha_class])
+        total_alpha_scalar = numpy.dot(prev_alpha, final_prob)
+        total_alpha = numpy.array([total_alpha_scalar,])
+        scaled_total_alpha = scaling_factor_set.scale_array(total_alpha)
         if self.archive_matrices:
+            total_alpha_vec = ProbabilityVector()
+            total_alpha_vec.series = pandas.Series(scaled_total_alpha)
             self.vector_trajectory.add_vector(trajectory.get_end_time(),
-                                              scaled_total_alpha)
+                                              total_alpha_vec)
         return scaling_factor_set
 
-    def _compute_alpha(self, rate_matrix_aa, rate_matrix_ab, segment_number,
-                       segment_duration, start_class, end_class, prev_alpha):
+    def _compute_alpha(self, rate_array_aa, rate_array_ab, segment_number,
+                       segment_duration, start_class, end_class, prev_alpha,
+                       model_fingerprint=None):
+        if model_fingerprint is None:
+            cache_key = None
+        else:
+            cache_key = (model_fingerprint, start_class)
         if self.diagonal_dark and start_class == 'dark':
-            alpha = self.diag_forward_calculator.compute_forward_vector(
-                        prev_alpha, rate_matrix_aa, rate_matrix_ab,
-                        segment_duration)
+            alpha = self.diag_forward_calculator.compute_forward_array(
+                        prev_alpha, rate_array_aa, rate_array_ab,
+                        segment_duration, cache_key)
         else:
-            alpha = self.forward_calculator.compute_forward_vector(
-                        prev_alpha, rate_matrix_aa, rate_matrix_ab,
-                        segment_duration)
+            alpha = self.forward_calculator.compute_forward_array(
+                        prev_alpha, rate_array_aa, rate_array_ab,
+                        segment_duration, cache_key)
         return alpha
 
+    def _make_prob_vec(self, model, alpha, class_name):
+        class_ids = model.state_ids_by_class_dict[class_name].as_list()
+        alpha_series = pandas.Series(alpha, index=class_ids)
+        return make_prob_vec_from_panda_series(alpha_series)
+
 
 class ScalingFactorSet(object):
+    """
+    Accumulates the factors that rescale the forward vectors at each
+    step of the forward algorithm. Only the running sum of their
+    log10 values is kept, so memory use does not grow with the length
+    of the trajectory and the product of the factors cannot overflow.
+
+    Attributes
+    ----------
+    log_factor_sum : float
+        Sum of the log10 scaling factors.
+    num_factors : int
+    underflow_count : int
+        Number of vectors whose sum was below `ALMOST_ZERO`.
+        Those vectors were scaled by ``1/ALMOST_ZERO``.
+    """
     def __init__(self, noisy):
-        self.factor_list = []
+        self.log_factor_sum = 0.0
+        self.num_factors = 0
+        self.underflow_count = 0
         self.noisy = noisy
     def __len__(self):
-        return len(self.factor_list)
+        return self.num_factors
     def __str__(self):
-        return str(self.factor_list)
-    def get_factor_set(self):
-        return self.factor_list
+        return "%d factors, log10 sum %.6f" % (self.num_factors,
+                                               self.log_factor_sum)
     def append(self, factor):
-        self.factor_list.append(factor)
+        self.log_factor_sum += numpy.log10(factor)
+        self.num_factors += 1
     def compute_product(self):
-        scaling_factor_array = numpy.array(self.factor_list)
-        return numpy.prod(scaling_factor_array)
+        return 10**self.log_factor_sum
+    def compute_log_likelihood(self):
+        """
+        The likelihood is the inverse of the product of the factors.
+
+        Returns
+        -------
+        log_likelihood : float
+            The log10 likelihood.
+        """
+        return -self.log_factor_sum
+    def scale_array(self, array):
+        """
+        Scales a numpy array in place so that its elements sum to one.
+        NaN elements are ignored when computing the sum.
+        """
+        array_sum = numpy.nansum(array)
+        if array_sum < ALMOST_ZERO:
+            this_scaling_factor = 1./ALMOST_ZERO
+            self.underflow_count += 1
+        else:
+            this_scaling_factor = 1./array_sum
+        array *= this_scaling_factor
+        self.append(this_scaling_factor)
+        if self.noisy:
+            print 'vector'
+            print array
+            print 'scaling_factor:', this_scaling_factor
+        return array
     def scale_vector(self, vector):
         vector_sum = vector.sum_vector()
         if vector_sum < ALMOST_ZERO:
             this_scaling_factor = 1./ALMOST_ZERO
+            self.underflow_count += 1
         else:
             this_scaling_factor = 1./vector_sum
         vector.scale_vector(this_scaling_factor)
@@ -215,26 +569,81 @@ class ScalingFactorSet(object):
 
 class RateMatrixOrganizer(object):
     """
-    Helper class for building rate matrices.
+    Helper class for building rate matrices. Each rate matrix is also
+    kept with its states grouped by class, so that the rates between
+    two classes are a contiguous block.
 
     Parameters
     ----------
     model : AggregatedKineticModel
         The model from which to build the rate matrix.
+    sparse : bool, optional
+        Whether to build a SparseRateMatrix. The subarrays are
+        then scipy sparse matrices instead of numpy arrays.
+
+    Attributes
+    ----------
+    rate_matrix : RateMatrix or SparseRateMatrix
+    grouped_rate_array : ndarray or csr_matrix
+        The rate matrix, grouped by `model.group_rate_array`.
     """
-    def __init__(self, model):
+    def __init__(self, model, sparse=False):
         super(RateMatrixOrganizer, self).__init__()
         self.model = model
+        self.sparse = sparse
         self.rate_matrix = None
+        self.grouped_rate_array = None
+        self.sparse_block_dict = {}
 
     def build_rate_matrix(self, time):
-        self.rate_matrix = self.model.build_rate_matrix(time=time)
+        self.rate_matrix = self.model.build_rate_matrix(time=time,
+                                                        sparse=self.sparse)
+        if isinstance(self.rate_matrix, SparseRateMatrix):
+            rate_array = self.rate_matrix.as_sparse_array()
+        else:
+            rate_array = numpy.asarray(self.rate_matrix.as_npy_array(),
+                                       dtype=DATA_TYPE)
+        self.grouped_rate_array = self.model.group_rate_array(rate_array)
+        self.sparse_block_dict = {}
         return
 
     def get_submatrix(self, start_class, end_class):
         if start_class and end_class:
-            submatrix = self.model.get_submatrix(
-                            self.rate_matrix, start_class, end_class)
+            subarray = self.get_subarray(start_class, end_class)
+            start_ids = self.model.state_ids_by_class_dict[start_class]
+            end_ids = self.model.state_ids_by_class_dict[end_class]
+            if self.sparse:
+                submatrix = SparseRateMatrix(subarray, start_ids.as_list(),
+                                             end_ids.as_list())
+            else:
+                submatrix = make_rate_matrix_from_npy_array(
+                                subarray, start_ids, end_ids)
         else:
             submatrix = None
         return submatrix
+
+    def get_subarray(self, start_class, end_class):
+        """
+        Returns
+        -------
+        subarray : ndarray, sparse matrix or None
+            Rates from the states of `start_class` to the states of
+            `end_class`, ordered by the model's class state ids.
+            Dense subarrays are views of `grouped_rate_array`, so
+            they must not be modified.
+        """
+        if not (start_class and end_class):
+            return None
+        start_slice = self.model.get_class_slice(start_class)
+        end_slice = self.model.get_class_slice(end_class)
+        if self.sparse:
+            # sparse blocks are copies, so each is made once per matrix
+            block_key = (start_class, end_class)
+            subarray = self.sparse_block_dict.get(block_key, None)
+            if subarray is None:
+                subarray = self.grouped_rate_array[start_slice,:]\
+                                                  [:,end_slice]
+                self.sparse_block_dict[block_key] = subarray
+        else:
+            subarray = self.grouped_rate_array[start_slice, end_slice]
+        return subarray
@@ -1,3 +1,6 @@
+import copy
+import multiprocessing
+import numpy
 from .base.judge import Judge
 
 
@@ -18,6 +21,23 @@ class LikelihoodJudge(Judge):
         score = -log_likelihood
         return score
 
+    def judge_prediction_and_gradient(self, model, data_predictor,
+                                      target_data):
+        """
+        Returns
+        -------
+        score : float
+        score_gradient : ndarray
+            Derivative of the score with respect to each element
+            of ``model.parameter_set.as_array()``.
+        """
+        feature = target_data.get_feature()
+        prediction, gradient = data_predictor.predict_data_and_gradient(
+                                    model, feature)
+        score = -prediction.as_array()[0]
+        score_gradient = -gradient
+        return score, score_gradient
+
 
 class CollectionLikelihoodJudge(Judge):
     """
@@ -31,11 +51,17 @@ class CollectionLikelihoodJudge(Judge):
     def judge_prediction(self, model, data_predictor, target_data):
         # pdb.set_trace()
         total_log_likelihood = 0.0
-        for i, trajectory in enumerate(target_data):
-            prediction = data_predictor.predict_data(model, trajectory)
-            prediction_array = prediction.as_array()
-            log_likelihood = prediction_array[0]
-            total_log_likelihood += log_likelihood
+        if hasattr(data_predictor, 'predict_collection'):
+            # predictors that evaluate the whole collection at once
+            prediction = data_predictor.predict_collection(model,
+                                                           target_data)
+            total_log_likelihood = numpy.sum(prediction.as_array())
+        else:
+            for i, trajectory in enumerate(target_data):
+                prediction = data_predictor.predict_data(model, trajectory)
+                prediction_array = prediction.as_array()
+                log_likelihood = prediction_array[0]
+                total_log_likelihood += log_likelihood
         avg_log_likelihood = total_log_likelihood / len(target_data)
         score = -avg_log_likelihood
 
@@ -43,3 +69,203 @@ class CollectionLikelihoodJudge(Judge):
         # pdb.set_trace()
 
         return score
+
+    def judge_prediction_and_gradient(self, model, data_predictor,
+                                      target_data):
+        """
+        Returns
+        -------
+        score : float
+        score_gradient : ndarray
+            Derivative of the score with respect to each element
+            of ``model.parameter_set.as_array()``.
+        """
+        total_log_likelihood = 0.0
+        total_gradient = 0.0
+        for i, trajectory in enumerate(target_data):
+            prediction, gradient = data_predictor.predict_data_and_gradient(
+                                        model, trajectory)
+            total_log_likelihood += prediction.as_array()[0]
+            total_gradient += gradient
+        score = -total_log_likelihood / len(target_data)
+        score_gradient = -total_gradient / len(target_data)
+        return score, score_gradient
+
+
+# State of each worker process of a ParallelCollectionLikelihoodJudge.
+# It is set once, when the worker starts, and reused for every call.
+_worker_state = {}
+
+def _init_likelihood_worker(model, data_predictor, trajectory_list,
+                            chunk_list):
+    _worker_state['parameter_set'] = copy.deepcopy(model.parameter_set)
+    _worker_state['model'] = model.bind_parameter_set(
+                                _worker_state['parameter_set'])
+    _worker_state['data_predictor'] = data_predictor
+    _worker_state['trajectory_list'] = trajectory_list
+    _worker_state['chunk_list'] = chunk_list
+
+def _compute_chunk_log_likelihood(task):
+    parameter_array, chunk_index = task
+    _worker_state['parameter_set'].update_from_array(parameter_array)
+    model = _worker_state['model']
+    data_predictor = _worker_state['data_predictor']
+    trajectory_list = _worker_state['trajectory_list']
+    chunk_inds = _worker_state['chunk_list'][chunk_index]
+    if hasattr(data_predictor, 'predict_collection'):
+        prediction = data_predictor.predict_collection(
+                        model, [trajectory_list[i] for i in chunk_inds])
+        return numpy.sum(prediction.as_array())
+    chunk_log_likelihood = 0.0
+    for i in chunk_inds:
+        prediction = data_predictor.predict_data(model, trajectory_list[i])
+        chunk_log_likelihood += prediction.as_array()[0]
+    return chunk_log_likelihood
+
+def _compute_chunk_log_likelihood_and_gradient(task):
+    parameter_array, chunk_index = task
+    _worker_state['parameter_set'].update_from_array(parameter_array)
+    model = _worker_state['model']
+    data_predictor = _worker_state['data_predictor']
+    trajectory_list = _worker_state['trajectory_list']
+    chunk_log_likelihood = 0.0
+    chunk_gradient = numpy.zeros(len(parameter_array))
+    for i in _worker_state['chunk_list'][chunk_index]:
+        prediction, gradient = data_predictor.predict_data_and_gradient(
+                                    model, trajectory_list[i])
+        chunk_log_likelihood += prediction.as_array()[0]
+        chunk_gradient += gradient
+    return chunk_log_likelihood, chunk_gradient
+
+
+class ParallelCollectionLikelihoodJudge(Judge):
+    """
+    Computes the same score as CollectionLikelihoodJudge, but splits
+    the trajectories of the collection across a pool of worker
+    processes. The workers are started on the first call and keep the
+    model topology, the data predictor and the trajectories in memory,
+    so later calls only send the parameter array to each worker. The
+    pool is restarted if the model topology, the data predictor or the
+    collection changes.
+
+    Parameters
+    ----------
+    num_processes : int, optional
+        Size of the pool. Defaults to the number of cpus.
+    chunks_per_process : int, optional
+        The trajectories are divided into this many chunks per worker,
+        balanced by number of segments, so that fast workers can pick
+        up the remaining chunks.
+
+    Attributes
+    ----------
+    pool : multiprocessing.Pool
+    chunk_list : list
+        Indices of the trajectories of each chunk.
+    """
+    def __init__(self, num_processes=None, chunks_per_process=2):
+        super(ParallelCollectionLikelihoodJudge, self).__init__()
+        if num_processes is None:
+            num_processes = multiprocessing.cpu_count()
+        self.num_processes = num_processes
+        self.chunks_per_process = chunks_per_process
+        self.pool = None
+        self.pool_key = None
+        self.chunk_list = None
+
+    def __del__(self):
+        self.close()
+
+    def judge_prediction(self, model, data_predictor, target_data):
+        task_list = self._prepare_tasks(model, data_predictor, target_data)
+        chunk_log_likelihoods = self.pool.map(_compute_chunk_log_likelihood,
+                                              task_list)
+        total_log_likelihood = sum(chunk_log_likelihoods)
+        avg_log_likelihood = total_log_likelihood / len(target_data)
+        score = -avg_log_likelihood
+        return score
+
+    def judge_prediction_and_gradient(self, model, data_predictor,
+                                      target_data):
+        """
+        Returns
+        -------
+        score : float
+        score_gradient : ndarray
+            Derivative of the score with respect to each element
+            of ``model.parameter_set.as_array()``.
+        """
+        task_list = self._prepare_tasks(model, data_predictor, target_data)
+        chunk_results = self.pool.map(
+                            _compute_chunk_log_likelihood_and_gradient,
+                            task_list)
+        total_log_likelihood = sum([r[0] for r in chunk_results])
+        total_gradient = sum([r[1] for r in chunk_results])
+        score = -total_log_likelihood / len(target_data)
+        score_gradient = -total_gradient / len(target_data)
+        return score, score_gradient
+
+    def close(self):
+        """
+        Shut down the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+        self.pool = None
+        self.pool_key = None
+
+    def _prepare_tasks(self, model, data_predictor, target_data):
+        pool_key = self._make_pool_key(model, data_predictor, target_data)
+        if self.pool is None or not self._matches_pool_key(pool_key):
+            self._start_pool(model, data_predictor, target_data)
+            self.pool_key = pool_key
+        parameter_array = model.parameter_set.as_array()
+        task_list = [(parameter_array, i) for i in xrange(len(self.chunk_list))]
+        return task_list
+
+    def _make_pool_key(self, model, data_predictor, target_data):
+        # the key holds the predictor, the collection and its trajectory
+        # store themselves, rather than their ids, which may be reused
+        # by other objects once these are garbage collected
+        if hasattr(target_data, 'get_trajectory_store'):
+            trajectory_store = target_data.get_trajectory_store()
+        else:
+            trajectory_store = None
+        return (model.get_topology_key(), len(target_data), data_predictor,
+                target_data, trajectory_store)
+
+    def _matches_pool_key(self, pool_key):
+        topology_key, num_trajectories = pool_key[:2]
+        if (topology_key, num_trajectories) != self.pool_key[:2]:
+            return False
+        for this_object, pool_object in zip(pool_key[2:], self.pool_key[2:]):
+            if this_object is not pool_object:
+                return False
+        return True
+
+    def _start_pool(self, model, data_predictor, target_data):
+        self.close()
+        trajectory_list = [trajectory for trajectory in target_data]
+        num_chunks = min(len(trajectory_list),
+                         self.num_processes * self.chunks_per_process)
+        self.chunk_list = self._make_chunks(trajectory_list, num_chunks)
+        self.pool = multiprocessing.Pool(
+                        self.num_processes, _init_likelihood_worker,
+                        (model, data_predictor, trajectory_list,
+                         self.chunk_list))
+
+    def _make_chunks(self, trajectory_list, num_chunks):
+        # assign the longest trajectories first, each to the chunk
+        # with the fewest segments so far
+        chunk_list = [[] for i in xrange(num_chunks)]
+        chunk_sizes = [0] * num_chunks
+        order = sorted(xrange(len(trajectory_list)),
+                       key=lambda i: len(trajectory_list[i]), reverse=True)
+        for i in order:
+            smallest_chunk = chunk_sizes.index(min(chunk_sizes))
+            chunk_list[smallest_chunk].append(i)
+            chunk_sizes[smallest_chunk] += len(trajectory_list[i])
+        for chunk in chunk_list:
+            chunk.sort()
+        return chunk_list
@@ -28,3 +28,28 @@ class LikelihoodPrediction(Prediction):
     def compute_difference(self, other_likelihood):
         return self.likelihood - other_likelihood.likelihood
 
+
+
+class CollectionLikelihoodPrediction(Prediction):
+    """
+    The log likelihoods of each trajectory of a collection.
+
+    Parameters
+    ----------
+    log_likelihood_array : ndarray
+    """
+    def __init__(self, log_likelihood_array):
+        super(CollectionLikelihoodPrediction, self).__init__()
+        self.log_likelihood_array = log_likelihood_array
+
+    def __len__(self):
+        return len(self.log_likelihood_array)
+
+    def __str__(self):
+        return str(self.log_likelihood_array)
+
+    def as_array(self):
+        return self.log_likelihood_array
+
+    def compute_total_log_likelihood(self):
+        return numpy.sum(self.log_likelihood_array)
@@ -1,8 +1,13 @@
 import numpy
+import scipy.linalg
+import scipy.sparse
+from collections import OrderedDict
 from scipy.linalg import expm, expm2
+from scipy.sparse.linalg import expm_multiply
 from pandas import Series
 from .probability_vector import make_prob_vec_from_panda_series
 from .probability_matrix import make_prob_matrix_from_panda_data_frame
+from .rate_matrix import SparseRateMatrix
 
 
 def vector_product(vec1, vec2, do_alignment=True):
@@ -31,7 +36,7 @@ def vector_matrix_product(vec, matrix, do_alignment=True):
     Parameters
     ----------
     vec : ProbabilityVector
-    matrix : RateMatrix or ProbabilityMatrix
+    matrix : RateMatrix, SparseRateMatrix or ProbabilityMatrix
     do_alignment : bool, optional
         Whether to align the elements of the vector and matrix
         before computing the dot product.
@@ -40,6 +45,8 @@ def vector_matrix_product(vec, matrix, do_alignment=True):
     -------
     product_vec : ProbabilityVector
     """
+    if isinstance(matrix, SparseRateMatrix):
+        return _sparse_vector_matrix_product(vec, matrix, do_alignment)
     if do_alignment:
         alignment_results = matrix.data_frame.align(
                                 vec.series, axis=0, join='left')
@@ -60,7 +67,7 @@ def matrix_vector_product(matrix, vec, do_alignment=True):
 
     Parameters
     ----------
-    matrix : RateMatrix or ProbabilityMatrix
+    matrix : RateMatrix, SparseRateMatrix or ProbabilityMatrix
     vec : ProbabilityVector
     do_alignment : bool, optional
         Whether to align the elements of the matrix and the vector
@@ -70,6 +77,8 @@ def matrix_vector_product(matrix, vec, do_alignment=True):
     -------
     product_vec : ProbabilityVector
     """
+    if isinstance(matrix, SparseRateMatrix):
+        return _sparse_matrix_vector_product(matrix, vec, do_alignment)
     if do_alignment:
         alignment_results = matrix.data_frame.align(
                                 vec.series, axis=1, join='right')
@@ -93,7 +102,7 @@ def asym_vector_matrix_product(vec, matrix, do_alignment=True):
     Parameters
     ----------
     vec : ProbabilityVector
-    matrix : RateMatrix or ProbabilityMatrix
+    matrix : RateMatrix, SparseRateMatrix or ProbabilityMatrix
     do_alignment : bool, optional
         Whether to align the elements of the vector with the rows of the
         matrix before computing the dot product.
@@ -102,6 +111,8 @@ def asym_vector_matrix_product(vec, matrix, do_alignment=True):
     -------
     product_vec : ProbabilityVector
     """
+    if isinstance(matrix, SparseRateMatrix):
+        return _sparse_vector_matrix_product(vec, matrix, do_alignment)
     if do_alignment:
         alignment_results = matrix.data_frame.align(
                                 vec.series, axis=0, join='left')
@@ -121,7 +132,7 @@ def asym_matrix_vector_product(matrix, vec, do_alignment=True):
 
     Parameters
     ----------
-    matrix : RateMatrix or ProbabilityMatrix
+    matrix : RateMatrix, SparseRateMatrix or ProbabilityMatrix
     vec : ProbabilityVector
     do_alignment : bool, optional
         Whether to align the elements of the vector with the columns of the
@@ -131,6 +142,8 @@ def asym_matrix_vector_product(matrix, vec, do_alignment=True):
     -------
     product_vec : ProbabilityVector
     """
+    if isinstance(matrix, SparseRateMatrix):
+        return _sparse_matrix_vector_product(matrix, vec, do_alignment)
     if do_alignment:
         alignment_results = matrix.data_frame.align(
                                 vec.series, axis=1, join='right')
@@ -142,6 +155,32 @@ def asym_matrix_vector_product(matrix, vec, do_alignment=True):
     product_vec = make_prob_vec_from_panda_series(product_series)
     return product_vec
 
+def _sparse_vector_matrix_product(vec, matrix, do_alignment):
+    """
+    Computes ``vec * matrix`` for a SparseRateMatrix. When aligning,
+    states missing from the vector are given zero probability.
+    """
+    if do_alignment:
+        series = vec.series.reindex(matrix.index_id_list).fillna(0.0)
+    else:
+        series = vec.series
+    product_array = matrix.csr_matrix.T.dot(numpy.asarray(series.values))
+    product_series = Series(product_array, index=matrix.column_id_list)
+    return make_prob_vec_from_panda_series(product_series)
+
+def _sparse_matrix_vector_product(matrix, vec, do_alignment):
+    """
+    Computes ``matrix * vec`` for a SparseRateMatrix. When aligning,
+    states missing from the vector are given zero probability.
+    """
+    if do_alignment:
+        series = vec.series.reindex(matrix.column_id_list).fillna(0.0)
+    else:
+        series = vec.series
+    product_array = matrix.csr_matrix.dot(numpy.asarray(series.values))
+    product_series = Series(product_array, index=matrix.index_id_list)
+    return make_prob_vec_from_panda_series(product_series)
+
 def symmetric_matrix_matrix_product(matrix1, matrix2, do_alignment=True):
     """
     Compute the dot product of two symmetric matrices.
@@ -193,6 +232,32 @@ def asymmetric_matrix_matrix_product(matrix1, matrix2, do_alignment=True):
     return product_matrix
 
 
+def compute_array_exp_batch(expm_calculator, Q, dwell_times):
+    """
+    Computes ``exp(Qt)`` for each of several dwell times. Calculators
+    with a `compute_array_exp_batch` method compute them in one
+    vectorized pass; others compute them one at a time.
+
+    Parameters
+    ----------
+    expm_calculator : MatrixExponential
+    Q : ndarray or sparse matrix
+    dwell_times : ndarray
+
+    Returns
+    -------
+    expQt_array : ndarray
+        Element ``[k]`` is ``exp(Q * dwell_times[k])``.
+    """
+    if hasattr(expm_calculator, 'compute_array_exp_batch'):
+        return expm_calculator.compute_array_exp_batch(Q, dwell_times)
+    num_states = Q.shape[0]
+    expQt_array = numpy.zeros((len(dwell_times), num_states, num_states))
+    for k, dwell_time in enumerate(dwell_times):
+        expQt_array[k] = expm_calculator.compute_array_exp(Q, dwell_time)
+    return expQt_array
+
+
 class StubExponential(object):
     """
     This matrix exponential class is designed for code profiling.
@@ -233,11 +298,28 @@ class ScipyMatrixExponential(object):
         expQt_matrix : RateMatrix
         """
         Q = rate_matrix.as_npy_array()
-        expQt = expm(Q * dwell_time)
+        expQt = self.compute_array_exp(Q, dwell_time)
         expQt_matrix = rate_matrix.copy()
         expQt_matrix.data_frame.values[:,:] = expQt
         return expQt_matrix
 
+    def compute_array_exp(self, Q, dwell_time):
+        """
+        Computes ``exp(Qt)`` for a numpy array or scipy sparse matrix.
+
+        Parameters
+        ----------
+        Q : ndarray or sparse matrix
+        dwell_time : float
+
+        Returns
+        -------
+        expQt : ndarray
+        """
+        if scipy.sparse.issparse(Q):
+            Q = Q.toarray()
+        return expm(Q * dwell_time)
+
     def compute_matrix_expv(self, rate_matrix, dwell_time, vec):
         """
         Computes ``exp(Qt) * vec``
@@ -279,11 +361,28 @@ class ScipyMatrixExponential2(object):
         expQt_matrix : RateMatrix
         """
         Q = rate_matrix.as_npy_array()
-        expQt = expm2(Q * dwell_time)
+        expQt = self.compute_array_exp(Q, dwell_time)
         expQt_matrix = rate_matrix.copy()
         expQt_matrix.data_frame.values[:,:] = expQt
         return expQt_matrix
 
+    def compute_array_exp(self, Q, dwell_time):
+        """
+        Computes ``exp(Qt)`` for a numpy array or scipy sparse matrix.
+
+        Parameters
+        ----------
+        Q : ndarray or sparse matrix
+        dwell_time : float
+
+        Returns
+        -------
+        expQt : ndarray
+        """
+        if scipy.sparse.issparse(Q):
+            Q = Q.toarray()
+        return expm2(Q * dwell_time)
+
     def compute_matrix_expv(self, rate_matrix, dwell_time, vec):
         """
         Computes ``exp(Qt) * vec``
@@ -326,7 +425,107 @@ class DiagonalExpm(object):
         expQt_matrix : RateMatrix
         """
         Q = rate_matrix.as_npy_array()
-        expQt = numpy.diag( numpy.exp(Q.diagonal() * dwell_time) )
+        expQt = self.compute_array_exp(Q, dwell_time)
+        expQt_matrix = rate_matrix.copy()
+        expQt_matrix.data_frame.values[:,:] = expQt
+        return expQt_matrix
+
+    def compute_array_exp(self, Q, dwell_time):
+        """
+        Computes ``exp(Qt)`` for a numpy array or scipy sparse matrix.
+
+        Parameters
+        ----------
+        Q : ndarray or sparse matrix
+        dwell_time : float
+
+        Returns
+        -------
+        expQt : ndarray
+        """
+        return numpy.diag( numpy.exp(Q.diagonal() * dwell_time) )
+
+    def compute_array_exp_batch(self, Q, dwell_times):
+        """
+        Computes ``exp(Qt)`` for each of several dwell times.
+
+        Returns
+        -------
+        expQt_array : ndarray
+            Element ``[k]`` is ``exp(Q * dwell_times[k])``.
+        """
+        num_states = Q.shape[0]
+        diagonal_inds = numpy.arange(num_states)
+        expQt_array = numpy.zeros((len(dwell_times), num_states, num_states))
+        expQt_array[:, diagonal_inds, diagonal_inds] = numpy.exp(
+            numpy.outer(dwell_times, Q.diagonal()))
+        return expQt_array
+
+    def compute_matrix_expv(self, rate_matrix, dwell_time, vec):
+        """
+        Computes ``exp(Qt) * vec``
+
+        Parameters
+        ----------
+        rate_matrix : RateMatrix
+        dwell_time : float
+        vec : ProbabilityVector
+
+        Returns
+        -------
+        expv : ProbabilityVector
+        """
+        expQt_matrix = self.compute_matrix_exp(rate_matrix, dwell_time)
+        expv = matrix_vector_product(expQt_matrix, vec, do_alignment=True)
+        return expv
+
+
+class EigenMatrixExponential(object):
+    """
+    Compute matrix exponential from an eigen-decomposition that is
+    reused for every dwell time. Each distinct rate matrix is
+    diagonalized once, ``Q = V diag(w) V^-1``, after which
+    ``vec * exp(Qt)`` costs O(n^2) instead of the O(n^3) of a full
+    matrix exponential. Matrices whose eigenvectors are ill-conditioned
+    (e.g. defective matrices) fall back to the pade approximation.
+
+    Parameters
+    ----------
+    max_condition_number : float, optional
+        Decompositions whose eigenvector matrix has a larger condition
+        number are considered unreliable.
+    max_decompositions : int, optional
+        Number of decompositions to keep. The least recently used
+        decomposition is discarded first.
+
+    Attributes
+    ----------
+    decomposition_dict : OrderedDict
+        Decompositions indexed by the shape and bytes of the matrix.
+        Values are (Q, w, V, V_inv) tuples, with `w` set to None for
+        matrices that use the pade fallback.
+    """
+    def __init__(self, max_condition_number=1e8, max_decompositions=16):
+        super(EigenMatrixExponential, self).__init__()
+        self.max_condition_number = max_condition_number
+        self.max_decompositions = max_decompositions
+        self.decomposition_dict = OrderedDict()
+
+    def compute_matrix_exp(self, rate_matrix, dwell_time):
+        """
+        Computes ``exp(Qt)``
+
+        Parameters
+        ----------
+        rate_matrix : RateMatrix
+        dwell_time : float
+
+        Returns
+        -------
+        expQt_matrix : RateMatrix
+        """
+        Q = rate_matrix.as_npy_array()
+        expQt = self.compute_array_exp(Q, dwell_time)
         expQt_matrix = rate_matrix.copy()
         expQt_matrix.data_frame.values[:,:] = expQt
         return expQt_matrix
@@ -348,3 +547,196 @@ class DiagonalExpm(object):
         expQt_matrix = self.compute_matrix_exp(rate_matrix, dwell_time)
         expv = matrix_vector_product(expQt_matrix, vec, do_alignment=True)
         return expv
+
+    def compute_array_exp(self, Q, dwell_time):
+        """
+        Computes ``exp(Qt)`` for a numpy array or scipy sparse matrix.
+
+        Parameters
+        ----------
+        Q : ndarray or sparse matrix
+        dwell_time : float
+
+        Returns
+        -------
+        expQt : ndarray
+        """
+        Q, w, V, V_inv = self.get_decomposition(Q)
+        if w is None:
+            return expm(Q * dwell_time)
+        expQt = numpy.dot(V * numpy.exp(w * dwell_time), V_inv)
+        return expQt.real
+
+    def compute_array_exp_batch(self, Q, dwell_times):
+        """
+        Computes ``exp(Qt)`` for each of several dwell times from one
+        decomposition, as a batch of ``V diag(exp(wt)) V^-1`` products.
+
+        Returns
+        -------
+        expQt_array : ndarray
+            Element ``[k]`` is ``exp(Q * dwell_times[k])``.
+        """
+        Q, w, V, V_inv = self.get_decomposition(Q)
+        if w is None:
+            return numpy.array([expm(Q * dwell_time)
+                                for dwell_time in dwell_times])
+        exp_wt = numpy.exp(numpy.outer(dwell_times, w))
+        expQt_array = numpy.dot(V[numpy.newaxis,:,:] *\
+                                exp_wt[:,numpy.newaxis,:], V_inv)
+        return expQt_array.real
+
+    def compute_array_vexp(self, vec, Q, dwell_time):
+        """
+        Computes ``vec * exp(Qt)`` without forming ``exp(Qt)``.
+
+        Parameters
+        ----------
+        vec : ndarray
+            A row vector.
+        Q : ndarray or sparse matrix
+        dwell_time : float
+
+        Returns
+        -------
+        vexp : ndarray
+        """
+        Q, w, V, V_inv = self.get_decomposition(Q)
+        if w is None:
+            return numpy.dot(vec, expm(Q * dwell_time))
+        vexp = numpy.dot(numpy.dot(vec, V) * numpy.exp(w * dwell_time), V_inv)
+        return vexp.real
+
+    def get_decomposition(self, Q):
+        """
+        Look up the decomposition of `Q`, computing it if necessary.
+
+        Returns
+        -------
+        Q, w, V, V_inv : ndarray
+            `w` is None if `Q` should not be exponentiated via
+            its eigen-decomposition.
+        """
+        if scipy.sparse.issparse(Q):
+            Q = Q.toarray()
+        key = (Q.shape, Q.tostring())
+        decomposition = self.decomposition_dict.pop(key, None)
+        if decomposition is None:
+            decomposition = self._decompose(Q)
+        self.decomposition_dict[key] = decomposition
+        while len(self.decomposition_dict) > self.max_decompositions:
+            self.decomposition_dict.popitem(last=False)
+        return decomposition
+
+    def _decompose(self, Q):
+        Q = numpy.array(Q, copy=True)
+        try:
+            w, V = scipy.linalg.eig(Q)
+            is_well_conditioned = numpy.all(numpy.isfinite(V)) and\
+                numpy.linalg.cond(V) < self.max_condition_number
+        except (numpy.linalg.LinAlgError, ValueError):
+            is_well_conditioned = False
+        if is_well_conditioned:
+            V_inv = scipy.linalg.inv(V)
+            return Q, w, V, V_inv
+        else:
+            return Q, None, None, None
+
+
+class ExpmMultiplyExponential(object):
+    """
+    Compute the action of a matrix exponential on a vector with
+    scipy.sparse.linalg.expm_multiply (Al-Mohy and Higham), which only
+    needs sparse matrix-vector products. The dense ``exp(Qt)`` matrix
+    is never formed, so this calculator is suited to rate matrices
+    that are too large to exponentiate densely.
+    """
+    def __init__(self):
+        super(ExpmMultiplyExponential, self).__init__()
+
+    def compute_matrix_exp(self, rate_matrix, dwell_time):
+        """
+        Computes ``exp(Qt)``. This forms the dense matrix and is only
+        provided for compatibility with the other calculators.
+
+        Parameters
+        ----------
+        rate_matrix : RateMatrix
+        dwell_time : float
+
+        Returns
+        -------
+        expQt_matrix : RateMatrix
+        """
+        Q = rate_matrix.as_npy_array()
+        expQt = self.compute_array_exp(Q, dwell_time)
+        expQt_matrix = rate_matrix.copy()
+        expQt_matrix.data_frame.values[:,:] = expQt
+        return expQt_matrix
+
+    def compute_matrix_expv(self, rate_matrix, dwell_time, vec):
+        """
+        Computes ``exp(Qt) * vec``
+
+        Parameters
+        ----------
+        rate_matrix : RateMatrix or SparseRateMatrix
+        dwell_time : float
+        vec : ProbabilityVector
+
+        Returns
+        -------
+        expv : ProbabilityVector
+        """
+        if isinstance(rate_matrix, SparseRateMatrix):
+            aligned_series = vec.series.reindex(rate_matrix.column_id_list)
+            Q = rate_matrix.csr_matrix
+            index_id_list = rate_matrix.index_id_list
+        else:
+            alignment_results = rate_matrix.data_frame.align(
+                                    vec.series, axis=1, join='right')
+            aligned_frame, aligned_series = alignment_results
+            Q = scipy.sparse.csr_matrix(aligned_frame.values)
+            index_id_list = aligned_frame.index
+        expv_array = expm_multiply(Q * dwell_time,
+                                   numpy.array(aligned_series.fillna(0.0)))
+        expv_series = Series(expv_array, index=index_id_list)
+        return make_prob_vec_from_panda_series(expv_series)
+
+    def compute_array_exp(self, Q, dwell_time):
+        """
+        Computes ``exp(Qt)`` for a numpy array or scipy sparse matrix.
+
+        Parameters
+        ----------
+        Q : ndarray or sparse matrix
+        dwell_time : float
+
+        Returns
+        -------
+        expQt : ndarray
+        """
+        if scipy.sparse.issparse(Q):
+            Q = Q.toarray()
+        return expm(Q * dwell_time)
+
+    def compute_array_vexp(self, vec, Q, dwell_time):
+        """
+        Computes ``vec * exp(Qt)`` without forming ``exp(Qt)``.
+
+        Parameters
+        ----------
+        vec : ndarray
+            A row vector.
+        Q : ndarray or sparse matrix
+        dwell_time : float
+
+        Returns
+        -------
+        vexp : ndarray
+        """
+        if scipy.sparse.issparse(Q):
+            Q_transpose = Q.T.tocsr()
+        else:
+            Q_transpose = scipy.sparse.csr_matrix(Q.T)
+        return expm_multiply(Q_transpose * dwell_time, vec)
@@ -0,0 +1,101 @@
+import multiprocessing
+from .base.task_manager import TaskManager
+
+
+class LocalTaskManager(TaskManager):
+    """
+    Runs tasks in a pool of worker processes on the local machine.
+
+    Parameters
+    ----------
+    num_processes : int, optional
+        Size of the pool. Defaults to the number of cpus.
+    worker_initializer : callable, optional
+        Called once in each worker process when it starts, for
+        example to load data that every task needs.
+    initializer_args : tuple, optional
+        Arguments for `worker_initializer`.
+
+    Attributes
+    ----------
+    pool : multiprocessing.Pool
+    pending_results : list
+        `AsyncResult` objects of the tasks whose results have
+        not been collected yet.
+    """
+    def __init__(self, num_processes=None, worker_initializer=None,
+                 initializer_args=()):
+        super(LocalTaskManager, self).__init__()
+        if num_processes is None:
+            num_processes = multiprocessing.cpu_count()
+        self.num_processes = num_processes
+        self.worker_initializer = worker_initializer
+        self.initializer_args = initializer_args
+        self.pool = None
+        self.pending_results = []
+
+    def start(self):
+        self.pool = multiprocessing.Pool(
+                        self.num_processes,
+                        initializer=self.worker_initializer,
+                        initargs=self.initializer_args)
+
+    def stop(self):
+        """
+        Shut down the worker processes. Unfinished tasks are discarded.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+        self.pool = None
+        self.pending_results = []
+
+    def add_task(self, task, args):
+        """
+        Parameters
+        ----------
+        task : callable
+            A module-level function, so that it can be sent
+            to the worker processes.
+        args : tuple
+            Arguments for `task`.
+        """
+        assert self.pool is not None, "call start() before adding tasks"
+        async_result = self.pool.apply_async(task, args)
+        self.pending_results.append(async_result)
+
+    def collect_results_from_completed_tasks(self):
+        """
+        Returns
+        -------
+        result_list : list
+            Return values of the tasks that finished since the last
+            call, in the order that the tasks were added. Exceptions
+            raised by a task are raised again here.
+        """
+        result_list = []
+        unfinished_results = []
+        for async_result in self.pending_results:
+            if async_result.ready():
+                result_list.append(async_result.get())
+            else:
+                unfinished_results.append(async_result)
+        self.pending_results = unfinished_results
+        return result_list
+
+    def count_unfinished_tasks(self):
+        num_unfinished = 0
+        for async_result in self.pending_results:
+            if not async_result.ready():
+                num_unfinished += 1
+        return num_unfinished
+
+    def wait_for_tasks(self, timeout=None):
+        """
+        Block until the oldest unfinished task has finished or
+        `timeout` seconds have passed.
+        """
+        for async_result in self.pending_results:
+            if not async_result.ready():
+                async_result.wait(timeout)
+                break
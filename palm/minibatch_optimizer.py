@@ -0,0 +1,122 @@
+import copy
+import numpy
+from .base.parameter_optimizer import ParameterOptimizer
+from .scipy_optimizer import ScipyOptimizer
+
+
+class MiniBatchOptimizer(ParameterOptimizer):
+    """
+    Optimizes parameters against growing random subsets of a trajectory
+    collection. The first stage fits a small random batch of
+    trajectories. Each later stage starts from the result of the
+    previous stage, with a batch `growth_factor` times larger, until the
+    last stage fits the full collection. Early stages are cheap and get
+    close to the optimum, so the expensive full-collection stage
+    usually converges in a few iterations. The returned score is always
+    the score of the full collection.
+
+    Parameters
+    ----------
+    optimizer : ScipyOptimizer, optional
+        Runs each stage.
+    initial_batch_size : int, optional
+        Defaults to one sixteenth of the collection.
+    growth_factor : float, optional
+    random_seed : int, optional
+        Seed for selecting the batches.
+
+    Attributes
+    ----------
+    stage_list : list of tuple
+        The batch size, the score and the number of score
+        evaluations of each stage of the last optimization.
+    """
+    def __init__(self, optimizer=None, initial_batch_size=None,
+                 growth_factor=2.0, random_seed=None):
+        super(MiniBatchOptimizer, self).__init__()
+        assert growth_factor > 1.0, "growth_factor must be larger than 1"
+        if optimizer is None:
+            optimizer = ScipyOptimizer()
+        self.optimizer = optimizer
+        self.initial_batch_size = initial_batch_size
+        self.growth_factor = growth_factor
+        self.random_state = numpy.random.RandomState(random_seed)
+        self.stage_list = []
+
+    def make_batch_size_list(self, num_trajectories):
+        if self.initial_batch_size is None:
+            batch_size = max(1, num_trajectories // 16)
+        else:
+            batch_size = max(1, self.initial_batch_size)
+        batch_size_list = []
+        while batch_size < num_trajectories:
+            batch_size_list.append(batch_size)
+            batch_size = int(numpy.ceil(batch_size * self.growth_factor))
+        batch_size_list.append(num_trajectories)
+        return batch_size_list
+
+    def optimize_parameters(self, score_fcn, parameter_set, noisy=False,
+                            use_gradient=False):
+        """
+        Parameters
+        ----------
+        score_fcn : ScoreFunction
+            Its `target_data` is the full collection, which must support
+            `make_copy_from_selection`, like `BlinkCollectionTargetData`.
+        parameter_set : ParameterSet
+            Initial parameters. Modified in place.
+        noisy : bool, optional
+        use_gradient : bool, optional
+            Whether to optimize with `compute_score_and_gradient`.
+
+        Returns
+        -------
+        parameter_set : ParameterSet
+            Optimized parameter values.
+        score : float
+            The score of the optimized parameters on the full collection.
+        """
+        full_target_data = score_fcn.target_data
+        num_trajectories = len(full_target_data)
+        self.stage_list = []
+        for batch_size in self.make_batch_size_list(num_trajectories):
+            if batch_size < num_trajectories:
+                inds = numpy.sort(self.random_state.permutation(
+                                    num_trajectories)[:batch_size])
+                batch_target_data = full_target_data.make_copy_from_selection(
+                                        list(inds))
+            else:
+                batch_target_data = full_target_data
+            batch_score_fcn = copy.copy(score_fcn)
+            batch_score_fcn.target_data = batch_target_data
+            evaluation_list = []
+            def counting_score_fcn(x):
+                evaluation_list.append(x)
+                return batch_score_fcn.compute_score(x)
+            def counting_score_gradient_fcn(x):
+                evaluation_list.append(x)
+                return batch_score_fcn.compute_score_and_gradient(x)
+            if use_gradient:
+                score_gradient_fcn = counting_score_gradient_fcn
+            else:
+                score_gradient_fcn = None
+            parameter_set, score = self.optimizer.optimize_parameters(
+                                    counting_score_fcn, parameter_set,
+                                    noisy=noisy,
+                                    score_gradient_fcn=score_gradient_fcn)
+            self.stage_list.append((batch_size, score, len(evaluation_list)))
+            if noisy:
+                print "batch of %d trajectories, score %.6f, %d evaluations" %\
+                      (batch_size, score, len(evaluation_list))
+        return parameter_set, score
+
+    def count_trajectory_evaluations(self):
+        """
+        Returns
+        -------
+        num_trajectory_evaluations : int
+            The number of single trajectory likelihoods computed
+            during the last optimization.
+        """
+        return sum([batch_size * num_evaluations for batch_size, score,
+                    num_evaluations in self.stage_list])
@@ -0,0 +1,200 @@
+import copy
+import multiprocessing
+import numpy
+from .base.parameter_optimizer import ParameterOptimizer
+from .scipy_optimizer import ScipyOptimizer
+from .parameter_set_distribution import ParamSetDistFactory
+from .util import randomize_parameter
+
+
+# State of each worker process of a MultiStartOptimizer. It is set once,
+# when the worker starts, and reused for every round of every start.
+_worker_state = {}
+
+def _init_multistart_worker(score_fcn, parameter_set, optimizer,
+                            use_gradient):
+    _worker_state['score_fcn'] = score_fcn
+    _worker_state['parameter_set'] = parameter_set
+    _worker_state['optimizer'] = optimizer
+    _worker_state['use_gradient'] = use_gradient
+
+def _run_optimization_round(task):
+    start_index, parameter_array = task
+    score_fcn = _worker_state['score_fcn']
+    parameter_set = _worker_state['parameter_set']
+    optimizer = _worker_state['optimizer']
+    parameter_set.update_from_array(parameter_array)
+    if _worker_state['use_gradient']:
+        score_gradient_fcn = score_fcn.compute_score_and_gradient
+    else:
+        score_gradient_fcn = None
+    parameter_set, score = optimizer.optimize_parameters(
+                            score_fcn.compute_score, parameter_set,
+                            score_gradient_fcn=score_gradient_fcn)
+    return start_index, parameter_set.as_array(), score, optimizer.converged
+
+
+class MultiStartOptimizer(ParameterOptimizer):
+    """
+    Optimizes parameters from many random starting points, to reduce
+    the chance of ending in a local optimum. The starts are optimized
+    in parallel, in rounds of `iterations_per_round` L-BFGS-B
+    iterations. After each round, starts whose score trails the best
+    score found so far by more than `prune_margin` are stopped, so
+    that time is only spent on promising starts.
+
+    Each round restarts L-BFGS-B from the end point of the previous
+    round, which discards its curvature estimate. Use enough
+    iterations per round that this does not matter much.
+
+    Parameters
+    ----------
+    num_processes : int, optional
+        Number of worker processes. Defaults to the number of cpus.
+        With one process, the starts are optimized in this process.
+    iterations_per_round : int, optional
+    prune_margin : float, optional
+        Starts whose score is worse than the best score by more than
+        this are stopped.
+    max_rounds : int, optional
+    factr, pgtol : float, optional
+        Convergence criteria of each round, see `ScipyOptimizer`.
+    use_gradient : bool, optional
+        Whether to optimize with `compute_score_and_gradient` of the
+        score function.
+    """
+    def __init__(self, num_processes=None, iterations_per_round=10,
+                 prune_margin=1.0, max_rounds=100, factr=1e6, pgtol=1e-5,
+                 use_gradient=False):
+        super(MultiStartOptimizer, self).__init__()
+        if num_processes is None:
+            num_processes = multiprocessing.cpu_count()
+        self.num_processes = num_processes
+        self.iterations_per_round = iterations_per_round
+        self.prune_margin = prune_margin
+        self.max_rounds = max_rounds
+        self.factr = factr
+        self.pgtol = pgtol
+        self.use_gradient = use_gradient
+
+    def make_start_list(self, parameter_set, num_starts,
+                        randomization_bounds):
+        """
+        Parameters
+        ----------
+        parameter_set : ParameterSet
+            The first start. The other starts are copies of it.
+        num_starts : int
+        randomization_bounds : dict
+            For each parameter to randomize, a (lower, upper) tuple.
+            Every start but the first gets random values in this range.
+
+        Returns
+        -------
+        start_list : list of ParameterSet
+        """
+        start_list = [copy.deepcopy(parameter_set)]
+        for i in xrange(1, num_starts):
+            start = copy.deepcopy(parameter_set)
+            for parameter_name, bounds in randomization_bounds.iteritems():
+                lower_bound, upper_bound = bounds
+                randomize_parameter(start, parameter_name, lower_bound,
+                                    upper_bound)
+            start_list.append(start)
+        return start_list
+
+    def optimize_parameters(self, score_fcn, parameter_set, num_starts=1,
+                            randomization_bounds={}, start_list=None,
+                            noisy=False):
+        """
+        Parameters
+        ----------
+        score_fcn : ScoreFunction
+            Sent to the worker processes, so it must be picklable.
+        parameter_set : ParameterSet
+            Parameters of the first start. Modified in place to
+            the best parameters found.
+        num_starts : int, optional
+        randomization_bounds : dict, optional
+            See `make_start_list`.
+        start_list : list of ParameterSet, optional
+            Starts to use instead of random ones.
+        noisy : bool, optional
+
+        Returns
+        -------
+        parameter_set : ParameterSet
+            The parameters with the best score.
+        score : float
+        end_point_psd : ParameterSetDistribution
+            The end point of every start, with its `score`, its `start`
+            number, the number of rounds it ran (`rounds`) and its
+            `status`: converged, pruned or max rounds.
+        """
+        if start_list is None:
+            start_list = self.make_start_list(parameter_set, num_starts,
+                                              randomization_bounds)
+        end_point_list = [start.as_array() for start in start_list]
+        score_list = [None] * len(start_list)
+        status_list = [None] * len(start_list)
+        round_count_list = [0] * len(start_list)
+        optimizer = ScipyOptimizer(factr=self.factr, pgtol=self.pgtol,
+                                   maxiter=self.iterations_per_round)
+        worker_args = (score_fcn, copy.deepcopy(parameter_set), optimizer,
+                       self.use_gradient)
+        if self.num_processes > 1:
+            pool = multiprocessing.Pool(
+                        self.num_processes,
+                        initializer=_init_multistart_worker,
+                        initargs=worker_args)
+            map_fcn = pool.map
+        else:
+            pool = None
+            _init_multistart_worker(*worker_args)
+            map_fcn = map
+        try:
+            active_starts = range(len(start_list))
+            for round_number in xrange(self.max_rounds):
+                task_list = [(i, end_point_list[i]) for i in active_starts]
+                result_list = map_fcn(_run_optimization_round, task_list)
+                for start_index, end_point, score, converged in result_list:
+                    end_point_list[start_index] = end_point
+                    score_list[start_index] = score
+                    round_count_list[start_index] += 1
+                    if converged:
+                        status_list[start_index] = 'converged'
+                best_score = min([s for s in score_list if s is not None])
+                still_active = []
+                for i in active_starts:
+                    if status_list[i] is not None:
+                        continue
+                    elif score_list[i] > best_score + self.prune_margin:
+                        status_list[i] = 'pruned'
+                    else:
+                        still_active.append(i)
+                active_starts = still_active
+                if noisy:
+                    print "round %d, best score %.6f, %d active starts" %\
+                          (round_number, best_score, len(active_starts))
+                if len(active_starts) == 0:
+                    break
+            for i in active_starts:
+                status_list[i] = 'max rounds'
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        psd_factory = ParamSetDistFactory()
+        end_point_set = copy.deepcopy(parameter_set)
+        for i, end_point in enumerate(end_point_list):
+            end_point_set.update_from_array(end_point)
+            psd_factory.add_parameter_set(end_point_set)
+            psd_factory.add_parameter('score', score_list[i])
+            psd_factory.add_parameter('start', i)
+            psd_factory.add_parameter('rounds', round_count_list[i])
+            psd_factory.add_parameter('status', status_list[i])
+        end_point_psd = psd_factory.make_psd()
+        best_index = int(numpy.argmin(score_list))
+        parameter_set.update_from_array(end_point_list[best_index])
+        return parameter_set, score_list[best_index], end_point_psd
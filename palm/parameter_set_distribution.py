@@ -77,3 +77,31 @@ class ParameterSetDistribution(object):
         best_score_index = self.data_frame['score'].idxmin()
         best_score_row = self.data_frame.ix[best_score_index]
         return best_score_row
+
+    def get_nearest_best_params_as_series(self, parameter_name,
+                                          parameter_value):
+        """
+        Among the parameter sets whose value of `parameter_name` is
+        closest to `parameter_value`, find the one with the best score.
+
+        Returns
+        -------
+        best_score_row : Series
+        """
+        distance = (self.data_frame[parameter_name] - parameter_value).abs()
+        nearest_df = self.data_frame[distance == distance.min()]
+        best_score_index = nearest_df['score'].idxmin()
+        return nearest_df.ix[best_score_index]
+
+    def select_distribution(self, parameter_name, parameter_value):
+        """
+        Returns
+        -------
+        selected_psd : ParameterSetDistribution
+            The parameter sets whose value of `parameter_name`
+            equals `parameter_value`.
+        """
+        selected_psd = ParameterSetDistribution()
+        selected_psd.data_frame = self.select_param_sets(parameter_name,
+                                                         parameter_value)
+        return selected_psd
@@ -1,6 +1,7 @@
 import numpy
 import scipy.linalg
 import pandas
+from .util import DATA_TYPE
 
 def make_prob_vec_from_state_ids(state_id_collection):
     pv = ProbabilityVector()
@@ -49,6 +50,16 @@ class ProbabilityVector(object):
         self.series[self.series > 1.0] = value
     def as_npy_array(self):
         return numpy.array(self.series)
+    def as_aligned_npy_array(self, state_id_collection):
+        """
+        Returns
+        -------
+        aligned_array : ndarray
+            Probabilities ordered like the ids in `state_id_collection`.
+            States missing from this vector get zero probability.
+        """
+        aligned_series = self.series.reindex(state_id_collection.as_list())
+        return numpy.array(aligned_series.fillna(0.0), dtype=DATA_TYPE)
     def allclose(self, other_vec):
         return numpy.allclose(self.series.values,
                               other_vec.series.values)
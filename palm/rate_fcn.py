@@ -27,3 +27,26 @@ def rate_from_rate_id(rate_id, t, parameter_set, fermi_activation):
         log_rate = parameter_set.get_parameter(param_name)
         rate = 10**log_rate
         return rate
+
+def rate_gradient_from_rate_id(rate_id, t, parameter_set, fermi_activation):
+    """
+    Derivatives of a rate constant with respect to the parameters
+    it depends on. Rates are ``10**log_rate``, so the derivative
+    with respect to a log rate parameter is ``ln(10) * rate``.
+    A fermi activation rate only depends on `fermi_T` and `fermi_tf`,
+    which are held fixed during optimization, so it has no derivatives.
+
+    Returns
+    -------
+    rate_gradient_dict : dict
+        Derivatives, indexed by parameter name.
+    """
+    if rate_id == 'ka' and fermi_activation:
+        return {}
+    rate = rate_from_rate_id(rate_id, t, parameter_set, fermi_activation)
+    if rate_id == 'kr2':
+        return {'log_kr1':numpy.log(10.) * rate,
+                'log_kr_diff':numpy.log(10.) * rate}
+    else:
+        param_name = PARAM_NAME_DICT[rate_id]
+        return {param_name:numpy.log(10.) * rate}
@@ -1,6 +1,7 @@
 import numpy
 import scipy.linalg
-from pandas import DataFrame
+import scipy.sparse
+from pandas import DataFrame, Series
 
 
 def make_rate_matrix_from_state_ids(index_id_collection, column_id_collection):
@@ -10,11 +11,41 @@ def make_rate_matrix_from_state_ids(index_id_collection, column_id_collection):
     rm.data_frame = DataFrame(0.0, index=index_id_list, columns=column_id_list)
     return rm
 
+def make_rate_matrix_from_npy_array(array, index_id_collection,
+                                    column_id_collection):
+    rm = RateMatrix()
+    rm.data_frame = DataFrame(array, index=index_id_collection.as_list(),
+                              columns=column_id_collection.as_list())
+    return rm
+
 def make_rate_matrix_from_panda_data_frame(data_frame):
     rm = RateMatrix()
     rm.data_frame = data_frame
     return rm
 
+def make_sparse_rate_matrix_from_state_ids(index_id_collection,
+                                           column_id_collection,
+                                           row_inds=None, col_inds=None,
+                                           rates=None):
+    """
+    Builds a SparseRateMatrix. The nonzero rates may be given as
+    (row position, column position, rate) triplets; rates that
+    share a position are summed.
+    """
+    index_id_list = index_id_collection.as_list()
+    column_id_list = column_id_collection.as_list()
+    shape = (len(index_id_list), len(column_id_list))
+    if rates is None:
+        csr_matrix = scipy.sparse.csr_matrix(shape, dtype=numpy.float64)
+    else:
+        coo_matrix = scipy.sparse.coo_matrix(
+                        (numpy.asarray(rates, dtype=numpy.float64),
+                         (numpy.asarray(row_inds, dtype=int),
+                          numpy.asarray(col_inds, dtype=int))),
+                        shape=shape)
+        csr_matrix = coo_matrix.tocsr()
+    return SparseRateMatrix(csr_matrix, index_id_list, column_id_list)
+
 
 class RateMatrix(object):
     """docstring for RateMatrix"""
@@ -81,6 +112,113 @@ class RateMatrix(object):
         return all_finite
 
 
+class SparseRateMatrix(object):
+    """
+    A rate matrix stored in compressed sparse row (CSR) format.
+    Blink models have a few transitions out of each state, so this
+    needs memory proportional to the number of routes rather than the
+    square of the number of states. State ids are mapped to row and
+    column positions with dictionaries.
+
+    Parameters
+    ----------
+    csr_matrix : scipy.sparse.csr_matrix
+    index_id_list, column_id_list : list
+        State ids of the rows and columns of the matrix.
+
+    Attributes
+    ----------
+    index_position_dict, column_position_dict : dict
+        Row and column position of each state id.
+    """
+    def __init__(self, csr_matrix, index_id_list, column_id_list):
+        super(SparseRateMatrix, self).__init__()
+        assert csr_matrix.shape == (len(index_id_list), len(column_id_list))
+        self.csr_matrix = csr_matrix
+        self.index_id_list = list(index_id_list)
+        self.column_id_list = list(column_id_list)
+        self.index_position_dict = self._make_position_dict(
+                                        self.index_id_list)
+        self.column_position_dict = self._make_position_dict(
+                                        self.column_id_list)
+    def __len__(self):
+        return self.csr_matrix.shape[0]
+    def __str__(self):
+        return str(self.csr_matrix)
+    def __iter__(self):
+        for j, column_id in enumerate(self.column_id_list):
+            column_array = self.csr_matrix[:,j].toarray().ravel()
+            yield column_id, Series(column_array, index=self.index_id_list)
+    def _make_position_dict(self, id_list):
+        position_dict = {}
+        for i, this_id in enumerate(id_list):
+            position_dict[this_id] = i
+        return position_dict
+    def get_shape(self):
+        return self.csr_matrix.shape
+    def set_rate(self, state_id1, state_id2, rate):
+        # adding a new nonzero entry changes the sparsity structure,
+        # which is slow; build large matrices from triplets instead
+        i = self.index_position_dict[state_id1]
+        j = self.column_position_dict[state_id2]
+        self.csr_matrix[i,j] = rate
+    def get_rate(self, state_id1, state_id2):
+        i = self.index_position_dict[state_id1]
+        j = self.column_position_dict[state_id2]
+        return self.csr_matrix[i,j]
+    def balance_transition_rates(self):
+        # set diagonals to -sum of other entries in row
+        sum_along_row_array = numpy.asarray(self.csr_matrix.sum(1)).ravel()
+        diagonal_array = self.csr_matrix.diagonal()
+        diagonal_shift = scipy.sparse.diags(
+                            diagonal_array + sum_along_row_array, 0)
+        self.csr_matrix = (self.csr_matrix - diagonal_shift).tocsr()
+    def as_npy_array(self):
+        return self.csr_matrix.toarray()
+    def as_sparse_array(self):
+        return self.csr_matrix
+    def get_submatrix(self, index_id_collection, column_id_collection):
+        index_id_list = index_id_collection.as_list()
+        column_id_list = column_id_collection.as_list()
+        row_inds = [self.index_position_dict[this_id]\
+                    for this_id in index_id_list]
+        col_inds = [self.column_position_dict[this_id]\
+                    for this_id in column_id_list]
+        if len(row_inds) == 0 or len(col_inds) == 0:
+            sub_csr = scipy.sparse.csr_matrix(
+                        (len(row_inds), len(col_inds)), dtype=numpy.float64)
+        else:
+            sub_csr = self.csr_matrix[row_inds,:][:,col_inds]
+        return SparseRateMatrix(sub_csr, index_id_list, column_id_list)
+    def get_index_id_list(self):
+        return list(self.index_id_list)
+    def get_column_id_list(self):
+        return list(self.column_id_list)
+    def copy(self):
+        return SparseRateMatrix(self.csr_matrix.copy(), self.index_id_list,
+                                self.column_id_list)
+    def compute_sparsity(self):
+        num_nonzero = numpy.count_nonzero(self.csr_matrix.data)
+        total_entries = self.csr_matrix.shape[0] * self.csr_matrix.shape[1]
+        fraction_zero = (total_entries - num_nonzero) / (1. * total_entries)
+        return fraction_zero
+    def compute_norm(self):
+        abs_row_sums = abs(self.csr_matrix).sum(1)
+        return numpy.max(abs_row_sums)
+    def compute_max_element_magnitude(self):
+        if self.csr_matrix.nnz == 0:
+            return 0.0
+        return numpy.max(numpy.abs(self.csr_matrix.data))
+    def is_finite(self):
+        """
+        Returns
+        -------
+        all_finite : True if no elements of vector are inf, -inf, or nan.
+        """
+        all_finite = numpy.all(numpy.isfinite(self.csr_matrix.data))
+        return all_finite
+
+
 class RateMatrixTrajectory(object):
     """docstring for RateMatrixTrajectory"""
     def __init__(self):
@@ -1,3 +1,5 @@
+import copy
+import numpy
 import pandas
 from .state_collection import StateIDCollection
 
@@ -19,12 +21,109 @@ class RouteCollectionFactory(object):
         return route_collection
 
 
+def make_route_collection_from_inds(state_id_list, start_inds, end_inds,
+                                    rate_ids, multiplicities):
+    """
+    Builds a RouteCollection from arrays, without creating route
+    objects or id strings. The route table is only built if it is
+    requested.
+
+    Parameters
+    ----------
+    state_id_list : list
+        The ids of the states that the indices refer to.
+    start_inds, end_inds : ndarray
+        Position in `state_id_list` of the start and end state
+        of each route.
+    rate_ids : ndarray
+        The rate id of each route.
+    multiplicities : ndarray
+        The multiplicity of each route.
+
+    Returns
+    -------
+    route_collection : RouteCollection
+    """
+    compiled_routes = CompiledRouteCollection()
+    compiled_routes.start_inds = numpy.asarray(start_inds, dtype=int)
+    compiled_routes.end_inds = numpy.asarray(end_inds, dtype=int)
+    rate_id_array, rate_codes = numpy.unique(numpy.asarray(rate_ids),
+                                             return_inverse=True)
+    compiled_routes.rate_id_list = rate_id_array.tolist()
+    compiled_routes.rate_codes = rate_codes
+    compiled_routes.multiplicities = numpy.asarray(multiplicities,
+                                                   dtype=numpy.float64)
+    return make_route_collection_from_compiled_routes(state_id_list,
+                                                      compiled_routes)
+
+
+def make_route_collection_from_compiled_routes(state_id_list,
+                                               compiled_routes):
+    """
+    Parameters
+    ----------
+    state_id_list : list
+        The ids of the states that the indices of `compiled_routes`
+        refer to.
+    compiled_routes : CompiledRouteCollection
+
+    Returns
+    -------
+    route_collection : RouteCollection
+    """
+    route_collection = RouteCollection()
+    route_collection.state_id_list = state_id_list
+    route_collection.compiled_routes = compiled_routes
+    return route_collection
+
+
 class RouteCollection(object):
-    """docstring for RouteCollection"""
+    """
+    The routes of a model.
+
+    Attributes
+    ----------
+    data_frame : pandas DataFrame
+        One row per route, indexed by route id, with the start state,
+        end state, rate id and multiplicity of the route. For
+        collections built from arrays, the table is built when it is
+        first accessed.
+    compiled_routes : CompiledRouteCollection or None
+        The routes of a collection built from arrays, with state
+        indices that refer to `state_id_list`.
+    state_id_list : list or None
+    """
     def __init__(self):
         super(RouteCollection, self).__init__()
-        self.data_frame = None
+        self._data_frame = None
+        self.compiled_routes = None
+        self.state_id_list = None
+    def _get_data_frame(self):
+        if self._data_frame is None and self.compiled_routes is not None:
+            self._data_frame = self._make_data_frame()
+        return self._data_frame
+    def _set_data_frame(self, data_frame):
+        self._data_frame = data_frame
+        self.compiled_routes = None
+        self.state_id_list = None
+    data_frame = property(_get_data_frame, _set_data_frame)
+    def _make_data_frame(self):
+        compiled_routes = self.compiled_routes
+        start_ids = [self.state_id_list[i]
+                     for i in compiled_routes.start_inds.tolist()]
+        end_ids = [self.state_id_list[i]
+                   for i in compiled_routes.end_inds.tolist()]
+        route_ids = ["%s__%s" % (start_id, end_id)
+                     for start_id, end_id in zip(start_ids, end_ids)]
+        rate_ids = [compiled_routes.rate_id_list[i]
+                    for i in compiled_routes.rate_codes.tolist()]
+        route_dict = {'start_state':start_ids, 'end_state':end_ids,
+                      'rate_id':rate_ids,
+                      'multiplicity':compiled_routes.multiplicities}
+        return pandas.DataFrame(route_dict, index=route_ids)
     def __len__(self):
+        if self.compiled_routes is not None:
+            return len(self.compiled_routes)
         return len(self.data_frame)
     def __str__(self):
         return self.data_frame.to_string()
@@ -56,6 +155,90 @@ class RouteCollection(object):
         local_state_id_collection.add_state_id_list(
                                     unique_local_state_ids.tolist())
         return local_state_id_collection
+    def compile_routes(self, state_index_dict):
+        """
+        Converts the route table to integer arrays, so that rate
+        matrices can be assembled without iterating over routes.
+
+        Parameters
+        ----------
+        state_index_dict : dict
+            Rate matrix position of each state id.
+
+        Returns
+        -------
+        compiled_routes : CompiledRouteCollection
+        """
+        if self.compiled_routes is not None:
+            return self._remap_compiled_routes(state_index_dict)
+        compiled_routes = CompiledRouteCollection()
+        if len(self) == 0:
+            return compiled_routes
+        start_state_ids = self.get_start_state_series().tolist()
+        end_state_ids = self.get_end_state_series().tolist()
+        compiled_routes.start_inds = numpy.array(
+            [state_index_dict[this_id] for this_id in start_state_ids],
+            dtype=int)
+        compiled_routes.end_inds = numpy.array(
+            [state_index_dict[this_id] for this_id in end_state_ids],
+            dtype=int)
+        rate_id_array = numpy.array(self.data_frame['rate_id'].tolist())
+        rate_id_array, rate_codes = numpy.unique(rate_id_array,
+                                                 return_inverse=True)
+        compiled_routes.rate_id_list = rate_id_array.tolist()
+        compiled_routes.rate_codes = rate_codes
+        compiled_routes.multiplicities = numpy.array(
+            self.data_frame['multiplicity'], dtype=numpy.float64)
+        return compiled_routes
+    def _remap_compiled_routes(self, state_index_dict):
+        # translate positions in `state_id_list` to `state_index_dict`
+        index_map = numpy.array([state_index_dict[this_id]\
+                                 for this_id in self.state_id_list], dtype=int)
+        if numpy.array_equal(index_map, numpy.arange(len(index_map))):
+            return self.compiled_routes
+        compiled_routes = copy.copy(self.compiled_routes)
+        compiled_routes.start_inds = index_map[compiled_routes.start_inds]
+        compiled_routes.end_inds = index_map[compiled_routes.end_inds]
+        return compiled_routes
+
+
+class CompiledRouteCollection(object):
+    """
+    The routes of a RouteCollection as integer arrays.
+
+    Attributes
+    ----------
+    start_inds, end_inds : ndarray
+        Rate matrix positions of the start and end state of each route.
+    rate_id_list : list
+        The distinct rate ids of the routes.
+    rate_codes : ndarray
+        Position in `rate_id_list` of the rate id of each route.
+    multiplicities : ndarray
+        Multiplicity of each route.
+    """
+    def __init__(self):
+        super(CompiledRouteCollection, self).__init__()
+        self.start_inds = numpy.zeros(0, dtype=int)
+        self.end_inds = numpy.zeros(0, dtype=int)
+        self.rate_id_list = []
+        self.rate_codes = numpy.zeros(0, dtype=int)
+        self.multiplicities = numpy.zeros(0, dtype=numpy.float64)
+    def __len__(self):
+        return len(self.start_inds)
+    def compute_route_rates(self, rate_values):
+        """
+        Parameters
+        ----------
+        rate_values : ndarray
+            The value of each rate id, ordered like `rate_id_list`.
+
+        Returns
+        -------
+        route_rates : ndarray
+            Multiplicity times rate for each route.
+        """
+        return self.multiplicities * rate_values[self.rate_codes]
 
 
 class RouteIDCollection(object):
@@ -1,5 +1,7 @@
+import numpy
 import scipy.optimize
 from .base.parameter_optimizer import ParameterOptimizer
+from .util import warm_start_parameters
 
 
 class ScipyOptimizer(ParameterOptimizer):
@@ -19,16 +21,27 @@ class ScipyOptimizer(ParameterOptimizer):
     pgtol : float, optional
     epsilon : float, optional
     maxfun : int, optional
+    maxiter : int, optional
+
+    Attributes
+    ----------
+    converged : bool
+        Whether the last optimization converged, rather than stopping
+        at `maxfun` or `maxiter`.
     """
-    def __init__(self, factr=1e6, pgtol=1e-5, epsilon=1e-8, maxfun=1000):
+    def __init__(self, factr=1e6, pgtol=1e-5, epsilon=1e-8, maxfun=1000,
+                 maxiter=15000):
         super(ScipyOptimizer, self).__init__()
         self.optimization_fcn = scipy.optimize.fmin_l_bfgs_b
         self.factr = factr
         self.pgtol = pgtol
         self.epsilon = epsilon
         self.maxfun = maxfun
+        self.maxiter = maxiter
+        self.converged = None
 
-    def optimize_parameters(self, score_fcn, parameter_set, noisy=False):
+    def optimize_parameters(self, score_fcn, parameter_set, noisy=False,
+                            score_gradient_fcn=None, warm_start=None):
         """
         Optimize parameters based on a scoring function.
 
@@ -41,6 +54,17 @@ class ScipyOptimizer(ParameterOptimizer):
             Will be modified in place during search for optimal parameters.
         noisy : bool, optional
             Whether to write optimizer messages to stdout.
+        score_gradient_fcn : callable f(x, *args), optional
+            A function that returns the score and its gradient, such as
+            `ScoreFunction.compute_score_and_gradient`. When given, it
+            is used instead of `score_fcn` and its gradient is passed
+            to the optimizer as `fprime`, so no finite differences
+            are needed.
+        warm_start : ParameterSet or ParameterSetDistribution, optional
+            Results of an earlier fit, for example with a different
+            number of fluorophores. The search starts from their values
+            of the free parameters instead of those of `parameter_set`.
+            See `util.warm_start_parameters`.
 
         Returns
         -------
@@ -49,18 +73,45 @@ class ScipyOptimizer(ParameterOptimizer):
         score : float
             The score of the optimized parameters.
         """
+        if warm_start is not None:
+            warm_start_parameters(parameter_set, warm_start)
         bounds = parameter_set.get_parameter_bounds()
         if noisy:
             iprint = 1
         else:
             iprint = -1
-        results = self.optimization_fcn(score_fcn, x0=parameter_set.as_array(),
-                                        bounds=bounds, approx_grad=1,
-                                        iprint=iprint,
-                                        factr=self.factr, pgtol=self.pgtol,
-                                        epsilon=self.epsilon, maxfun=self.maxfun)
+        if score_gradient_fcn is None:
+            results = self.optimization_fcn(
+                        score_fcn, x0=parameter_set.as_array(),
+                        bounds=bounds, approx_grad=1, iprint=iprint,
+                        factr=self.factr, pgtol=self.pgtol,
+                        epsilon=self.epsilon, maxfun=self.maxfun,
+                        maxiter=self.maxiter)
+        else:
+            fcn, fprime = self._split_score_and_gradient(score_gradient_fcn)
+            results = self.optimization_fcn(
+                        fcn, x0=parameter_set.as_array(), fprime=fprime,
+                        bounds=bounds, approx_grad=0, iprint=iprint,
+                        factr=self.factr, pgtol=self.pgtol,
+                        maxfun=self.maxfun, maxiter=self.maxiter)
         optimal_parameter_array = results[0]
+        self.converged = (results[2]['warnflag'] == 0)
         parameter_set.update_from_array(optimal_parameter_array)
         score = float(results[1])
         return parameter_set, score
 
+    def _split_score_and_gradient(self, score_gradient_fcn):
+        # the optimizer asks for the score and then the gradient at the
+        # same point, so keep the gradient from the last evaluation
+        last_evaluation = {}
+        def fcn(x):
+            score, score_gradient = score_gradient_fcn(x)
+            last_evaluation['x'] = numpy.array(x, copy=True)
+            last_evaluation['gradient'] = score_gradient
+            return score
+        def fprime(x):
+            if 'x' not in last_evaluation or\
+               not numpy.array_equal(x, last_evaluation['x']):
+                fcn(x)
+            return last_evaluation['gradient']
+        return fcn, fprime
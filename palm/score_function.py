@@ -41,6 +41,31 @@ class ScoreFunction(object):
             print "%.6f,%s" % (score, self.parameter_set)
         return score
 
+    def compute_score_and_gradient(self, current_parameter_array):
+        """
+        Computes score of a model and its gradient. The judge and the
+        data predictor must support analytic gradients.
+
+        Parameters
+        ----------
+        current_parameter_array : ndarray
+            An array of parameter values.
+
+        Returns
+        -------
+        score : float
+        score_gradient : ndarray
+            Derivative of the score with respect to each parameter.
+        """
+        self.parameter_set.update_from_array(current_parameter_array)
+        current_model = self.model_factory.create_model(self.parameter_set)
+        score, score_gradient = self.judge.judge_prediction_and_gradient(
+                                    current_model, self.data_predictor,
+                                    self.target_data)
+        if self.noisy:
+            print "%.6f,%s" % (score, self.parameter_set)
+        return score, score_gradient
+
 
 class CutoffScoreFunction(object):
     """
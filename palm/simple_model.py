@@ -6,7 +6,8 @@ from .base.parameter_set import ParameterSet
 from .base.target_data import TargetData
 from .aggregated_kinetic_model import AggregatedKineticModel
 from .discrete_state_trajectory import DiscreteStateTrajectory,\
-                                           DiscreteDwellSegment
+                                       DiscreteDwellSegment,\
+                                       make_trajectory_from_class_names
 from .state_collection import StateCollectionFactory
 from .route_collection import RouteCollectionFactory
 from .probability_vector import make_prob_vec_from_state_ids
@@ -95,6 +96,9 @@ class SimpleParameterSet(ParameterSet):
         log_k2 = self.get_parameter('log_k2')
         return numpy.array([log_k1, log_k2])
 
+    def get_parameter_names(self):
+        return ['log_k1', 'log_k2']
+
     def update_from_array(self, parameter_array):
         """Expected order of parameters in array:
            log_k1, log_k2
@@ -234,13 +238,9 @@ class SimpleTargetData(TargetData):
 
     def load_data(self, data_file):
         data_table = pandas.read_csv(data_file, header=0)
-        self.trajectory = self.trajectory_factory()
-        for segment_data in data_table.itertuples():
-            segment_class = str(segment_data[1])
-            segment_dwell_time = float(segment_data[2])
-            new_segment = self.segment_factory(segment_class,
-                                               segment_dwell_time)
-            self.trajectory.add_segment(new_segment)
+        self.trajectory = make_trajectory_from_class_names(
+                            data_table.iloc[:,0].values,
+                            data_table.iloc[:,1].values)
 
     def get_feature(self):
         return self.trajectory
@@ -1,3 +1,4 @@
+import numpy
 import pandas
 
 class StateCollectionFactory(object):
@@ -43,6 +44,36 @@ class StateCollectionFactory(object):
         return state_collection
 
 
+def make_state_collection_from_arrays(state_id_list, population_array,
+                                      species_names, class_list):
+    """
+    Builds a StateCollection from the populations of its states,
+    without creating state objects.
+
+    Parameters
+    ----------
+    state_id_list : list
+    population_array : ndarray
+        The microstate populations of each state, one state per row.
+    species_names : list
+        The microstate of each column of `population_array`.
+    class_list : list
+        The observation class of each state.
+
+    Returns
+    -------
+    state_collection : StateCollection
+    """
+    column_dict = {'observation_class':class_list}
+    for i, species_name in enumerate(species_names):
+        column_dict[species_name] = numpy.array(population_array[:,i])
+    state_collection = StateCollection()
+    state_collection.data_frame = pandas.DataFrame(column_dict,
+                                                   index=state_id_list)
+    state_collection.population_array = population_array
+    return state_collection
+
+
 class StateCollection(object):
     """
     The states of a model. This data structures is used by
@@ -53,10 +84,17 @@ class StateCollection(object):
     data_frame : pandas DataFrame
         Each row in the DataFrame corresponds to a state, and
         the columns are based on the attributes of the states.
+    state_space : PopulationSpace or None
+        For states that are defined by microstate populations, the
+        space that ranks them. State `i` has rank `i`.
+    population_array : ndarray or None
+        The microstate populations of each state, one state per row.
     """
     def __init__(self):
         super(StateCollection, self).__init__()
         self.data_frame = None
+        self.state_space = None
+        self.population_array = None
 
     def __len__(self):
         return len(self.data_frame)
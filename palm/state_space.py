@@ -0,0 +1,200 @@
+import itertools
+import numpy
+import scipy.misc
+
+POPULATION_TYPE = numpy.int64
+
+
+def count_compositions(total, max_populations):
+    """
+    Number of ways to distribute `total` identical fluorophores over
+    microstates, some of which hold at most a maximum number.
+
+    Parameters
+    ----------
+    total : int
+    max_populations : list
+        The maximum population of each microstate, or None if
+        it is unlimited.
+
+    Returns
+    -------
+    num_compositions : int
+    """
+    num_bins = len(max_populations)
+    if total < 0 or num_bins == 0:
+        return int(total == 0 and num_bins == 0)
+    capped_bins = [max_population for max_population in max_populations
+                   if max_population is not None]
+    # inclusion-exclusion over the microstates that exceed their maximum
+    num_compositions = 0
+    for num_exceeded in xrange(len(capped_bins) + 1):
+        for exceeded_bins in itertools.combinations(capped_bins,
+                                                    num_exceeded):
+            remainder = total - sum([m + 1 for m in exceeded_bins])
+            if remainder < 0:
+                continue
+            num_compositions += (-1)**num_exceeded *\
+                scipy.misc.comb(remainder + num_bins - 1, num_bins - 1,
+                                exact=True)
+    return int(num_compositions)
+
+
+class PopulationSpace(object):
+    """
+    The macrostates of `N` fluorophores distributed over a set of
+    microstates, some of which have a maximum population. Each
+    macrostate is a tuple of microstate populations that sum to `N`.
+    The macrostates are ordered lexicographically by their populations,
+    and `rank` and `unrank` convert between populations and positions
+    in that order in closed form, so macrostates can be identified by
+    integer index without generating the others.
+
+    Parameters
+    ----------
+    species_names : list of string
+        The microstates, e.g. ``['I', 'A', 'D', 'B']``.
+    N : int
+        The number of fluorophores.
+    max_population_dict : dict, optional
+        The maximum population of some of the microstates,
+        indexed by name.
+
+    Attributes
+    ----------
+    max_populations : list
+        The maximum population of each microstate, or None.
+    completion_table : ndarray
+        Element ``[i,t]`` is the number of ways to distribute `t`
+        fluorophores over microstates `i` and later.
+    cumulative_table : ndarray
+        Element ``[i,t]`` is the sum of ``completion_table[i,:t]``.
+    """
+    def __init__(self, species_names, N, max_population_dict={}):
+        super(PopulationSpace, self).__init__()
+        self.species_names = list(species_names)
+        self.N = N
+        self.max_populations = [max_population_dict.get(name, None)
+                                for name in self.species_names]
+        num_species = len(self.species_names)
+        self.completion_table = numpy.zeros((num_species + 1, N + 1),
+                                            dtype=POPULATION_TYPE)
+        for i in xrange(num_species + 1):
+            for t in xrange(N + 1):
+                self.completion_table[i, t] = count_compositions(
+                                                t, self.max_populations[i:])
+        # cumulative sums over t, with a leading zero column, so that
+        # the sum of completions over a range of t is one difference
+        self.cumulative_table = numpy.zeros((num_species + 1, N + 2),
+                                            dtype=POPULATION_TYPE)
+        self.cumulative_table[:,1:] = numpy.cumsum(self.completion_table,
+                                                   axis=1)
+
+    def __len__(self):
+        return int(self.completion_table[0, self.N])
+
+    def get_species_index(self, species_name):
+        return self.species_names.index(species_name)
+
+    def get_population_array(self):
+        """
+        Returns
+        -------
+        population_array : ndarray
+            Row `i` holds the microstate populations of the macrostate
+            with rank `i`. Only valid macrostates are generated.
+        """
+        num_species = len(self.species_names)
+        population_array = numpy.zeros((1, 0), dtype=POPULATION_TYPE)
+        remaining = numpy.array([self.N], dtype=POPULATION_TYPE)
+        for i in xrange(num_species - 1):
+            # the values of microstate i that leave a valid remainder
+            # for the later microstates, in increasing order
+            max_population = self.max_populations[i]
+            if max_population is None:
+                upper = remaining
+            else:
+                upper = numpy.minimum(remaining, max_population)
+            later_max_populations = self.max_populations[i+1:]
+            if None in later_max_populations:
+                lower = numpy.zeros(len(remaining), dtype=POPULATION_TYPE)
+            else:
+                lower = numpy.maximum(
+                            remaining - sum(later_max_populations), 0)
+            num_values = numpy.maximum(upper - lower + 1, 0)
+            rows = numpy.repeat(numpy.arange(len(remaining)), num_values)
+            first_positions = numpy.cumsum(num_values) - num_values
+            values = lower[rows] + numpy.arange(len(rows)) -\
+                     first_positions[rows]
+            population_array = numpy.column_stack(
+                                [population_array[rows], values])
+            remaining = remaining[rows] - values
+        population_array = numpy.column_stack([population_array, remaining])
+        return population_array.astype(POPULATION_TYPE)
+
+    def rank(self, populations):
+        """
+        Parameters
+        ----------
+        populations : array_like
+            The populations of one macrostate, or an array with one
+            macrostate per row. The populations must be valid.
+
+        Returns
+        -------
+        rank : int or ndarray
+            Position of each macrostate in the lexicographic order.
+        """
+        populations = numpy.asarray(populations, dtype=POPULATION_TYPE)
+        is_single = (populations.ndim == 1)
+        populations = numpy.atleast_2d(populations)
+        ranks = numpy.zeros(len(populations), dtype=POPULATION_TYPE)
+        remaining = numpy.zeros(len(populations), dtype=POPULATION_TYPE) +\
+                    self.N
+        for i in xrange(len(self.species_names) - 1):
+            # count the macrostates with the same earlier populations
+            # and a smaller population of microstate i
+            cumulative = self.cumulative_table[i+1]
+            ranks += cumulative[remaining + 1] -\
+                     cumulative[remaining - populations[:,i] + 1]
+            remaining = remaining - populations[:,i]
+        if is_single:
+            return int(ranks[0])
+        return ranks
+
+    def unrank(self, rank):
+        """
+        Parameters
+        ----------
+        rank : int
+
+        Returns
+        -------
+        populations : tuple of int
+            The populations of the macrostate with this rank.
+        """
+        assert 0 <= rank < len(self), "rank %d out of range" % rank
+        populations = []
+        remaining = self.N
+        for i in xrange(len(self.species_names) - 1):
+            value = 0
+            while True:
+                num_completions = self.completion_table[i+1, remaining - value]
+                if rank < num_completions:
+                    break
+                rank -= num_completions
+                value += 1
+            populations.append(value)
+            remaining -= value
+        populations.append(remaining)
+        return tuple(populations)
+
+    def make_labels(self, population_array):
+        """
+        Returns
+        -------
+        label_list : list of string
+            A label like ``"3_1_0_1"`` for each row of `population_array`.
+        """
+        return ['_'.join([str(p) for p in populations])
+                for populations in population_array.tolist()]
@@ -0,0 +1,34 @@
+import nose.tools
+import os
+import tempfile
+from ..benchmark import BenchmarkSuite, BENCHMARK_NAMES, EXPM_ENGINES,\
+                        write_results, load_results, compare_results
+
+
+@nose.tools.istest
+def benchmark_results_can_be_saved_and_compared():
+    benchmark_suite = BenchmarkSuite(model_names=['single_dark'], N_list=[1],
+                                     MAX_A_list=[2], repeat=1,
+                                     num_trajectories=3, num_segments=10,
+                                     fit_maxiter=1)
+    result_list = benchmark_suite.run()
+    benchmark_names = set([result['benchmark'] for result in result_list])
+    nose.tools.eq_(benchmark_names, set(BENCHMARK_NAMES))
+    expm_results = [result for result in result_list
+                    if result['benchmark'] == 'expm']
+    nose.tools.eq_(len(expm_results), len(EXPM_ENGINES))
+    for result in result_list:
+        nose.tools.ok_(result['best_time'] >= 0.0)
+        nose.tools.ok_(result['peak_memory_kb'] >= 0)
+        nose.tools.eq_(result['num_states'], 4)
+    handle, results_file = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    try:
+        write_results(result_list, results_file)
+        results = load_results(results_file)
+    finally:
+        os.remove(results_file)
+    nose.tools.eq_(len(results['results']), len(result_list))
+    comparison = compare_results(results, results)
+    nose.tools.eq_(len(comparison), len(result_list))
+    nose.tools.ok_((comparison['time_ratio'] == 1.0).all())
@@ -1,10 +1,14 @@
 import nose.tools
+import numpy
+import shutil
+import tempfile
 from ..blink_factory import SingleDarkBlinkFactory,\
                                DoubleDarkBlinkFactory,\
                                ConnectedDarkBlinkFactory
 from ..blink_parameter_set import SingleDarkParameterSet,\
                                      DoubleDarkParameterSet,\
                                      ConnectedDarkParameterSet
+from ..rate_fcn import rate_from_rate_id
 from ..util import n_choose_k
 
 
@@ -79,3 +83,102 @@ def ConnectedDarkModelHasCorrectNumberOfStatesAndRoutes():
     nose.tools.ok_(num_routes > 0, "Model doesn't have routes.")
     print model.state_collection
     print model.route_collection
+
+@nose.tools.istest
+def rate_matrix_has_one_entry_per_route():
+    parameter_set = DoubleDarkParameterSet()
+    parameter_set.set_parameter('N', 4)
+    parameter_set.set_parameter('log_kr_diff', -1.0)
+    model_factory = DoubleDarkBlinkFactory()
+    model = model_factory.create_model(parameter_set)
+    rate_matrix = model.build_rate_matrix(time=0.0)
+    for r_id, r in model.route_collection.iter_routes():
+        expected_rate = r['multiplicity'] * rate_from_rate_id(
+                            r['rate_id'], 0.0, parameter_set, False)
+        rate = rate_matrix.get_rate(r['start_state'], r['end_state'])
+        error_message = "Expected %.4e, got %.4e for route %s" % \
+                        (expected_rate, rate, r_id)
+        nose.tools.ok_(numpy.allclose(rate, expected_rate), error_message)
+    Q = rate_matrix.as_npy_array()
+    nose.tools.eq_(numpy.count_nonzero(Q - numpy.diag(Q.diagonal())),
+                   model.get_num_routes())
+    nose.tools.ok_(numpy.allclose(Q.sum(1), 0.0))
+
+@nose.tools.istest
+def factory_reuses_topology_for_models_with_same_N():
+    model_factory = SingleDarkBlinkFactory(MAX_A=5)
+    parameter_set1 = SingleDarkParameterSet()
+    parameter_set1.set_parameter('N', 4)
+    parameter_set2 = SingleDarkParameterSet()
+    parameter_set2.set_parameter('N', 4)
+    parameter_set2.set_parameter('log_kb', 1.5)
+    model1 = model_factory.create_model(parameter_set1)
+    model2 = model_factory.create_model(parameter_set2)
+    nose.tools.ok_(model1.compiled_routes is model2.compiled_routes)
+    nose.tools.ok_(model2.parameter_set is parameter_set2)
+    fresh_model = model_factory.build_model(parameter_set2)
+    nose.tools.ok_(numpy.allclose(model2.build_rate_matrix().as_npy_array(),
+                   fresh_model.build_rate_matrix().as_npy_array()))
+    nose.tools.ok_(not numpy.allclose(
+                    model1.build_rate_matrix().as_npy_array(),
+                    model2.build_rate_matrix().as_npy_array()))
+    parameter_set2.set_parameter('N', 5)
+    model3 = model_factory.create_model(parameter_set2)
+    nose.tools.eq_(model3.get_num_states(), n_choose_k(5+3, 3))
+    nose.tools.eq_(len(model_factory.topology_cache), 2)
+
+@nose.tools.istest
+def routes_follow_transition_population_changes():
+    # the connected dark model moves fluorophores from D1 to D2,
+    # with a multiplicity of the D1 population
+    parameter_set = ConnectedDarkParameterSet()
+    parameter_set.set_parameter('N', 4)
+    model_factory = ConnectedDarkBlinkFactory(MAX_A=2)
+    model = model_factory.create_model(parameter_set)
+    num_kd2_routes = 0
+    for r_id, r in model.route_collection.iter_routes():
+        start_pops = [int(p) for p in r['start_state'].split('_')]
+        end_pops = [int(p) for p in r['end_state'].split('_')]
+        nose.tools.eq_(r_id, "%s__%s" % (r['start_state'], r['end_state']))
+        nose.tools.ok_(end_pops[1] <= 2)
+        if r['rate_id'] == 'kd2':
+            num_kd2_routes += 1
+            nose.tools.eq_(numpy.subtract(end_pops, start_pops).tolist(),
+                           [0, 0, -1, 1, 0])
+            nose.tools.eq_(r['multiplicity'], start_pops[2])
+    num_states_with_D1 = sum([int(state_id.split('_')[2]) > 0
+                              for state_id in model.state_id_collection])
+    nose.tools.eq_(num_kd2_routes, num_states_with_D1)
+
+@nose.tools.istest
+def factory_loads_topology_from_disk_cache():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        parameter_set = DoubleDarkParameterSet()
+        parameter_set.set_parameter('N', 4)
+        model_factory = DoubleDarkBlinkFactory(MAX_A=3,
+                                               topology_cache_dir=cache_dir)
+        model = model_factory.create_model(parameter_set)
+        topology_key = model_factory.get_disk_topology_key(parameter_set)
+        nose.tools.ok_(model_factory.disk_cache.has_topology(topology_key))
+        # a new factory, as in another process, loads the saved topology
+        model_factory = DoubleDarkBlinkFactory(MAX_A=3,
+                                               topology_cache_dir=cache_dir)
+        model_factory.build_model = None
+        cached_model = model_factory.create_model(parameter_set)
+        nose.tools.eq_(cached_model.state_id_collection.as_list(),
+                       model.state_id_collection.as_list())
+        nose.tools.eq_(cached_model.initial_state_id, model.initial_state_id)
+        nose.tools.eq_(cached_model.final_state_id, model.final_state_id)
+        nose.tools.eq_(cached_model.get_num_routes(), model.get_num_routes())
+        nose.tools.ok_(numpy.allclose(
+                        cached_model.build_rate_matrix().as_npy_array(),
+                        model.build_rate_matrix().as_npy_array()))
+        nose.tools.ok_(numpy.allclose(
+                        cached_model.get_submatrix(
+                            cached_model.build_rate_matrix(),
+                            'dark', 'bright').as_npy_array(),
+                        model.get_submatrix(model.build_rate_matrix(),
+                                            'dark', 'bright').as_npy_array()))
+    finally:
+        shutil.rmtree(cache_dir)
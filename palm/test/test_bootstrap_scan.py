@@ -0,0 +1,105 @@
+import nose.tools
+import os
+import tempfile
+from ..bootstrap_scan import BootstrapScan
+from ..blink_factory import SingleDarkBlinkFactory
+from ..blink_parameter_set import SingleDarkParameterSet
+from ..likelihood_judge import CollectionLikelihoodJudge
+from ..forward_likelihood import ForwardPredictor
+from ..linalg import ScipyMatrixExponential
+from ..local_task_manager import LocalTaskManager
+
+
+def score_fixed_parameters(N, target_data):
+    # a stand-in for an optimization, which would take too long here
+    parameter_set = SingleDarkParameterSet()
+    parameter_set.set_parameter('N', N)
+    model = SingleDarkBlinkFactory(MAX_A=5).create_model(parameter_set)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    score = CollectionLikelihoodJudge().judge_prediction(
+                model, data_predictor, target_data)
+    return N, score, parameter_set
+
+def count_warm_starts(N, target_data, warm_start=None):
+    # log_kb counts the fits in the chain of warm starts
+    parameter_set = SingleDarkParameterSet()
+    parameter_set.set_parameter('N', N)
+    if warm_start is None:
+        parameter_set.set_parameter('log_kb', 0.0)
+    else:
+        previous_params = warm_start.get_nearest_best_params_as_series('N', N)
+        parameter_set.set_parameter('log_kb', previous_params['log_kb'] + 1)
+    return N, 1.0, parameter_set
+
+def double_number(x):
+    return 2 * x
+
+@nose.tools.istest
+def local_task_manager_collects_results_of_all_tasks():
+    task_manager = LocalTaskManager(num_processes=2)
+    task_manager.start()
+    try:
+        for i in xrange(5):
+            task_manager.add_task(double_number, (i,))
+        result_list = []
+        while len(result_list) < 5:
+            task_manager.wait_for_tasks(1.0)
+            result_list += task_manager.collect_results_from_completed_tasks()
+        nose.tools.eq_(task_manager.count_unfinished_tasks(), 0)
+    finally:
+        task_manager.stop()
+    nose.tools.eq_(result_list, [0, 2, 4, 6, 8])
+
+@nose.tools.istest
+def resumed_scan_only_runs_unfinished_fits():
+    handle, checkpoint_file = tempfile.mkstemp(suffix='.pkl')
+    os.close(handle)
+    os.remove(checkpoint_file)
+    data_file = "./palm/test/test_data/traj_directory.txt"
+    try:
+        scan = BootstrapScan(score_fixed_parameters, data_file,
+                             bootstrap_size=3, N_list=[1, 2],
+                             checkpoint_file=checkpoint_file,
+                             num_processes=2)
+        num_fits = scan.run([0, 1], poll_interval=0.1)
+        nose.tools.eq_(num_fits, 4)
+        nose.tools.eq_(len(scan.make_psd()), 4)
+        resumed_scan = BootstrapScan(score_fixed_parameters, data_file,
+                                     bootstrap_size=3, N_list=[1, 2],
+                                     checkpoint_file=checkpoint_file,
+                                     num_processes=2)
+        nose.tools.eq_(resumed_scan.finished_fits, scan.finished_fits)
+        num_fits = resumed_scan.run([0, 1, 2], poll_interval=0.1)
+        nose.tools.eq_(num_fits, 2)
+        psd = resumed_scan.make_psd()
+        nose.tools.eq_(len(psd), 6)
+        # fits of the same bootstrap id share their resampled data
+        for bootstrap_id in [0, 1, 2]:
+            selected_df = psd.select_param_sets('bootstrap_id', bootstrap_id)
+            nose.tools.eq_(len(set(selected_df['num segments'])), 1)
+    finally:
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+
+@nose.tools.istest
+def warm_started_scan_seeds_each_fit_from_previous_N():
+    handle, checkpoint_file = tempfile.mkstemp(suffix='.pkl')
+    os.close(handle)
+    os.remove(checkpoint_file)
+    data_file = "./palm/test/test_data/traj_directory.txt"
+    try:
+        scan = BootstrapScan(count_warm_starts, data_file,
+                             bootstrap_size=3, N_list=[1, 2, 3],
+                             checkpoint_file=checkpoint_file,
+                             num_processes=2, warm_start=True)
+        num_fits = scan.run([0, 1], poll_interval=0.1)
+        nose.tools.eq_(num_fits, 6)
+        psd = scan.make_psd()
+        for bootstrap_id in [0, 1]:
+            selected_df = psd.select_param_sets('bootstrap_id', bootstrap_id)
+            selected_df = selected_df.sort_index(by='N')
+            nose.tools.eq_(list(selected_df['log_kb']), [0.0, 1.0, 2.0])
+    finally:
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
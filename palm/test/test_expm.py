@@ -1,10 +1,14 @@
 import nose.tools
 import numpy
 import scipy.linalg
+import scipy.sparse
 from ..linalg import ScipyMatrixExponential, ScipyMatrixExponential2,\
-                        DiagonalExpm
+                        DiagonalExpm, EigenMatrixExponential,\
+                        ExpmMultiplyExponential
 from ..rate_matrix import make_rate_matrix_from_state_ids
 from ..state_collection import StateIDCollection
+from ..blink_factory import SingleDarkBlinkFactory
+from ..blink_parameter_set import SingleDarkParameterSet
 
 
 @nose.tools.istest
@@ -35,3 +39,47 @@ def compute_correct_exponential_for_diagonal_matrix():
     m = DiagonalExpm()
     diag_expm = m.compute_matrix_exp(Q, 1.0)
     nose.tools.ok_(numpy.allclose(diag_expm.data_frame.values, pade_expm))
+
+@nose.tools.istest
+def reused_eigen_decomposition_matches_pade_for_all_dwell_times():
+    ps = SingleDarkParameterSet()
+    ps.set_parameter('N', 5)
+    model = SingleDarkBlinkFactory().create_model(ps)
+    Q = model.build_rate_matrix(time=0.0)
+    Q_bb = model.get_submatrix(Q, 'bright', 'bright').as_npy_array()
+    vec = numpy.random.uniform(0.0, 1.0, len(Q_bb))
+    m = EigenMatrixExponential()
+    for dwell_time in [0.01, 0.1, 1.0, 5.0]:
+        pade_expm = scipy.linalg.expm(Q_bb * dwell_time)
+        eigen_expm = m.compute_array_exp(Q_bb, dwell_time)
+        nose.tools.ok_(numpy.allclose(eigen_expm, pade_expm))
+        eigen_vexp = m.compute_array_vexp(vec, Q_bb, dwell_time)
+        nose.tools.ok_(numpy.allclose(eigen_vexp, numpy.dot(vec, pade_expm)))
+    nose.tools.eq_(len(m.decomposition_dict), 1)
+
+@nose.tools.istest
+def defective_matrix_falls_back_to_pade():
+    Q_array = numpy.array([[-1.0, 1.0], [0.0, -1.0]])
+    m = EigenMatrixExponential()
+    Q, w, V, V_inv = m.get_decomposition(Q_array)
+    nose.tools.ok_(w is None)
+    pade_expm = scipy.linalg.expm(Q_array * 2.0)
+    nose.tools.ok_(numpy.allclose(m.compute_array_exp(Q_array, 2.0),
+                                  pade_expm))
+
+@nose.tools.istest
+def expm_multiply_matches_pade_for_dense_and_sparse_matrices():
+    ps = SingleDarkParameterSet()
+    ps.set_parameter('N', 5)
+    model = SingleDarkBlinkFactory().create_model(ps)
+    Q = model.build_rate_matrix(time=0.0)
+    Q_bb = model.get_submatrix(Q, 'bright', 'bright').as_npy_array()
+    vec = numpy.random.uniform(0.0, 1.0, len(Q_bb))
+    m = ExpmMultiplyExponential()
+    for dwell_time in [0.01, 1.0, 5.0]:
+        expected_vexp = numpy.dot(vec, scipy.linalg.expm(Q_bb * dwell_time))
+        dense_vexp = m.compute_array_vexp(vec, Q_bb, dwell_time)
+        nose.tools.ok_(numpy.allclose(dense_vexp, expected_vexp))
+        sparse_vexp = m.compute_array_vexp(vec, scipy.sparse.csr_matrix(Q_bb),
+                                           dwell_time)
+        nose.tools.ok_(numpy.allclose(sparse_vexp, expected_vexp))
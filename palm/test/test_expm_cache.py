@@ -0,0 +1,59 @@
+import nose.tools
+import numpy
+from ..expm_cache import MatrixExponentialCache
+from ..blink_factory import SingleDarkBlinkFactory
+from ..blink_parameter_set import SingleDarkParameterSet
+from ..blink_target_data import BlinkCollectionTargetData
+from ..likelihood_judge import CollectionLikelihoodJudge
+from ..forward_likelihood import ForwardPredictor
+from ..linalg import ScipyMatrixExponential
+
+
+@nose.tools.istest
+def least_recently_used_matrix_is_evicted_first():
+    cache = MatrixExponentialCache(max_size=2)
+    key1 = cache.make_key('model', 'dark', 0.1)
+    key2 = cache.make_key('model', 'dark', 0.2)
+    key3 = cache.make_key('model', 'bright', 0.1)
+    cache.add_matrix(key1, numpy.eye(2))
+    cache.add_matrix(key2, numpy.eye(2))
+    cache.get_matrix(key1)
+    cache.add_matrix(key3, numpy.eye(2))
+    nose.tools.eq_(len(cache), 2)
+    nose.tools.ok_(cache.get_matrix(key1) is not None)
+    nose.tools.ok_(cache.get_matrix(key2) is None)
+    nose.tools.eq_(cache.hits, 2)
+    nose.tools.eq_(cache.misses, 1)
+
+@nose.tools.istest
+def dwell_times_within_resolution_share_a_key():
+    cache = MatrixExponentialCache(time_resolution=1e-6)
+    key1 = cache.make_key('model', 'dark', 0.3)
+    key2 = cache.make_key('model', 'dark', 0.1 * 3)
+    nose.tools.eq_(key1, key2)
+
+@nose.tools.istest
+def cached_likelihood_matches_uncached_likelihood():
+    model_factory = SingleDarkBlinkFactory()
+    model_parameters = SingleDarkParameterSet()
+    model_parameters.set_parameter('N', 3)
+    model = model_factory.create_model(model_parameters)
+    target_data = BlinkCollectionTargetData()
+    target_data.load_data('./palm/test/test_data/traj_directory.txt')
+    judge = CollectionLikelihoodJudge()
+    predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                 always_rebuild_rate_matrix=False)
+    expected_score = judge.judge_prediction(model, predictor, target_data)
+    cache = MatrixExponentialCache()
+    cached_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                        always_rebuild_rate_matrix=False,
+                                        expm_cache=cache)
+    score = judge.judge_prediction(model, cached_predictor, target_data)
+    nose.tools.ok_(abs(expected_score - score) < 1e-10,
+                   "Expected %.6f, got %.6f" % (expected_score, score))
+    # every trajectory in the collection is identical, so only
+    # the first one should miss the cache
+    num_segments = target_data.get_total_number_of_trajectory_segments()
+    num_distinct_segments = num_segments / len(target_data)
+    nose.tools.eq_(cache.misses, num_distinct_segments)
+    nose.tools.eq_(cache.hits, num_segments - num_distinct_segments)
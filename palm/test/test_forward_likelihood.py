@@ -1,10 +1,14 @@
 import os.path
 import nose.tools
+import numpy
 from ..forward_likelihood import ForwardPredictor
+from ..forward_calculator import ForwardCalculator
 from ..blink_factory import SingleDarkBlinkFactory
 from ..blink_parameter_set import SingleDarkParameterSet
-from ..blink_target_data import BlinkTargetData
-from ..linalg import ScipyMatrixExponential
+from ..blink_target_data import BlinkTargetData, BlinkCollectionTargetData
+from ..likelihood_judge import CollectionLikelihoodJudge
+from ..linalg import ScipyMatrixExponential, EigenMatrixExponential,\
+                     vector_product
 
 
 @nose.tools.istest
@@ -44,3 +48,136 @@ def computes_likelihood_successfully_with_two_observable_bright_classes():
     model = model_factory.create_model(model_parameters)
     trajectory = target_data.get_feature()
     forward_prediction = forward_predictor.predict_data(model, trajectory)
+
+def compute_aligned_log_likelihood(model, trajectory):
+    """
+    Reference calculation that aligns state ids at every step.
+    """
+    fwd_calculator = ForwardCalculator(ScipyMatrixExponential())
+    Q = model.build_rate_matrix(time=0.0)
+    alpha = model.get_initial_probability_vector()
+    log_likelihood = 0.0
+    for segment_number, segment in enumerate(trajectory):
+        start_class = segment.get_class()
+        next_segment = trajectory.get_segment(segment_number + 1)
+        Q_aa = model.get_submatrix(Q, start_class, start_class)
+        if next_segment:
+            Q_ab = model.get_submatrix(Q, start_class,
+                                       next_segment.get_class())
+        else:
+            Q_ab = None
+        alpha = fwd_calculator.compute_forward_vector(
+                    alpha, Q_aa, Q_ab, segment.get_duration())
+        alpha_sum = alpha.sum_vector()
+        alpha.scale_vector(1./alpha_sum)
+        alpha.fill_na(0.)
+        log_likelihood += numpy.log10(alpha_sum)
+    final_prob = model.get_final_probability_vector()
+    log_likelihood += numpy.log10(vector_product(alpha, final_prob))
+    return log_likelihood
+
+@nose.tools.istest
+def array_forward_pass_matches_aligned_calculation():
+    model_factory = SingleDarkBlinkFactory(MAX_A=5)
+    model_parameters = SingleDarkParameterSet()
+    model_parameters.set_parameter('N', 5)
+    model_parameters.set_parameter('log_ka', -0.5)
+    model_parameters.set_parameter('log_kd',  1.0)
+    model_parameters.set_parameter('log_kr', -1.0)
+    model_parameters.set_parameter('log_kb',  0.0)
+    forward_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                         always_rebuild_rate_matrix=False)
+    target_data = BlinkTargetData()
+    data_path = os.path.join("palm", "test", "test_data",
+                             "blink_model_05.psc_TimeSim5.csv")
+    target_data.load_data(data_file=data_path)
+    model = model_factory.create_model(model_parameters)
+    trajectory = target_data.get_feature()
+    forward_prediction = forward_predictor.predict_data(model, trajectory)
+    log_likelihood = forward_prediction.as_array()[0]
+    expected_log_likelihood = compute_aligned_log_likelihood(model, trajectory)
+    error_message = "Expected %.6f, got %.6f" % (expected_log_likelihood,
+                                                log_likelihood)
+    nose.tools.ok_(abs(expected_log_likelihood - log_likelihood) < 1e-8,
+                   error_message)
+
+@nose.tools.istest
+def analytic_gradient_matches_finite_differences():
+    model_factory = SingleDarkBlinkFactory(MAX_A=5)
+    model_parameters = SingleDarkParameterSet()
+    model_parameters.set_parameter('N', 3)
+    model_parameters.set_parameter('log_ka', -0.5)
+    model_parameters.set_parameter('log_kd',  1.0)
+    model_parameters.set_parameter('log_kr', -1.0)
+    model_parameters.set_parameter('log_kb',  0.0)
+    forward_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                         always_rebuild_rate_matrix=False)
+    target_data = BlinkTargetData()
+    data_path = os.path.join("palm", "test", "test_data",
+                             "blink_model_05.psc_TimeSim5.csv")
+    target_data.load_data(data_file=data_path)
+    trajectory = target_data.get_feature()
+    model = model_factory.create_model(model_parameters)
+    prediction, gradient = forward_predictor.predict_data_and_gradient(
+                                model, trajectory)
+    expected_log_likelihood = forward_predictor.predict_data(
+                                model, trajectory).as_array()[0]
+    nose.tools.ok_(abs(prediction.as_array()[0] - expected_log_likelihood)\
+                   < 1e-10)
+    parameter_array = model_parameters.as_array()
+    delta = 1e-6
+    for i in xrange(4):
+        log_likelihoods = []
+        for sign in [1.0, -1.0]:
+            shifted_array = parameter_array.copy()
+            shifted_array[i] += sign * delta
+            model_parameters.update_from_array(shifted_array)
+            shifted_model = model_factory.create_model(model_parameters)
+            shifted_prediction = forward_predictor.predict_data(
+                                    shifted_model, trajectory)
+            log_likelihoods.append(shifted_prediction.as_array()[0])
+        model_parameters.update_from_array(parameter_array)
+        expected_derivative = (log_likelihoods[0] - log_likelihoods[1]) /\
+                              (2 * delta)
+        error_message = "Expected %.6f, got %.6f" % (expected_derivative,
+                                                    gradient[i])
+        nose.tools.ok_(abs(expected_derivative - gradient[i]) < 1e-5,
+                       error_message)
+
+@nose.tools.istest
+def transfer_table_matches_segment_by_segment_calculation():
+    model_factory = SingleDarkBlinkFactory(MAX_A=3)
+    model_parameters = SingleDarkParameterSet()
+    model_parameters.set_parameter('N', 3)
+    model = model_factory.create_model(model_parameters)
+    target_data = BlinkCollectionTargetData(frame_period=0.1)
+    target_data.load_data('./palm/test/test_data/traj_directory.txt')
+    forward_predictor = ForwardPredictor(EigenMatrixExponential(),
+                                         always_rebuild_rate_matrix=False)
+    table_predictor = ForwardPredictor(EigenMatrixExponential(),
+                                       always_rebuild_rate_matrix=False,
+                                       use_transfer_table=True)
+    judge = CollectionLikelihoodJudge()
+    score = judge.judge_prediction(model, forward_predictor, target_data)
+    table_score = judge.judge_prediction(model, table_predictor, target_data)
+    nose.tools.assert_almost_equal(score, table_score)
+    # for each distinct dwell time of a class, its exponential and
+    # its transfer matrix to the other class
+    transfer_table = table_predictor.transfer_table
+    class_names = target_data.get_distinct_dwells()[0]
+    nose.tools.eq_(len(transfer_table), 2 * len(class_names))
+    # the table is kept while the collection does not change, and
+    # also covers lists of its trajectories
+    judge.judge_prediction(model, table_predictor, target_data)
+    nose.tools.ok_(table_predictor.transfer_table is transfer_table)
+    table_predictor.predict_collection(model, [traj for traj in target_data])
+    nose.tools.ok_(table_predictor.transfer_table is transfer_table)
+    nose.tools.eq_(transfer_table.get_transfer_array('dark', 'bright',
+                                                     0.4).shape,
+                   (model.get_num_states('dark'),
+                    model.get_num_states('bright')))
+    # the table is released when the parameters change
+    model_parameters.set_parameter('log_kb', 0.5)
+    trajectory = target_data.get_feature_by_index(0).get_feature()
+    table_predictor.predict_data(model, trajectory)
+    nose.tools.ok_(table_predictor.transfer_table is None)
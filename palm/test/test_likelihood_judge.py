@@ -0,0 +1,101 @@
+import nose.tools
+from ..blink_factory import SingleDarkBlinkFactory
+from ..blink_parameter_set import SingleDarkParameterSet
+from ..likelihood_judge import CollectionLikelihoodJudge,\
+                               ParallelCollectionLikelihoodJudge
+from ..forward_likelihood import ForwardPredictor
+from ..batched_forward_likelihood import BatchedForwardPredictor
+from ..blink_target_data import BlinkTargetData, BlinkCollectionTargetData
+from ..linalg import ScipyMatrixExponential
+from ..benchmark import make_synthetic_collection
+
+
+@nose.tools.istest
+def parallel_judge_gives_same_score_as_serial_judge():
+    model_factory = SingleDarkBlinkFactory(MAX_A=5)
+    model_parameters = SingleDarkParameterSet()
+    model_parameters.set_parameter('N', 3)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    target_data = BlinkCollectionTargetData()
+    target_data.load_data(data_file="./palm/test/test_data/traj_directory.txt")
+    serial_judge = CollectionLikelihoodJudge()
+    parallel_judge = ParallelCollectionLikelihoodJudge(num_processes=2)
+    try:
+        for log_kb in [-1.0, 0.5]:
+            model_parameters.set_parameter('log_kb', log_kb)
+            model = model_factory.create_model(model_parameters)
+            serial_score = serial_judge.judge_prediction(
+                                model, data_predictor, target_data)
+            parallel_score = parallel_judge.judge_prediction(
+                                model, data_predictor, target_data)
+            error_message = "Expected %.6f, got %.6f" % (serial_score,
+                                                         parallel_score)
+            nose.tools.ok_(abs(serial_score - parallel_score) < 1e-10,
+                           error_message)
+            if log_kb == -1.0:
+                first_pool = parallel_judge.pool
+        # only the parameter values changed, so the pool is reused
+        nose.tools.ok_(parallel_judge.pool is first_pool)
+    finally:
+        parallel_judge.close()
+    nose.tools.eq_(sorted(sum(parallel_judge.chunk_list, [])),
+                   range(len(target_data)))
+
+@nose.tools.istest
+def parallel_judge_restarts_pool_for_each_new_collection():
+    # collections that are deleted after use may leave their ids to
+    # the next collection, which must not reuse the stale workers
+    model_factory = SingleDarkBlinkFactory(MAX_A=5)
+    model_parameters = SingleDarkParameterSet()
+    model_parameters.set_parameter('N', 3)
+    model = model_factory.create_model(model_parameters)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    serial_judge = CollectionLikelihoodJudge()
+    parallel_judge = ParallelCollectionLikelihoodJudge(num_processes=2)
+    try:
+        for random_seed in xrange(4):
+            target_data = make_synthetic_collection(4,
+                                                    random_seed=random_seed)
+            serial_score = serial_judge.judge_prediction(
+                                model, data_predictor, target_data)
+            parallel_score = parallel_judge.judge_prediction(
+                                model, data_predictor, target_data)
+            error_message = "Expected %.6f, got %.6f" % (serial_score,
+                                                         parallel_score)
+            nose.tools.ok_(abs(serial_score - parallel_score) < 1e-10,
+                           error_message)
+            del target_data
+    finally:
+        parallel_judge.close()
+
+@nose.tools.istest
+def batched_predictor_gives_same_likelihoods_as_forward_predictor():
+    model_factory = SingleDarkBlinkFactory(MAX_A=5)
+    model_parameters = SingleDarkParameterSet()
+    model_parameters.set_parameter('N', 3)
+    model = model_factory.create_model(model_parameters)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    batched_predictor = BatchedForwardPredictor(ScipyMatrixExponential())
+    target_data = BlinkCollectionTargetData()
+    target_data.load_data(data_file="./palm/test/test_data/traj_directory.txt")
+    long_target = BlinkTargetData()
+    long_target.load_data(
+        data_file="./palm/test/test_data/blink_model_05.psc_TimeSim5.csv")
+    target_data.target_data_collection.append(long_target)
+    batched_prediction = batched_predictor.predict_collection(model,
+                                                              target_data)
+    nose.tools.eq_(len(batched_prediction), len(target_data))
+    for trajectory, batched_log_lh in zip(target_data,
+                                          batched_prediction.as_array()):
+        log_lh = data_predictor.predict_data(model, trajectory).likelihood
+        error_message = "Expected %.6f, got %.6f" % (log_lh, batched_log_lh)
+        nose.tools.ok_(abs(log_lh - batched_log_lh) < 1e-10, error_message)
+    judge = CollectionLikelihoodJudge()
+    serial_score = judge.judge_prediction(model, data_predictor, target_data)
+    batched_score = judge.judge_prediction(model, batched_predictor,
+                                           target_data)
+    error_message = "Expected %.6f, got %.6f" % (serial_score, batched_score)
+    nose.tools.ok_(abs(serial_score - batched_score) < 1e-10, error_message)
@@ -8,7 +8,8 @@ from ..linalg import vector_product, vector_matrix_product,\
                         asym_vector_matrix_product,\
                         symmetric_matrix_matrix_product,\
                         asymmetric_matrix_matrix_product,\
-                        ScipyMatrixExponential,\
+                        ScipyMatrixExponential, EigenMatrixExponential,\
+                        DiagonalExpm, compute_array_exp_batch,\
                         matrix_vector_product, asym_matrix_vector_product
 from ..util import ALMOST_ZERO
 
@@ -491,3 +492,19 @@ def compute_matrix_exponential():
     rate_matrix.balance_transition_rates()
     expQt_matrix = expm.compute_matrix_exp(rate_matrix, dwell_time=0.1)
 
+@nose.tools.istest
+def batched_matrix_exponentials_match_single_exponentials():
+    Q = numpy.array([[-1.0, 0.6, 0.4], [0.2, -0.5, 0.3], [0.0, 0.1, -0.1]])
+    dwell_times = numpy.array([0.1, 0.5, 2.0])
+    reference_calculator = ScipyMatrixExponential()
+    for expm_calculator in [ScipyMatrixExponential(),
+                            EigenMatrixExponential()]:
+        expQt_array = compute_array_exp_batch(expm_calculator, Q, dwell_times)
+        for k, dwell_time in enumerate(dwell_times):
+            nose.tools.ok_(numpy.allclose(
+                expQt_array[k],
+                reference_calculator.compute_array_exp(Q, dwell_time)))
+    diag_Q = numpy.diag(Q.diagonal())
+    expQt_array = compute_array_exp_batch(DiagonalExpm(), diag_Q, dwell_times)
+    nose.tools.ok_(numpy.allclose(
+        expQt_array[2], reference_calculator.compute_array_exp(diag_Q, 2.0)))
@@ -7,8 +7,12 @@ from ..blink_factory import SingleDarkBlinkFactory
 from ..blink_parameter_set import SingleDarkParameterSet
 from ..likelihood_judge import CollectionLikelihoodJudge
 from ..forward_likelihood import ForwardPredictor
-from ..blink_target_data import BlinkCollectionTargetData
+from ..blink_target_data import BlinkTargetData, BlinkCollectionTargetData
+from ..discrete_state_trajectory import make_trajectory_from_class_names
 from ..linalg import ScipyMatrixExponential
+from ..minibatch_optimizer import MiniBatchOptimizer
+from ..scipy_optimizer import ScipyOptimizer
+from ..score_function import ScoreFunction
 
 
 EPSILON = 0.1
@@ -101,3 +105,59 @@ class TestComputeLikelihoodOfBlinkCollectionWithShortTrajectories(object):
             nose.tools.ok_(abs(delta_LL) < EPSILON, error_message)
         except:
             raise SkipTest
+
+
+def make_random_collection(num_trajectories, random_state):
+    target_data = BlinkCollectionTargetData()
+    target_data.target_data_collection = []
+    target_data.paths = []
+    for i in xrange(num_trajectories):
+        num_blinks = random_state.randint(1, 4)
+        class_names = ['dark', 'bright'] * num_blinks + ['dark']
+        dwell_times = random_state.exponential(1.0, len(class_names))
+        trajectory_data = BlinkTargetData()
+        trajectory_data.trajectory = make_trajectory_from_class_names(
+                                        class_names, dwell_times)
+        target_data.target_data_collection.append(trajectory_data)
+        target_data.paths.append(None)
+    return target_data
+
+@nose.tools.istest
+def minibatch_optimizer_ends_with_full_collection_score():
+    target_data = make_random_collection(16, numpy.random.RandomState(3))
+    model_factory = SingleDarkBlinkFactory(MAX_A=5)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    judge = CollectionLikelihoodJudge()
+    result_list = []
+    for optimizer in [ScipyOptimizer(),
+                      MiniBatchOptimizer(initial_batch_size=2,
+                                         random_seed=0)]:
+        model_parameters = SingleDarkParameterSet()
+        model_parameters.set_parameter('N', 1)
+        model_parameters.set_parameter_bounds('log_ka', -1., -1.)
+        for parameter_name in ['log_kd', 'log_kr', 'log_kb']:
+            model_parameters.set_parameter_bounds(parameter_name, -3., 3.)
+        score_fcn = ScoreFunction(model_factory, model_parameters, judge,
+                                  data_predictor, target_data)
+        if isinstance(optimizer, MiniBatchOptimizer):
+            new_params, score = optimizer.optimize_parameters(
+                                    score_fcn, model_parameters,
+                                    use_gradient=True)
+        else:
+            new_params, score = optimizer.optimize_parameters(
+                                    score_fcn.compute_score, model_parameters,
+                                    score_gradient_fcn=\
+                                        score_fcn.compute_score_and_gradient)
+        result_list.append((new_params.as_array(), score))
+    batch_size_list = [stage[0] for stage in optimizer.stage_list]
+    nose.tools.eq_(batch_size_list, [2, 4, 8, 16])
+    full_score = judge.judge_prediction(
+                    model_factory.create_model(new_params), data_predictor,
+                    target_data)
+    error_message = "Expected %.6f, got %.6f" % (full_score, score)
+    nose.tools.ok_(abs(full_score - score) < 1e-10, error_message)
+    error_message = "Expected %.6f, got %.6f" % (result_list[0][1],
+                                                 result_list[1][1])
+    nose.tools.ok_(abs(result_list[0][1] - result_list[1][1]) < 1e-4,
+                   error_message)
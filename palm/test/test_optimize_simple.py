@@ -6,6 +6,10 @@ from ..simple_model import SimpleParameterSet, SimpleModelFactory,\
 from ..likelihood_judge import LikelihoodJudge
 from ..forward_likelihood import ForwardPredictor
 from ..scipy_optimizer import ScipyOptimizer
+from ..multistart_optimizer import MultiStartOptimizer
+from ..score_function import ScoreFunction
+from ..discrete_state_trajectory import DiscreteStateTrajectory,\
+                                        DiscreteDwellSegment
 from ..linalg import ScipyMatrixExponential
 
 
@@ -152,3 +156,149 @@ class TestOptimizeSimpleModel(object):
         score = judge.judge_prediction(optimized_model, data_predictor,
                                        target_data)
         print score
+
+
+@nose.tools.istest
+def computes_correct_gradient_of_short_trajectory():
+    model_factory = SimpleModelFactory()
+    model_parameters = SimpleParameterSet()
+    model_parameters.set_parameter('log_k1', -0.5)
+    model_parameters.set_parameter('log_k2', 0.0)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    target_data = SimpleTargetData()
+    target_data.load_data(data_file="./palm/test/test_data/simple_2state_traj.csv")
+    model = model_factory.create_model(model_parameters)
+    trajectory = target_data.get_feature()
+    prediction, gradient = data_predictor.predict_data_and_gradient(
+                                model, trajectory)
+    # log10 L = log10(k1 e^{-k1 t1} k2 e^{-k2 t2} k1 e^{-k1 t3} e^{-k2 t4})
+    k1 = 10**(-0.5)
+    k2 = 10**(0.0)
+    expected_gradient = numpy.array([2.0 - k1 * (1.5 + 1.2),
+                                     1.0 - k2 * (0.3 + 0.1)])
+    nose.tools.ok_(numpy.allclose(gradient, expected_gradient),
+                   "Expected %s, got %s" % (expected_gradient, gradient))
+
+@nose.tools.istest
+def optimizer_uses_analytic_gradient():
+    model_factory = SimpleModelFactory()
+    model_parameters = SimpleParameterSet()
+    model_parameters.set_parameter('log_k1', -0.5)
+    model_parameters.set_parameter('log_k2', -0.5)
+    model_parameters.set_parameter_bounds('log_k1', -3., 3.)
+    model_parameters.set_parameter_bounds('log_k2', -3., 3.)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    target_data = SimpleTargetData()
+    target_data.load_data(data_file="./palm/test/test_data/simple_2state_traj.csv")
+    score_fcn = ScoreFunction(model_factory, model_parameters,
+                              LikelihoodJudge(), data_predictor, target_data)
+    optimizer = ScipyOptimizer()
+    new_params, score = optimizer.optimize_parameters(
+                            score_fcn.compute_score, model_parameters,
+                            score_gradient_fcn=score_fcn.compute_score_and_gradient)
+    # the maximum likelihood rates are (number of exits) / (total dwell)
+    expected_array = numpy.log10([2 / (1.5 + 1.2), 1 / (0.3 + 0.1)])
+    nose.tools.ok_(numpy.allclose(new_params.as_array(), expected_array,
+                                  atol=1e-3),
+                   "Expected %s, got %s" % (expected_array,
+                                            new_params.as_array()))
+
+@nose.tools.istest
+def warm_start_reduces_number_of_score_evaluations():
+    model_factory = SimpleModelFactory()
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    target_data = SimpleTargetData()
+    target_data.load_data(data_file="./palm/test/test_data/simple_2state_traj.csv")
+    previous_fit = SimpleParameterSet()
+    previous_fit.set_parameter('log_k1', numpy.log10(2 / (1.5 + 1.2)) + 0.01)
+    previous_fit.set_parameter('log_k2', numpy.log10(1 / (0.3 + 0.1)) - 0.01)
+    num_evaluations = []
+    for warm_start in [None, previous_fit]:
+        model_parameters = SimpleParameterSet()
+        model_parameters.set_parameter('log_k1', -2.0)
+        model_parameters.set_parameter('log_k2', 1.5)
+        model_parameters.set_parameter_bounds('log_k1', -3., 3.)
+        model_parameters.set_parameter_bounds('log_k2', -3., 3.)
+        score_fcn = ScoreFunction(model_factory, model_parameters,
+                                  LikelihoodJudge(), data_predictor,
+                                  target_data)
+        evaluation_list = []
+        def counting_score_fcn(x):
+            evaluation_list.append(x)
+            return score_fcn.compute_score_and_gradient(x)
+        optimizer = ScipyOptimizer()
+        new_params, score = optimizer.optimize_parameters(
+                                score_fcn.compute_score, model_parameters,
+                                score_gradient_fcn=counting_score_fcn,
+                                warm_start=warm_start)
+        num_evaluations.append(len(evaluation_list))
+    error_message = "Expected fewer than %d evaluations, got %d" %\
+                    (num_evaluations[0], num_evaluations[1])
+    nose.tools.ok_(num_evaluations[1] < num_evaluations[0], error_message)
+
+@nose.tools.istest
+def multistart_optimizer_prunes_trailing_starts():
+    model_factory = SimpleModelFactory()
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    target_data = SimpleTargetData()
+    target_data.load_data(data_file="./palm/test/test_data/simple_2state_traj.csv")
+    start_list = []
+    for log_k1, log_k2 in [(-0.5, -0.5), (2.9, -2.9), (-2.9, 2.9), (0.0, 0.5)]:
+        start = SimpleParameterSet()
+        start.set_parameter('log_k1', log_k1)
+        start.set_parameter('log_k2', log_k2)
+        start.set_parameter_bounds('log_k1', -3., 3.)
+        start.set_parameter_bounds('log_k2', -3., 3.)
+        start_list.append(start)
+    model_parameters = start_list[0]
+    score_fcn = ScoreFunction(model_factory, model_parameters,
+                              LikelihoodJudge(), data_predictor, target_data)
+    optimizer = MultiStartOptimizer(num_processes=2, iterations_per_round=2,
+                                    prune_margin=0.5, use_gradient=True)
+    new_params, score, end_point_psd = optimizer.optimize_parameters(
+                                        score_fcn, model_parameters,
+                                        start_list=start_list)
+    expected_array = numpy.log10([2 / (1.5 + 1.2), 1 / (0.3 + 0.1)])
+    nose.tools.ok_(numpy.allclose(new_params.as_array(), expected_array,
+                                  atol=1e-3),
+                   "Expected %s, got %s" % (expected_array,
+                                            new_params.as_array()))
+    nose.tools.eq_(len(end_point_psd), len(start_list))
+    status_array = end_point_psd.single_parameter_distribution_as_array(
+                    'status')
+    nose.tools.ok_('converged' in status_array)
+    nose.tools.ok_('pruned' in status_array, str(end_point_psd))
+    score_array = end_point_psd.single_parameter_distribution_as_array(
+                    'score')
+    nose.tools.ok_(abs(score_array.min() - score) < 1e-12)
+
+@nose.tools.istest
+def computes_correct_likelihood_of_very_long_trajectory():
+    model_factory = SimpleModelFactory()
+    model_parameters = SimpleParameterSet()
+    model_parameters.set_parameter('log_k1', -0.5)
+    model_parameters.set_parameter('log_k2', 0.0)
+    k1 = 10**(-0.5)
+    k2 = 10**(0.0)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    trajectory = DiscreteStateTrajectory()
+    num_cycles = 5000
+    for i in xrange(num_cycles):
+        trajectory.add_segment(DiscreteDwellSegment('green', 1.5))
+        trajectory.add_segment(DiscreteDwellSegment('orange', 0.3))
+    model = model_factory.create_model(model_parameters)
+    prediction = data_predictor.predict_data(model, trajectory)
+    log_likelihood = prediction.as_array()[0]
+    # every dwell ends in a transition, except the last one
+    expected_log_likelihood = num_cycles * numpy.log10(
+                                k1 * numpy.exp(-k1 * 1.5) *\
+                                k2 * numpy.exp(-k2 * 0.3))
+    expected_log_likelihood -= numpy.log10(k2)
+    nose.tools.ok_(abs(expected_log_likelihood - log_likelihood) < 1e-6,
+                   "Expected %.2f, got %.2f" % (expected_log_likelihood,
+                                                log_likelihood))
@@ -0,0 +1,115 @@
+import nose.tools
+import os.path
+import numpy
+import scipy.sparse
+from ..blink_factory import SingleDarkBlinkFactory
+from ..blink_parameter_set import SingleDarkParameterSet
+from ..blink_target_data import BlinkTargetData
+from ..forward_likelihood import ForwardPredictor, RateMatrixOrganizer
+from ..linalg import ScipyMatrixExponential, ExpmMultiplyExponential,\
+                     vector_matrix_product, matrix_vector_product,\
+                     asym_vector_matrix_product, asym_matrix_vector_product
+from ..probability_vector import make_prob_vec_from_state_ids
+
+
+def make_model():
+    model_factory = SingleDarkBlinkFactory(MAX_A=5)
+    model_parameters = SingleDarkParameterSet()
+    model_parameters.set_parameter('N', 5)
+    model_parameters.set_parameter('log_ka', -0.5)
+    model_parameters.set_parameter('log_kd',  1.0)
+    model_parameters.set_parameter('log_kr', -1.0)
+    model_parameters.set_parameter('log_kb',  0.0)
+    return model_factory.create_model(model_parameters)
+
+@nose.tools.istest
+def sparse_rate_matrix_matches_dense_rate_matrix():
+    model = make_model()
+    dense_Q = model.build_rate_matrix(time=0.0)
+    sparse_Q = model.build_rate_matrix(time=0.0, sparse=True)
+    nose.tools.ok_(scipy.sparse.isspmatrix_csr(sparse_Q.as_sparse_array()))
+    nose.tools.eq_(sparse_Q.get_shape(), dense_Q.get_shape())
+    nose.tools.eq_(sparse_Q.get_index_id_list(), dense_Q.get_index_id_list())
+    nose.tools.ok_(numpy.allclose(sparse_Q.as_npy_array(),
+                                  dense_Q.as_npy_array()))
+    row_sums = numpy.asarray(sparse_Q.as_sparse_array().sum(1)).ravel()
+    nose.tools.ok_(numpy.allclose(row_sums, 0.0))
+    nose.tools.ok_(sparse_Q.compute_sparsity() > 0.5)
+    for start_class in ['dark', 'bright']:
+        for end_class in ['dark', 'bright']:
+            dense_sub = model.get_submatrix(dense_Q, start_class, end_class)
+            sparse_sub = model.get_submatrix(sparse_Q, start_class, end_class)
+            nose.tools.eq_(sparse_sub.get_column_id_list(),
+                           dense_sub.get_column_id_list())
+            nose.tools.ok_(numpy.allclose(sparse_sub.as_npy_array(),
+                                          dense_sub.as_npy_array()))
+
+@nose.tools.istest
+def organizer_subarrays_are_views_of_grouped_rate_matrix():
+    model = make_model()
+    Q = model.build_rate_matrix(time=0.0)
+    dense_organizer = RateMatrixOrganizer(model)
+    dense_organizer.build_rate_matrix(time=0.0)
+    sparse_organizer = RateMatrixOrganizer(model, sparse=True)
+    sparse_organizer.build_rate_matrix(time=0.0)
+    for start_class in ['dark', 'bright']:
+        for end_class in ['dark', 'bright']:
+            expected_array = model.get_submatrix(
+                                Q, start_class, end_class).as_npy_array()
+            dense_sub = dense_organizer.get_subarray(start_class, end_class)
+            nose.tools.ok_(dense_sub.base is\
+                           dense_organizer.grouped_rate_array)
+            nose.tools.ok_(numpy.array_equal(dense_sub, expected_array))
+            sparse_sub = sparse_organizer.get_subarray(start_class,
+                                                       end_class)
+            nose.tools.ok_(numpy.allclose(sparse_sub.toarray(),
+                                          expected_array))
+            submatrix = dense_organizer.get_submatrix(start_class, end_class)
+            nose.tools.eq_(submatrix.get_index_id_list(),
+                        model.state_ids_by_class_dict[start_class].as_list())
+
+@nose.tools.istest
+def sparse_linalg_products_match_dense_products():
+    model = make_model()
+    dense_Q = model.build_rate_matrix(time=0.0)
+    sparse_Q = model.build_rate_matrix(time=0.0, sparse=True)
+    vec = make_prob_vec_from_state_ids(model.state_id_collection)
+    vec.series[:] = numpy.random.uniform(0.0, 1.0, len(vec))
+    nose.tools.ok_(vector_matrix_product(vec, dense_Q).allclose(
+                   vector_matrix_product(vec, sparse_Q)))
+    nose.tools.ok_(matrix_vector_product(dense_Q, vec).allclose(
+                   matrix_vector_product(sparse_Q, vec)))
+    dense_ab = model.get_submatrix(dense_Q, 'dark', 'bright')
+    sparse_ab = model.get_submatrix(sparse_Q, 'dark', 'bright')
+    dark_vec = make_prob_vec_from_state_ids(model.state_ids_by_class_dict['dark'])
+    dark_vec.set_uniform_state_probability()
+    nose.tools.ok_(asym_vector_matrix_product(dark_vec, dense_ab).allclose(
+                   asym_vector_matrix_product(dark_vec, sparse_ab)))
+    bright_vec = make_prob_vec_from_state_ids(
+                    model.state_ids_by_class_dict['bright'])
+    bright_vec.set_uniform_state_probability()
+    nose.tools.ok_(asym_matrix_vector_product(dense_ab, bright_vec).allclose(
+                   asym_matrix_vector_product(sparse_ab, bright_vec)))
+
+@nose.tools.istest
+def sparse_forward_pass_matches_dense_forward_pass():
+    model = make_model()
+    target_data = BlinkTargetData()
+    data_path = os.path.join("palm", "test", "test_data",
+                             "blink_model_05.psc_TimeSim5.csv")
+    target_data.load_data(data_file=data_path)
+    trajectory = target_data.get_feature()
+    dense_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                       always_rebuild_rate_matrix=False)
+    dense_log_lh = dense_predictor.predict_data(model, trajectory).likelihood
+    for expm_calculator in [ScipyMatrixExponential(),
+                            ExpmMultiplyExponential()]:
+        sparse_predictor = ForwardPredictor(expm_calculator,
+                                            always_rebuild_rate_matrix=False,
+                                            sparse_rate_matrix=True)
+        sparse_log_lh = sparse_predictor.predict_data(
+                            model, trajectory).likelihood
+        error_message = "Expected %.6f, got %.6f" % (dense_log_lh,
+                                                     sparse_log_lh)
+        nose.tools.ok_(abs(sparse_log_lh - dense_log_lh) < 1e-8,
+                       error_message)
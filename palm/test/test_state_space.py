@@ -0,0 +1,40 @@
+import nose.tools
+import numpy
+from ..state_space import PopulationSpace, count_compositions
+from ..blink_state_enumerator import DoubleDarkStateEnumeratorFactory
+from ..util import multichoose
+
+
+@nose.tools.istest
+def population_space_matches_filtered_multichoose():
+    species_names = ['I', 'A', 'D1', 'D2', 'B']
+    for N in [1, 4, 7]:
+        for max_A in [1, 3, 10]:
+            state_space = PopulationSpace(species_names, N, {'A':max_A})
+            expected = [c for c in multichoose(len(species_names), N)
+                        if c[1] <= max_A]
+            population_array = state_space.get_population_array()
+            nose.tools.eq_(population_array.tolist(), expected)
+            nose.tools.eq_(len(state_space), len(expected))
+            nose.tools.eq_(count_compositions(N, [None, max_A, None, None,
+                                                  None]),
+                           len(expected))
+            ranks = state_space.rank(population_array)
+            nose.tools.ok_(numpy.array_equal(ranks,
+                                             numpy.arange(len(expected))))
+            for i in [0, len(expected) // 2, len(expected) - 1]:
+                nose.tools.eq_(state_space.unrank(i), tuple(expected[i]))
+                nose.tools.eq_(state_space.rank(expected[i]), i)
+
+@nose.tools.istest
+def state_collection_is_ordered_by_rank():
+    enumerator_factory = DoubleDarkStateEnumeratorFactory(4, max_A=2)
+    state_enumerator = enumerator_factory.create_state_enumerator()
+    state_collection, initial_state_id, final_state_id = state_enumerator()
+    nose.tools.eq_(initial_state_id, '4_0_0_0_0')
+    nose.tools.eq_(final_state_id, '0_0_0_0_4')
+    state_space = state_collection.state_space
+    for i, state_id in enumerate(state_collection.get_state_ids()):
+        populations = state_space.unrank(i)
+        nose.tools.eq_(state_id, '_'.join([str(p) for p in populations]))
+        nose.tools.ok_(populations[1] <= 2)
@@ -0,0 +1,123 @@
+import nose.tools
+import os
+import tempfile
+import numpy
+from ..blink_target_data import BlinkCollectionTargetData
+from ..discrete_state_trajectory import DiscreteDwellSegment
+from ..trajectory_dataset import is_trajectory_dataset
+
+
+def load_collection():
+    target_data = BlinkCollectionTargetData()
+    target_data.load_data('./palm/test/test_data/traj_directory.txt')
+    return target_data
+
+@nose.tools.istest
+def trajectories_are_views_of_the_store():
+    target_data = load_collection()
+    trajectory_store = target_data.get_trajectory_store()
+    nose.tools.eq_(len(trajectory_store), len(target_data))
+    nose.tools.eq_(trajectory_store.class_codes.dtype, numpy.int8)
+    nose.tools.eq_(target_data.get_total_number_of_trajectory_segments(),
+                   sum([len(traj) for traj in target_data]))
+    for traj in target_data:
+        nose.tools.ok_(traj.get_dwell_time_array().base is
+                       trajectory_store.dwell_times)
+    # adding a segment copies the arrays of the view, and the
+    # collection rebuilds its store when it is next needed
+    traj = target_data.get_feature_by_index(0).get_feature()
+    num_segments = trajectory_store.get_num_segments()
+    traj.add_segment(DiscreteDwellSegment('bright_2', 1.0))
+    nose.tools.eq_(traj.get_segment(len(traj) - 1).get_class(), 'bright_2')
+    nose.tools.eq_(trajectory_store.get_num_segments(), num_segments)
+    nose.tools.ok_('bright_2' not in trajectory_store.class_name_list)
+    nose.tools.ok_(trajectory_store.is_modified)
+    nose.tools.eq_(target_data.get_total_number_of_trajectory_segments(),
+                   num_segments + 1)
+    nose.tools.eq_(target_data.get_total_number_of_trajectory_segments(),
+                   sum([len(traj) for traj in target_data]))
+    new_trajectory_store = target_data.get_trajectory_store()
+    nose.tools.ok_(new_trajectory_store is not trajectory_store)
+    nose.tools.ok_('bright_2' in new_trajectory_store.class_name_list)
+    class_names = target_data.get_distinct_dwells()[0]
+    nose.tools.ok_('bright_2' in class_names)
+
+@nose.tools.istest
+def distributions_match_per_trajectory_distributions():
+    target_data = load_collection()
+    selected_data = target_data.make_copy_from_selection([3, 0, 0])
+    nose.tools.eq_(len(selected_data), 3)
+    # the selection is an index view that shares the segment arrays
+    nose.tools.ok_(selected_data.get_trajectory_store().dwell_times is
+                   target_data.get_trajectory_store().dwell_times)
+    nose.tools.eq_(selected_data.get_total_number_of_trajectory_segments(),
+                   sum([len(traj) for traj in selected_data]))
+    for traj in selected_data:
+        nose.tools.ok_(target_data.has_element(traj))
+    bright_dist = []
+    dark_dist = []
+    num_blink_dist = []
+    for traj in selected_data:
+        excluded_dwells = [0, traj.get_last_segment_number()]
+        bright_dist += traj.get_bright_time_distribution()
+        dark_dist += traj.get_dark_time_distribution(excluded_dwells)
+        num_blink_dist.append(traj.get_num_blink(excluded_dwells))
+    nose.tools.eq_(list(selected_data.get_bright_time_distribution()),
+                   bright_dist)
+    nose.tools.eq_(list(selected_data.get_dark_time_distribution()),
+                   dark_dist)
+    nose.tools.eq_(list(selected_data.get_num_blink_distribution()),
+                   num_blink_dist)
+    activation_dist = [traj.get_activation_time() for traj in selected_data]
+    nose.tools.eq_(list(selected_data.get_activation_time_distribution()),
+                   activation_dist)
+    bleach_dist = [traj.get_bleach_time() for traj in selected_data]
+    nose.tools.ok_(numpy.allclose(selected_data.get_bleach_time_distribution(),
+                                  bleach_dist))
+
+@nose.tools.istest
+def dataset_file_loads_same_collection_as_path_list():
+    target_data = load_collection()
+    handle, dataset_file = tempfile.mkstemp(suffix='.dat')
+    os.close(handle)
+    try:
+        target_data.write_dataset(dataset_file)
+        nose.tools.ok_(is_trajectory_dataset(dataset_file))
+        nose.tools.ok_(not is_trajectory_dataset(
+                        './palm/test/test_data/traj_directory.txt'))
+        mapped_data = BlinkCollectionTargetData()
+        mapped_data.load_data(dataset_file)
+        trajectory_store = mapped_data.get_trajectory_store()
+        nose.tools.ok_(isinstance(trajectory_store.dwell_times, numpy.memmap))
+        nose.tools.eq_(mapped_data.get_paths(), target_data.get_paths())
+        nose.tools.eq_(len(mapped_data), len(target_data))
+        for traj, mapped_traj in zip(target_data, mapped_data):
+            nose.tools.eq_(traj.get_class_list(), mapped_traj.get_class_list())
+            nose.tools.ok_(numpy.array_equal(traj.get_dwell_time_array(),
+                                             mapped_traj.get_dwell_time_array()))
+        nose.tools.eq_(list(mapped_data.get_dark_time_distribution()),
+                       list(target_data.get_dark_time_distribution()))
+    finally:
+        os.remove(dataset_file)
+
+@nose.tools.istest
+def quantized_collection_records_distinct_dwells():
+    target_data = BlinkCollectionTargetData(frame_period=0.1)
+    target_data.load_data('./palm/test/test_data/traj_directory.txt')
+    for traj in target_data:
+        num_frames = traj.get_dwell_time_array() / 0.1
+        nose.tools.ok_(numpy.allclose(num_frames, [4, 1, 3, 1, 1]))
+    class_names, dwell_times, distinct_inds = target_data.distinct_dwells
+    nose.tools.eq_(class_names, ['dark', 'dark', 'dark', 'bright'])
+    nose.tools.ok_(numpy.allclose(dwell_times, [0.1, 0.3, 0.4, 0.1]))
+    trajectory_store = target_data.get_trajectory_store()
+    segment_inds = trajectory_store.get_segment_inds()
+    nose.tools.ok_(numpy.array_equal(dwell_times[distinct_inds],
+                                     trajectory_store.dwell_times[segment_inds]))
+    statistics = target_data.get_loader_statistics()
+    nose.tools.eq_(statistics['segments'], 25)
+    nose.tools.eq_(statistics['distinct dwells'], 4)
+    nose.tools.eq_(statistics['deduplication ratio'], 6.25)
+    selected_data = target_data.make_copy_from_selection([1, 2])
+    nose.tools.eq_(selected_data.frame_period, 0.1)
+    nose.tools.eq_(selected_data.get_loader_statistics()['segments'], 10)
@@ -0,0 +1,189 @@
+"""
+An on-disk cache of the states and routes of blink models, so that
+new processes can skip state enumeration and route mapping.
+
+Each topology is a directory of ``.npy`` arrays, which are
+memory-mapped when they are loaded, and a JSON description::
+
+    <cache_dir>/v1/<factory>_N<N>_A<MAX_A>_C<classes>/
+        topology.json           version, key, species, class names,
+                                rate ids, initial and final state
+        populations.npy         int64[num_states, num_species]
+        class_codes.npy         int8[num_states]
+        route_start_inds.npy    int64[num_routes]
+        route_end_inds.npy      int64[num_routes]
+        route_rate_codes.npy    int64[num_routes]
+        route_multiplicities.npy float64[num_routes]
+
+Directories are written under a temporary name and renamed when they
+are complete, so processes that share a cache never read a partial
+topology.
+"""
+import json
+import os
+import os.path
+import shutil
+import tempfile
+import numpy
+from .route_collection import CompiledRouteCollection,\
+                              make_route_collection_from_compiled_routes
+from .state_collection import make_state_collection_from_arrays
+from .state_space import PopulationSpace, POPULATION_TYPE
+
+CACHE_VERSION = 1
+ARRAY_NAMES = ['populations', 'class_codes', 'route_start_inds',
+               'route_end_inds', 'route_rate_codes', 'route_multiplicities']
+
+
+class TopologyCache(object):
+    """
+    Parameters
+    ----------
+    cache_dir : string
+        Created if it does not exist.
+    """
+    def __init__(self, cache_dir):
+        super(TopologyCache, self).__init__()
+        self.cache_dir = cache_dir
+        self.version_dir = os.path.join(cache_dir, 'v%d' % CACHE_VERSION)
+        if not os.path.exists(self.version_dir):
+            try:
+                os.makedirs(self.version_dir)
+            except OSError:
+                # another process may have created it first
+                if not os.path.isdir(self.version_dir):
+                    raise
+
+    def get_topology_dir(self, key):
+        """
+        Parameters
+        ----------
+        key : tuple
+            The factory class name, N, MAX_A and the number of
+            observable bright classes.
+        """
+        factory_name, N, MAX_A, observable_bright_classes = key
+        dir_name = "%s_N%d_A%d_C%d" % (factory_name, N, MAX_A,
+                                       observable_bright_classes)
+        return os.path.join(self.version_dir, dir_name)
+
+    def has_topology(self, key):
+        return os.path.exists(os.path.join(self.get_topology_dir(key),
+                                           'topology.json'))
+
+    def save_topology(self, key, model):
+        """
+        Write the states and routes of `model`, unless the cache
+        already has a topology for `key`.
+
+        Parameters
+        ----------
+        key : tuple
+        model : BlinkModel
+            A model whose states were made by a blink state enumerator.
+        """
+        topology_dir = self.get_topology_dir(key)
+        if os.path.exists(topology_dir):
+            return
+        state_collection = model.state_collection
+        state_space = state_collection.state_space
+        assert state_space is not None,\
+               "Only models with a population space can be cached"
+        class_array = numpy.array(
+                        state_collection.data_frame['observation_class'])
+        class_names, class_codes = numpy.unique(class_array,
+                                                return_inverse=True)
+        state_id_list = state_collection.data_frame.index.tolist()
+        # the rate matrix positions of the model are the positions of
+        # the states in its state collection
+        compiled_routes = model.compiled_routes
+        description = {'version':CACHE_VERSION,
+                       'key':list(key),
+                       'species_names':state_space.species_names,
+                       'class_names':class_names.tolist(),
+                       'rate_id_list':compiled_routes.rate_id_list,
+                       'initial_state':state_id_list.index(
+                                        model.initial_state_id),
+                       'final_state':state_id_list.index(
+                                        model.final_state_id)}
+        array_dict = {
+            'populations':numpy.asarray(state_collection.population_array,
+                                        dtype=POPULATION_TYPE),
+            'class_codes':class_codes.astype(numpy.int8),
+            'route_start_inds':numpy.asarray(compiled_routes.start_inds,
+                                             dtype=numpy.int64),
+            'route_end_inds':numpy.asarray(compiled_routes.end_inds,
+                                           dtype=numpy.int64),
+            'route_rate_codes':numpy.asarray(compiled_routes.rate_codes,
+                                             dtype=numpy.int64),
+            'route_multiplicities':numpy.asarray(
+                                    compiled_routes.multiplicities,
+                                    dtype=numpy.float64)}
+        temp_dir = tempfile.mkdtemp(dir=self.version_dir)
+        try:
+            for array_name in ARRAY_NAMES:
+                numpy.save(os.path.join(temp_dir, array_name + '.npy'),
+                           array_dict[array_name])
+            f = open(os.path.join(temp_dir, 'topology.json'), 'w')
+            try:
+                json.dump(description, f)
+            finally:
+                f.close()
+            os.rename(temp_dir, topology_dir)
+        except OSError:
+            # another process saved the same topology first
+            if not os.path.exists(topology_dir):
+                raise
+        finally:
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir)
+
+    def load_topology(self, key):
+        """
+        Returns
+        -------
+        topology : tuple or None
+            The state collection, the initial and final state ids and
+            the route collection of `key`, or None if the cache does
+            not have it. The arrays are memory-mapped.
+        """
+        if not self.has_topology(key):
+            return None
+        topology_dir = self.get_topology_dir(key)
+        f = open(os.path.join(topology_dir, 'topology.json'), 'r')
+        try:
+            description = json.load(f)
+        finally:
+            f.close()
+        if description['version'] != CACHE_VERSION:
+            return None
+        array_dict = {}
+        for array_name in ARRAY_NAMES:
+            array_dict[array_name] = numpy.load(
+                os.path.join(topology_dir, array_name + '.npy'),
+                mmap_mode='r')
+        factory_name, N, MAX_A, observable_bright_classes = key
+        species_names = [str(name) for name in description['species_names']]
+        state_space = PopulationSpace(species_names, N, {'A':MAX_A})
+        population_array = array_dict['populations']
+        state_id_list = state_space.make_labels(population_array)
+        class_names = [str(name) for name in description['class_names']]
+        class_list = [class_names[code]
+                      for code in array_dict['class_codes'].tolist()]
+        state_collection = make_state_collection_from_arrays(
+                            state_id_list, population_array, species_names,
+                            class_list)
+        state_collection.state_space = state_space
+        compiled_routes = CompiledRouteCollection()
+        compiled_routes.start_inds = array_dict['route_start_inds']
+        compiled_routes.end_inds = array_dict['route_end_inds']
+        compiled_routes.rate_id_list = [str(rate_id) for rate_id
+                                        in description['rate_id_list']]
+        compiled_routes.rate_codes = array_dict['route_rate_codes']
+        compiled_routes.multiplicities = array_dict['route_multiplicities']
+        route_collection = make_route_collection_from_compiled_routes(
+                            state_id_list, compiled_routes)
+        initial_state_id = state_id_list[description['initial_state']]
+        final_state_id = state_id_list[description['final_state']]
+        return state_collection, initial_state_id, final_state_id,\
+               route_collection
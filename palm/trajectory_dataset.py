@@ -0,0 +1,128 @@
+"""
+A binary file format for collections of trajectories. The file holds
+the arrays of a `TrajectoryStore`, so it can be memory-mapped and used
+without parsing any segment data.
+
+Layout (little-endian, arrays aligned to 8 bytes)::
+
+    magic bytes       8 bytes, ``PALMTRJ1``
+    num_trajectories  uint64
+    num_segments      uint64
+    metadata_size     uint64
+    metadata          JSON with the class names and the source paths,
+                      padded with spaces to a multiple of 8 bytes
+    offsets           int64[num_trajectories + 1]
+    dwell_times       float64[num_segments]
+    class_codes       int8[num_segments]
+"""
+import json
+import struct
+import numpy
+from .trajectory_store import TrajectoryStore
+from .discrete_state_trajectory import CLASS_CODE_TYPE
+
+MAGIC_BYTES = 'PALMTRJ1'
+HEADER_FORMAT = '<8sQQQ'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FORMAT_VERSION = 1
+
+
+def is_trajectory_dataset(path):
+    """
+    Returns
+    -------
+    is_dataset : bool
+        True if the file at `path` starts with the magic bytes
+        of a trajectory dataset.
+    """
+    f = open(path, 'rb')
+    try:
+        return (f.read(len(MAGIC_BYTES)) == MAGIC_BYTES)
+    finally:
+        f.close()
+
+def write_trajectory_dataset(path, trajectory_store, paths=None):
+    """
+    Parameters
+    ----------
+    path : string
+        The dataset is written to this file.
+    trajectory_store : TrajectoryStore
+    paths : list, optional
+        The file that each trajectory was loaded from.
+    """
+    if paths is not None:
+        assert len(paths) == len(trajectory_store)
+    if trajectory_store.is_view():
+        trajectory_store = trajectory_store.compact()
+    metadata = {'version': FORMAT_VERSION,
+                'class_names': list(trajectory_store.class_name_list),
+                'paths': paths}
+    metadata_str = json.dumps(metadata)
+    metadata_str += ' ' * (-len(metadata_str) % 8)
+    header = struct.pack(HEADER_FORMAT, MAGIC_BYTES, len(trajectory_store),
+                         trajectory_store.get_num_segments(),
+                         len(metadata_str))
+    f = open(path, 'wb')
+    try:
+        f.write(header)
+        f.write(metadata_str)
+        f.write(numpy.asarray(trajectory_store.offsets,
+                              dtype='<i8').tostring())
+        f.write(numpy.asarray(trajectory_store.dwell_times,
+                              dtype='<f8').tostring())
+        f.write(numpy.asarray(trajectory_store.class_codes,
+                              dtype=CLASS_CODE_TYPE).tostring())
+    finally:
+        f.close()
+
+def open_trajectory_dataset(path):
+    """
+    Memory-maps a trajectory dataset. Segment data is only read from
+    disk when it is used.
+
+    Parameters
+    ----------
+    path : string
+
+    Returns
+    -------
+    trajectory_store : TrajectoryStore
+        A store whose arrays are read-only memory maps of the file.
+    paths : list or None
+        The file that each trajectory was loaded from, if known.
+    """
+    f = open(path, 'rb')
+    try:
+        magic_bytes, num_trajectories, num_segments, metadata_size =\
+            struct.unpack(HEADER_FORMAT, f.read(HEADER_SIZE))
+        if magic_bytes != MAGIC_BYTES:
+            raise IOError("%s is not a trajectory dataset" % path)
+        metadata = json.loads(f.read(metadata_size))
+    finally:
+        f.close()
+    if metadata['version'] != FORMAT_VERSION:
+        raise IOError("%s has unsupported format version %d" %\
+                      (path, metadata['version']))
+    offsets_start = HEADER_SIZE + metadata_size
+    dwell_times_start = offsets_start + 8 * (num_trajectories + 1)
+    class_codes_start = dwell_times_start + 8 * num_segments
+    offsets = _map_array(path, '<i8', num_trajectories + 1, offsets_start)
+    dwell_times = _map_array(path, '<f8', num_segments, dwell_times_start)
+    class_codes = _map_array(path, CLASS_CODE_TYPE, num_segments,
+                             class_codes_start)
+    class_name_list = [str(class_name) for class_name
+                       in metadata['class_names']]
+    trajectory_store = TrajectoryStore(class_codes, dwell_times, offsets,
+                                       class_name_list)
+    paths = metadata['paths']
+    if paths is not None:
+        paths = [str(p) for p in paths]
+    return trajectory_store, paths
+
+def _map_array(path, dtype, length, offset):
+    if length == 0:
+        # numpy cannot map an empty region of a file
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.memmap(path, dtype=dtype, mode='r', offset=offset,
+                        shape=(length,))
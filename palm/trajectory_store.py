@@ -0,0 +1,318 @@
+import numpy
+from .discrete_state_trajectory import DiscreteStateTrajectory,\
+                                       quantize_dwell_times,\
+                                       CLASS_CODE_TYPE, DWELL_TIME_TYPE
+
+OFFSET_TYPE = numpy.int64
+
+
+def make_trajectory_store(trajectory_list):
+    """
+    Copies the segments of a list of trajectories into one store.
+
+    Parameters
+    ----------
+    trajectory_list : list of DiscreteStateTrajectory
+
+    Returns
+    -------
+    trajectory_store : TrajectoryStore
+    """
+    class_name_list = []
+    class_code_list = []
+    for trajectory in trajectory_list:
+        # translate the codes of each trajectory to the codes of the store
+        code_map = numpy.zeros(len(trajectory.get_class_name_list()),
+                               dtype=CLASS_CODE_TYPE)
+        for i, class_name in enumerate(trajectory.get_class_name_list()):
+            if class_name not in class_name_list:
+                class_name_list.append(class_name)
+            code_map[i] = class_name_list.index(class_name)
+        class_code_list.append(code_map[trajectory.get_class_code_array()])
+    num_segments_list = [len(trajectory) for trajectory in trajectory_list]
+    offsets = numpy.zeros(len(trajectory_list) + 1, dtype=OFFSET_TYPE)
+    offsets[1:] = numpy.cumsum(num_segments_list)
+    if len(trajectory_list) > 0:
+        class_codes = numpy.concatenate(class_code_list)
+        dwell_times = numpy.concatenate(
+                        [trajectory.get_dwell_time_array()
+                         for trajectory in trajectory_list])
+    else:
+        class_codes = numpy.zeros(0, dtype=CLASS_CODE_TYPE)
+        dwell_times = numpy.zeros(0, dtype=DWELL_TIME_TYPE)
+    return TrajectoryStore(class_codes.astype(CLASS_CODE_TYPE),
+                           dwell_times.astype(DWELL_TIME_TYPE),
+                           offsets, class_name_list)
+
+
+class TrajectoryStore(object):
+    """
+    Columnar storage for a collection of discrete state trajectories.
+    The segments of all trajectories are concatenated, so the whole
+    collection is held in three arrays, no matter how many
+    trajectories or segments it has.
+
+    A store may also be an index view of another store: it shares the
+    segment arrays and offsets of its parent and only holds the indices
+    of the parent trajectories that it contains, which may repeat.
+
+    Parameters
+    ----------
+    class_codes : ndarray
+        Index into `class_name_list` of the class of each segment.
+    dwell_times : ndarray
+        The duration of each segment.
+    offsets : ndarray
+        Trajectory `i` of the segment arrays consists of the segments
+        from ``offsets[i]`` up to ``offsets[i+1]``.
+    class_name_list : list
+        The class names that the codes refer to.
+    trajectory_inds : ndarray, optional
+        The trajectories of the segment arrays that belong to this
+        store, in order. By default, all of them.
+
+    Attributes
+    ----------
+    start_inds, stop_inds : ndarray
+        Trajectory `i` of this store consists of the segments from
+        ``start_inds[i]`` up to ``stop_inds[i]`` of the segment arrays.
+    is_modified : bool
+        Whether a segment was added to one of the trajectory views of
+        this store, which then no longer matches its trajectories.
+    """
+    def __init__(self, class_codes, dwell_times, offsets, class_name_list,
+                 trajectory_inds=None):
+        super(TrajectoryStore, self).__init__()
+        assert len(class_codes) == len(dwell_times)
+        assert offsets[0] == 0 and offsets[-1] == len(dwell_times)
+        self.class_codes = class_codes
+        self.dwell_times = dwell_times
+        self.offsets = offsets
+        self.class_name_list = class_name_list
+        self.trajectory_inds = trajectory_inds
+        if trajectory_inds is None:
+            self.start_inds = numpy.asarray(offsets[:-1])
+            self.stop_inds = numpy.asarray(offsets[1:])
+        else:
+            self.start_inds = offsets[:-1][trajectory_inds]
+            self.stop_inds = offsets[1:][trajectory_inds]
+        self.is_modified = False
+
+    def __len__(self):
+        return len(self.start_inds)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.get_trajectory(i)
+
+    def is_view(self):
+        return (self.trajectory_inds is not None)
+
+    def get_num_segments(self):
+        return int(numpy.sum(self.get_num_segments_array()))
+
+    def get_num_segments_array(self):
+        return self.stop_inds - self.start_inds
+
+    def get_trajectory(self, index):
+        """
+        Returns
+        -------
+        trajectory : DiscreteStateTrajectory
+            A view of the segments of trajectory `index`. No segment
+            data is copied.
+        """
+        start = self.start_inds[index]
+        stop = self.stop_inds[index]
+        trajectory = DiscreteStateTrajectory(self.class_codes[start:stop],
+                                             self.dwell_times[start:stop],
+                                             self.class_name_list)
+        trajectory.trajectory_store = self
+        return trajectory
+
+    def mark_modified(self):
+        self.is_modified = True
+
+    def select(self, inds):
+        """
+        Parameters
+        ----------
+        inds : list
+            Indices of the trajectories to select. Indices may repeat.
+
+        Returns
+        -------
+        trajectory_store : TrajectoryStore
+            An index view of this store with the selected trajectories,
+            in order. No segment data is copied.
+        """
+        inds = numpy.asarray(inds, dtype=OFFSET_TYPE)
+        if self.is_view():
+            trajectory_inds = self.trajectory_inds[inds]
+        else:
+            trajectory_inds = inds
+        return TrajectoryStore(self.class_codes, self.dwell_times,
+                               self.offsets, self.class_name_list,
+                               trajectory_inds)
+
+    def compact(self):
+        """
+        Returns
+        -------
+        trajectory_store : TrajectoryStore
+            A store with a copy of the segments of this store, in which
+            the trajectories are stored one after another.
+        """
+        segment_inds = self.get_segment_inds()
+        offsets = numpy.zeros(len(self) + 1, dtype=OFFSET_TYPE)
+        offsets[1:] = numpy.cumsum(self.get_num_segments_array())
+        return TrajectoryStore(numpy.array(self.class_codes[segment_inds]),
+                               numpy.array(self.dwell_times[segment_inds]),
+                               offsets, list(self.class_name_list))
+
+    def quantize(self, frame_period):
+        """
+        Returns
+        -------
+        trajectory_store : TrajectoryStore
+            A store like this one, but with a copy of the dwell times
+            snapped to whole numbers of frames.
+        """
+        return TrajectoryStore(self.class_codes,
+                               quantize_dwell_times(self.dwell_times,
+                                                    frame_period),
+                               self.offsets, self.class_name_list,
+                               self.trajectory_inds)
+
+    def get_segment_inds(self):
+        """
+        Returns
+        -------
+        segment_inds : ndarray
+            Position in the segment arrays of each segment of each
+            trajectory of this store, in order.
+        """
+        num_segments_array = self.get_num_segments_array()
+        if not self.is_view():
+            return numpy.arange(self.offsets[-1], dtype=OFFSET_TYPE)
+        elif len(self) == 0:
+            return numpy.zeros(0, dtype=OFFSET_TYPE)
+        stop_positions = numpy.cumsum(num_segments_array)
+        return numpy.arange(stop_positions[-1], dtype=OFFSET_TYPE) +\
+               numpy.repeat(self.start_inds - stop_positions +\
+                            num_segments_array, num_segments_array)
+
+    def get_first_and_last_segment_inds(self):
+        """
+        Returns
+        -------
+        first_inds, last_inds : ndarray
+            Position in the segment arrays of the first and the
+            last segment of each trajectory.
+        """
+        return self.start_inds, self.stop_inds - 1
+
+    def get_class_code(self, class_name):
+        """
+        Returns
+        -------
+        class_code : int or None
+            None if no segment of the store has class `class_name`.
+        """
+        if class_name in self.class_name_list:
+            return self.class_name_list.index(class_name)
+        else:
+            return None
+
+    def get_class_dwell_times(self, class_name, exclude_first_dwell=False,
+                              exclude_last_dwell=False):
+        """
+        Returns
+        -------
+        dwell_times : ndarray
+            Durations of the segments of `class_name`, in order.
+        """
+        segment_inds, class_mask = self._get_class_mask(
+                                    class_name, exclude_first_dwell,
+                                    exclude_last_dwell)
+        return self.dwell_times[segment_inds[class_mask]]
+
+    def count_class_segments(self, class_name, exclude_first_dwell=False,
+                             exclude_last_dwell=False):
+        """
+        Returns
+        -------
+        counts : ndarray
+            The number of segments of `class_name` in each trajectory.
+        """
+        segment_inds, class_mask = self._get_class_mask(
+                                    class_name, exclude_first_dwell,
+                                    exclude_last_dwell)
+        trajectory_numbers = numpy.repeat(numpy.arange(len(self)),
+                                          self.get_num_segments_array())
+        return numpy.bincount(trajectory_numbers[class_mask],
+                              minlength=len(self))
+
+    def compute_end_times(self):
+        """
+        Returns
+        -------
+        end_times : ndarray
+            The total duration of each trajectory.
+        """
+        num_segments_array = self.get_num_segments_array()
+        end_times = numpy.zeros(len(self), dtype=DWELL_TIME_TYPE)
+        nonempty = (num_segments_array > 0)
+        start_positions = numpy.cumsum(num_segments_array) -\
+                          num_segments_array
+        dwell_times = self.dwell_times[self.get_segment_inds()]
+        end_times[nonempty] = numpy.add.reduceat(dwell_times,
+                                                 start_positions[nonempty])
+        return end_times
+
+    def find_distinct_dwells(self):
+        """
+        Find the distinct (class, dwell time) pairs of the segments of
+        this store. With quantized dwell times, there are usually far
+        fewer distinct pairs than segments, so anything that depends
+        only on the class and the duration of a segment, like its
+        transition matrix, can be computed once per distinct pair.
+
+        Returns
+        -------
+        distinct_class_codes : ndarray
+        distinct_dwell_times : ndarray
+            The distinct pairs, sorted by class code, then dwell time.
+        distinct_inds : ndarray
+            For each segment, in the order of `get_segment_inds`,
+            the index of its distinct pair.
+        """
+        segment_inds = self.get_segment_inds()
+        class_codes = self.class_codes[segment_inds]
+        dwell_times = self.dwell_times[segment_inds]
+        order = numpy.lexsort((dwell_times, class_codes))
+        is_new = numpy.ones(len(order), dtype=bool)
+        is_new[1:] = (numpy.diff(class_codes[order]) != 0) |\
+                     (numpy.diff(dwell_times[order]) != 0)
+        distinct_inds = numpy.zeros(len(order), dtype=OFFSET_TYPE)
+        distinct_inds[order] = numpy.cumsum(is_new) - 1
+        return (numpy.array(class_codes[order][is_new]),
+                numpy.array(dwell_times[order][is_new]), distinct_inds)
+
+    def _get_class_mask(self, class_name, exclude_first_dwell,
+                        exclude_last_dwell):
+        # the mask has one element per element of `segment_inds`
+        segment_inds = self.get_segment_inds()
+        class_code = self.get_class_code(class_name)
+        if class_code is None:
+            return segment_inds, numpy.zeros(len(segment_inds), dtype=bool)
+        class_mask = (self.class_codes[segment_inds] == class_code)
+        num_segments_array = self.get_num_segments_array()
+        stop_positions = numpy.cumsum(num_segments_array)
+        nonempty = (num_segments_array > 0)
+        if exclude_first_dwell:
+            first_positions = stop_positions - num_segments_array
+            class_mask[first_positions[nonempty]] = False
+        if exclude_last_dwell:
+            class_mask[stop_positions[nonempty] - 1] = False
+        return segment_inds, class_mask
@@ -0,0 +1,181 @@
+import numpy
+import scipy.sparse
+from .linalg import compute_array_exp_batch
+
+
+def group_distinct_dwells(distinct_class_names, distinct_dwell_times):
+    """
+    Parameters
+    ----------
+    distinct_class_names : list
+    distinct_dwell_times : ndarray
+        The distinct (class, dwell time) pairs of a collection, see
+        `BlinkCollectionTargetData.get_distinct_dwells`.
+
+    Returns
+    -------
+    dwell_time_dict : dict
+        The sorted distinct dwell times of each class.
+    """
+    class_name_array = numpy.array(distinct_class_names, dtype=object)
+    dwell_time_dict = {}
+    for class_name in set(distinct_class_names):
+        dwell_time_dict[class_name] = numpy.unique(
+            distinct_dwell_times[class_name_array == class_name])
+    return dwell_time_dict
+
+
+class TransferMatrixTable(object):
+    """
+    The transfer matrices ``exp(Q_aa t) Q_ab`` of one model, for the
+    dwell times of a collection of trajectories. With a fixed rate
+    matrix, the contribution of a segment only depends on its class,
+    its dwell time and the class of the next segment, so the forward
+    recursion can look up each transfer matrix and only compute a
+    vector-matrix product per segment. The exponentials of each class
+    are computed in one batch, for all the distinct dwell times of that
+    class, and are multiplied with the rates to every other class of
+    the model. Last segments, which have no end class, get
+    ``exp(Q_aa t)`` itself.
+
+    Parameters
+    ----------
+    fingerprint : tuple
+        The fingerprint of the model, see
+        `AggregatedKineticModel.get_fingerprint`. The table is only
+        valid for models with the same fingerprint.
+    trajectory_store : TrajectoryStore, optional
+        The store of the collection that the table was built for. The
+        table covers every segment of the store for as long as the
+        collection keeps it.
+
+    Attributes
+    ----------
+    transfer_dict : dict
+        For each (start class, end class) pair, an array with one
+        transfer matrix per dwell time of the start class.
+    dwell_time_dict : dict
+        The sorted dwell times of each start class.
+    dwell_index_dict : dict
+        For each start class, the position of each dwell time
+        within its transfer arrays.
+    """
+    def __init__(self, fingerprint, trajectory_store=None):
+        super(TransferMatrixTable, self).__init__()
+        self.fingerprint = fingerprint
+        self.trajectory_store = trajectory_store
+        self.transfer_dict = {}
+        self.dwell_time_dict = {}
+        self.dwell_index_dict = {}
+
+    def __len__(self):
+        return sum([len(transfer_array) for transfer_array
+                    in self.transfer_dict.itervalues()])
+
+    def add_class(self, start_class, dwell_times, end_class_list,
+                  expm_calculator, rate_matrix_organizer):
+        """
+        Computes the transfer matrices of the segments of one class.
+
+        Parameters
+        ----------
+        start_class : string
+        dwell_times : ndarray
+            The sorted distinct dwell times of the class.
+        end_class_list : list
+            The classes that a segment of `start_class` may be
+            followed by.
+        expm_calculator : MatrixExponential
+        rate_matrix_organizer : RateMatrixOrganizer
+            Holds the rate matrix of the model.
+        """
+        if len(dwell_times) == 0:
+            return
+        # one batch of exponentials for every dwell time of the class
+        rate_array_aa = rate_matrix_organizer.get_subarray(start_class,
+                                                           start_class)
+        expQt_array = compute_array_exp_batch(expm_calculator, rate_array_aa,
+                                              dwell_times)
+        self.transfer_dict[(start_class, None)] = expQt_array
+        for end_class in end_class_list:
+            if end_class == start_class:
+                continue
+            rate_array_ab = rate_matrix_organizer.get_subarray(start_class,
+                                                               end_class)
+            if rate_array_ab.shape[1] == 0:
+                continue
+            if scipy.sparse.issparse(rate_array_ab):
+                rate_array_ab = rate_array_ab.toarray()
+            self.transfer_dict[(start_class, end_class)] = numpy.dot(
+                                                            expQt_array,
+                                                            rate_array_ab)
+        self.dwell_time_dict[start_class] = dwell_times
+        self.dwell_index_dict[start_class] = dict(
+            zip(dwell_times.tolist(), range(len(dwell_times))))
+
+    def covers(self, dwell_time_dict):
+        """
+        Parameters
+        ----------
+        dwell_time_dict : dict
+            The distinct dwell times of each class, see
+            `group_distinct_dwells`.
+
+        Returns
+        -------
+        covers : bool
+            Whether the table has transfer matrices for every
+            class and dwell time of `dwell_time_dict`.
+        """
+        for class_name, dwell_times in dwell_time_dict.iteritems():
+            table_dwell_times = self.dwell_time_dict.get(class_name, None)
+            if table_dwell_times is None:
+                return False
+            if not numpy.all(numpy.in1d(dwell_times, table_dwell_times)):
+                return False
+        return True
+
+    def get_transfer_array(self, start_class, end_class, dwell_time):
+        """
+        Returns
+        -------
+        transfer_array : ndarray or None
+            ``exp(Q_aa t) Q_ab``, or None if the table does not
+            have this class pair and dwell time.
+        """
+        dwell_index_dict = self.dwell_index_dict.get(start_class, None)
+        if dwell_index_dict is None:
+            return None
+        dwell_index = dwell_index_dict.get(dwell_time, None)
+        if dwell_index is None:
+            return None
+        transfer_array = self.transfer_dict.get((start_class, end_class),
+                                                None)
+        if transfer_array is None:
+            return None
+        return transfer_array[dwell_index]
+
+    def get_num_bytes(self):
+        return sum([transfer_array.nbytes for transfer_array
+                    in self.transfer_dict.itervalues()])
+
+
+def estimate_table_bytes(model, dwell_time_dict):
+    """
+    Returns
+    -------
+    num_bytes : int
+        Memory needed by the transfer arrays of a table for
+        `dwell_time_dict`, and by the largest batch of exponentials.
+    """
+    num_states = model.get_num_states()
+    num_bytes = 0
+    batch_bytes = [0]
+    for class_name, dwell_times in dwell_time_dict.iteritems():
+        num_class_states = model.get_num_states(class_name)
+        # the exponentials themselves, and their products with
+        # the rates to every other class
+        num_bytes += 8 * len(dwell_times) * num_class_states * num_states
+        # eigen-decomposition batches are complex before they are made real
+        batch_bytes.append(16 * len(dwell_times) * num_class_states**2)
+    return num_bytes + max(batch_bytes)
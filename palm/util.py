@@ -44,6 +44,50 @@ def randomize_parameter(parameter_set, parameter_name, lower_bound,
     parameter_set.set_parameter(parameter_name, new_value)
     return parameter_set
 
+def warm_start_parameters(parameter_set, warm_start):
+    """
+    Copy the values of the free parameters of `parameter_set`, those
+    whose lower and upper bounds differ, from a previous fit. Fixed
+    parameters, such as `N`, keep their values. Copied values are
+    clipped to the bounds of `parameter_set`.
+
+    Parameters
+    ----------
+    parameter_set : ParameterSet
+        Modified in place.
+    warm_start : ParameterSet, ParameterSetDistribution or Series
+        If a distribution is given, its best scoring parameter set is
+        used, among those with the value of `N` closest to the value
+        of `parameter_set`, if the parameters include `N`.
+
+    Returns
+    -------
+    parameter_set : ParameterSet
+    """
+    parameter_names = parameter_set.get_parameter_names()
+    if hasattr(warm_start, 'get_nearest_best_params_as_series'):
+        if 'N' in parameter_names:
+            warm_start = warm_start.get_nearest_best_params_as_series(
+                            'N', parameter_set.get_parameter('N'))
+        else:
+            warm_start = warm_start.get_best_params_as_series()
+    bounds = parameter_set.get_parameter_bounds()
+    for parameter_name, (lower_bound, upper_bound) in zip(parameter_names,
+                                                          bounds):
+        is_fixed = (lower_bound is not None) and (lower_bound == upper_bound)
+        if is_fixed:
+            continue
+        if hasattr(warm_start, 'get_parameter'):
+            new_value = warm_start.get_parameter(parameter_name)
+        else:
+            new_value = float(warm_start[parameter_name])
+        if lower_bound is not None:
+            new_value = max(new_value, lower_bound)
+        if upper_bound is not None:
+            new_value = min(new_value, upper_bound)
+        parameter_set.set_parameter(parameter_name, new_value)
+    return parameter_set
+
 class Timer:    
     def __enter__(self):
         self.start = time.time()
@@ -0,0 +1,24 @@
+import sys
+from palm.blink_target_data import BlinkCollectionTargetData
+
+def main():
+    '''Converts a list of trajectory csv files into a single
+       trajectory dataset file, which palm can memory-map.
+
+       usage: python convert_trajectories.py traj_paths.txt output.dat
+    '''
+    if len(sys.argv) != 3:
+        print main.__doc__
+        sys.exit(1)
+    path_list_file = sys.argv[1]
+    dataset_file = sys.argv[2]
+    target_data = BlinkCollectionTargetData()
+    target_data.load_data(path_list_file)
+    target_data.write_dataset(dataset_file)
+    print "Wrote %d trajectories (%d segments) to %s" % (
+            len(target_data),
+            target_data.get_total_number_of_trajectory_segments(),
+            dataset_file)
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,13 @@ import os.path
 from palm.blink_factory import SingleDarkBlinkFactory
 from palm.blink_parameter_set import SingleDarkParameterSet
 from palm.likelihood_judge import LikelihoodJudge
-from palm.backward_likelihood import BackwardPredictor
+from palm.forward_likelihood import ForwardPredictor
 from palm.blink_target_data import BlinkTargetData
 from palm.score_function import ScoreFunction
 from palm.util import Timer
-from palm.linalg import QitMatrixExponential
+from palm.linalg import ScipyMatrixExponential
 
-def bwd_lh(N):
+def fwd_lh(N):
     model_factory = SingleDarkBlinkFactory(MAX_A=10)
     model_parameters = SingleDarkParameterSet()
     model_parameters.set_parameter('N', N)
@@ -17,8 +17,8 @@ def bwd_lh(N):
     model_parameters.set_parameter('log_kd', -0.5)
     model_parameters.set_parameter('log_kr', -0.5)
     model_parameters.set_parameter('log_kb', -0.5)
-    data_predictor = BackwardPredictor(QitMatrixExponential(),
-                                       always_rebuild_rate_matrix=False)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
     target_data = BlinkTargetData()
     data_path = os.path.join('./', 'trajectory0001.csv')
     data_path = os.path.expanduser(data_path)
@@ -34,7 +34,7 @@ def bwd_lh(N):
     return Q_size, num_segments
 
 def main():
-    lh_fcn = bwd_lh
+    lh_fcn = fwd_lh
     # for N in [1, 2, 3, 4, 5, 10, 15, 20, 25, 30, 35]:
     for N in [5,]:
         with Timer() as t:
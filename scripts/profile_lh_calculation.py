@@ -2,11 +2,11 @@ import cProfile
 import pstats
 import os.path
 from palm.linalg import ScipyMatrixExponential, ScipyMatrixExponential2,\
-                        QitMatrixExponential, StubExponential
+                        EigenMatrixExponential
 from palm.blink_factory import SingleDarkBlinkFactory
 from palm.blink_parameter_set import SingleDarkParameterSet
 from palm.likelihood_judge import LikelihoodJudge
-from palm.backward_likelihood import BackwardPredictor
+from palm.forward_likelihood import ForwardPredictor
 from palm.blink_target_data import BlinkTargetData
 from palm.scipy_optimizer import ScipyOptimizer
 from palm.score_function import ScoreFunction
@@ -30,12 +30,12 @@ def main():
     # ================================================================
     # = Alternative matrix exponential objects can be specified here =
     # ================================================================
-    data_predictor = BackwardPredictor(QitMatrixExponential(),
-                                       always_rebuild_rate_matrix=False)
-    # data_predictor = BackwardPredictor(QitMatrixExponential(),
-    #                                    always_rebuild_rate_matrix=True)
-    # data_predictor = BackwardPredictor(StubExponential(),
-    #                                    always_rebuild_rate_matrix=False)
+    data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+                                      always_rebuild_rate_matrix=False)
+    # data_predictor = ForwardPredictor(ScipyMatrixExponential(),
+    #                                   always_rebuild_rate_matrix=True)
+    # data_predictor = ForwardPredictor(EigenMatrixExponential(),
+    #                                   always_rebuild_rate_matrix=False)
 
     target_data = BlinkTargetData()
     data_path = os.path.join('./', 'trajectory0001.csv')
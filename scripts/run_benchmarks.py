@@ -0,0 +1,25 @@
+import sys
+from palm.benchmark import BenchmarkSuite, write_results, load_results,\
+                           compare_results
+
+def main():
+    '''Runs the benchmark suite and writes the results as json. If the
+       results of an earlier run are given, the two are compared.
+
+       usage: python run_benchmarks.py results.json [old_results.json]
+    '''
+    if len(sys.argv) not in [2, 3]:
+        print main.__doc__
+        sys.exit(1)
+    results_file = sys.argv[1]
+    benchmark_suite = BenchmarkSuite(noisy=True)
+    result_list = benchmark_suite.run()
+    write_results(result_list, results_file)
+    print "Wrote %d results to %s" % (len(result_list), results_file)
+    if len(sys.argv) == 3:
+        comparison = compare_results(load_results(sys.argv[2]),
+                                     load_results(results_file))
+        print comparison.to_string()
+
+if __name__ == '__main__':
+    main()